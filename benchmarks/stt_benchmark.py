@@ -0,0 +1,210 @@
+"""
+Бенчмарк распознавания голосовых сообщений (services/speech_to_text.py).
+
+Прогоняет корпус локальных OGG файлов через тот же путь, что и transcribe_voice
+(ffmpeg -> WAV 16 кГц -> faster-whisper), для каждой комбинации размера модели,
+типа вычислений и числа потоков в трех режимах:
+    serial  - одна модель, файлы по очереди (как сейчас работает бот)
+    pooled  - пул процессов, у каждого своя модель
+    batched - BatchedInferencePipeline, батчирование сегментов внутри файла
+
+Каждая комбинация запускается в отдельном процессе, чтобы пиковый RSS не накапливался между прогонами.
+
+Корпус - реальные голосовые сообщения в benchmarks/stt_corpus/*.ogg. Папка не хранится в git:
+записи пользователей не должны попадать в репозиторий.
+
+Запуск из корня репозитория:
+    python -m benchmarks.stt_benchmark --models base,small --compute-types int8,float32 --threads 1,4 -v
+"""
+import argparse
+import json
+import os
+import resource
+import statistics
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Dict, List
+
+MODES = ("serial", "pooled", "batched")
+
+_worker_model = None
+
+
+def _peak_rss_mb() -> float:
+    """
+    Пиковый RSS текущего процесса в МБ (ru_maxrss в Linux - в килобайтах).
+    RUSAGE_CHILDREN не подходит: это пик самого большого из потомков, а не их сумма
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _transcribe_one(whisper_model, file_path: str, tmp_dir: str, batch_size: int = 0) -> Dict:
+    from services.speech_to_text import convert_to_wav, transcribe_file
+
+    started = time.perf_counter()
+    wav_path = convert_to_wav(file_path, tmp_dir)
+    try:
+        if batch_size:
+            segments, info = whisper_model.transcribe(wav_path, language="ru", batch_size=batch_size)
+            text = "".join(segment.text for segment in segments).strip()
+            duration = info.duration
+        else:
+            text, duration = transcribe_file(whisper_model, wav_path)
+    finally:
+        if os.path.exists(wav_path):
+            os.remove(wav_path)
+    latency = time.perf_counter() - started
+    return {
+        "file": os.path.basename(file_path),
+        "latency": latency,
+        "audio_seconds": duration,
+        "rtf": latency / duration if duration else None,
+        "chars": len(text),
+    }
+
+
+def _init_worker(size: str, compute_type: str, cpu_threads: int):
+    global _worker_model
+    from services.speech_to_text import load_model
+    _worker_model = load_model(size, compute_type, cpu_threads)
+
+
+def _pooled_transcribe(file_path: str, tmp_dir: str) -> Dict:
+    result = _transcribe_one(_worker_model, file_path, tmp_dir)
+    # Пик воркера растет монотонно: последнее значение для pid - его пик за прогон
+    result["worker"] = (os.getpid(), _peak_rss_mb())
+    return result
+
+
+def run_case(size: str, compute_type: str, cpu_threads: int, mode: str,
+             files: List[str], workers: int, batch_size: int, warmup: int) -> Dict:
+    """Один прогон корпуса; выполняется в отдельном процессе"""
+    from services.speech_to_text import load_model
+
+    tmp_dir = tempfile.mkdtemp(prefix="stt_bench_")
+    results = []
+
+    if mode == "pooled":
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(size, compute_type, cpu_threads),
+        ) as pool:
+            # Прогрев: модель загружается в каждом воркере до начала замера
+            warmup_results = list(pool.map(_pooled_transcribe, files[:1] * workers * warmup, [tmp_dir] * workers * warmup))
+            started = time.perf_counter()
+            results = list(pool.map(_pooled_transcribe, files, [tmp_dir] * len(files)))
+            wall = time.perf_counter() - started
+        # Модели всех воркеров резидентны одновременно, поэтому пики воркеров складываются
+        worker_peaks: Dict[int, float] = {}
+        for result in warmup_results + results:
+            pid, peak = result.pop("worker")
+            worker_peaks[pid] = max(worker_peaks.get(pid, 0.0), peak)
+        peak_rss = _peak_rss_mb() + sum(worker_peaks.values())
+    else:
+        whisper_model = load_model(size, compute_type, cpu_threads)
+        batch = 0
+        if mode == "batched":
+            from faster_whisper import BatchedInferencePipeline
+            whisper_model = BatchedInferencePipeline(model=whisper_model)
+            batch = batch_size
+        for file_path in files[:warmup]:
+            _transcribe_one(whisper_model, file_path, tmp_dir, batch)
+        started = time.perf_counter()
+        for file_path in files:
+            results.append(_transcribe_one(whisper_model, file_path, tmp_dir, batch))
+        wall = time.perf_counter() - started
+        peak_rss = _peak_rss_mb()
+
+    os.rmdir(tmp_dir)
+    latencies = sorted(r["latency"] for r in results)
+    rtfs = [r["rtf"] for r in results if r["rtf"] is not None]
+    audio_total = sum(r["audio_seconds"] for r in results)
+    return {
+        "model": size,
+        "compute_type": compute_type,
+        "cpu_threads": cpu_threads,
+        "mode": mode,
+        "workers": workers if mode == "pooled" else 1,
+        "files": results,
+        "wall_seconds": wall,
+        "audio_seconds": audio_total,
+        "latency_mean": statistics.mean(latencies),
+        "latency_p50": latencies[len(latencies) // 2],
+        "latency_p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+        "rtf_mean": statistics.mean(rtfs) if rtfs else None,
+        "throughput_audio_per_sec": audio_total / wall if wall else None,
+        "throughput_files_per_min": len(results) * 60 / wall if wall else None,
+        "peak_rss_mb": peak_rss,  # pooled - сумма пиков процесса прогона и всех воркеров
+    }
+
+
+def _print_case(case: Dict, verbose: bool):
+    print(
+        f"\n== model={case['model']} compute={case['compute_type']} threads={case['cpu_threads']} "
+        f"mode={case['mode']} workers={case['workers']}"
+    )
+    if verbose:
+        for r in case["files"]:
+            rtf = f"{r['rtf']:.3f}" if r["rtf"] is not None else "-"
+            print(f"  {r['file']:<40} latency={r['latency']:.2f}s audio={r['audio_seconds']:.1f}s rtf={rtf}")
+    rtf_mean = f"{case['rtf_mean']:.3f}" if case["rtf_mean"] is not None else "-"
+    print(
+        f"  latency mean/p50/p95: {case['latency_mean']:.2f}/{case['latency_p50']:.2f}/{case['latency_p95']:.2f}s"
+        f" | rtf mean: {rtf_mean}"
+        f" | throughput: {case['throughput_audio_per_sec']:.2f} audio-s/s, {case['throughput_files_per_min']:.1f} files/min"
+        f" | peak RSS: {case['peak_rss_mb']:.0f} MB"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк распознавания голосовых сообщений")
+    parser.add_argument("--corpus", default="benchmarks/stt_corpus", help="Папка с OGG файлами")
+    parser.add_argument("--models", default="base", help="Размеры моделей через запятую")
+    parser.add_argument("--compute-types", default="int8", help="Типы вычислений через запятую")
+    parser.add_argument("--threads", default="0", help="Значения cpu_threads через запятую (0 - по умолчанию)")
+    parser.add_argument("--modes", default=",".join(MODES), help="Режимы через запятую: serial, pooled, batched")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Число процессов в режиме pooled")
+    parser.add_argument("--batch-size", type=int, default=8, help="Размер батча в режиме batched")
+    parser.add_argument("--warmup", type=int, default=1, help="Число прогревочных файлов")
+    parser.add_argument("--json", dest="json_path", help="Сохранить полные результаты в JSON")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Выводить время по каждому файлу")
+    args = parser.parse_args()
+
+    files = sorted(str(p) for p in Path(args.corpus).glob("*.ogg"))
+    if not files:
+        parser.error(f"В папке {args.corpus} нет OGG файлов")
+
+    modes = [m for m in args.modes.split(",") if m]
+    unknown = set(modes) - set(MODES)
+    if unknown:
+        parser.error(f"Неизвестные режимы: {', '.join(sorted(unknown))}")
+
+    print(f"Corpus: {len(files)} files from {args.corpus}, CPU count: {os.cpu_count()}")
+
+    cases = []
+    for size in args.models.split(","):
+        for compute_type in args.compute_types.split(","):
+            for threads in (int(t) for t in args.threads.split(",")):
+                for mode in modes:
+                    # Свежий процесс на каждый прогон - изолированный замер памяти
+                    with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as runner:
+                        case = runner.submit(
+                            run_case, size, compute_type, threads, mode,
+                            files, args.workers, args.batch_size, args.warmup
+                        ).result()
+                    _print_case(case, args.verbose)
+                    cases.append(case)
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(cases, f, ensure_ascii=False, indent=2)
+        print(f"\nResults saved to {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
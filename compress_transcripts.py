@@ -0,0 +1,155 @@
+"""
+Обслуживание сжатого хранения транскриптов (database/compression.py).
+
+    python compress_transcripts.py train [--samples 5000] [--size 32768]
+        Собирает словарь zlib по последним репликам и отчетам и сохраняет его в compression_dictionaries.
+        Работающие процессы подгружают словарь сами (раз в COMPRESSION_DICT_REFRESH_INTERVAL секунд),
+        а сжимать им начинают через COMPRESSION_DICT_ACTIVATION_DELAY секунд после обучения.
+        Перезапуск бота не нужен; backfill запускайте после активации словаря.
+
+    python compress_transcripts.py backfill [--batch 500] [--dry-run]
+        Пересжимает существующие строки активным словарем (несжатые и сжатые старыми словарями)
+        и печатает объем до и после. --dry-run - только посчитать.
+"""
+import argparse
+import asyncio
+from collections import Counter
+from typing import Iterable, List
+from sqlalchemy import LargeBinary, column, select, table, update
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from config import config
+from database.compression import (
+    compress_text, compressed_dict_id, decompress_text, is_compressed, load_dictionaries, registry
+)
+from database.engine import create_db_engine
+from database.models import CompressionDictionary, SessionMessage, SessionTranscript
+
+# (таблица, первичный ключ, сжимаемые колонки)
+COMPRESSED_COLUMNS = [
+    ("session_transcripts", "session_id", ["user_messages", "bot_messages", "report_text"]),
+    ("session_messages", "id", ["content"]),
+]
+
+
+def build_dictionary(samples: Iterable[str], size: int = 32 * 1024) -> bytes:
+    """
+    Словарь для zlib: самые выгодные повторяющиеся фрагменты (слова и фразы из 2-3 слов).
+    Выгода фрагмента - частота * длина в байтах. zlib дешевле кодирует ссылки на конец словаря,
+    поэтому самые выгодные фрагменты ставятся последними.
+    """
+    counts: Counter = Counter()
+    for text in samples:
+        words = text.split()
+        for n in (1, 2, 3):
+            for i in range(len(words) - n + 1):
+                counts[" ".join(words[i:i + n])] += 1
+
+    scored = sorted(
+        ((count * len(phrase.encode("utf-8")), phrase) for phrase, count in counts.items() if count > 1),
+        reverse=True
+    )
+    chosen: List[bytes] = []
+    total = 0
+    for _, phrase in scored:
+        chunk = (phrase + " ").encode("utf-8")
+        if total + len(chunk) > size:
+            continue
+        chosen.append(chunk)
+        total += len(chunk)
+    return b"".join(reversed(chosen))
+
+
+async def train(engine: AsyncEngine, samples_limit: int, size: int):
+    async with AsyncSession(engine) as session:
+        messages = (await session.execute(
+            select(SessionMessage.content).order_by(SessionMessage.id.desc()).limit(samples_limit)
+        )).scalars().all()
+        reports = (await session.execute(
+            select(SessionTranscript.report_text)
+            .where(SessionTranscript.report_text.isnot(None))
+            .order_by(SessionTranscript.session_id.desc())
+            .limit(max(1, samples_limit // 10))
+        )).scalars().all()
+        samples = list(messages) + list(reports)
+        if not samples:
+            print("No transcripts to train on")
+            return
+
+        data = build_dictionary(samples, size)
+        dictionary = CompressionDictionary(data=data, sample_count=len(samples))
+        session.add(dictionary)
+        await session.flush()
+        dict_id = dictionary.id
+        await session.commit()
+        registry.register(dict_id, data)
+
+    raw_size = sum(len(s.encode("utf-8")) for s in samples)
+    plain = sum(len(compress_text(s, dict_id=0)) for s in samples)
+    with_dict = sum(len(compress_text(s, dict_id=dict_id)) for s in samples)
+    print(f"Dictionary {dict_id}: {len(data)} bytes from {len(samples)} samples")
+    print(f"Samples: raw {raw_size} B, zlib {plain} B ({plain / raw_size:.1%}), zlib+dict {with_dict} B ({with_dict / raw_size:.1%})")
+    print(
+        f"The dictionary becomes active in {config.COMPRESSION_DICT_ACTIVATION_DELAY}s "
+        f"(COMPRESSION_DICT_ACTIVATION_DELAY), run backfill after that"
+    )
+
+
+async def backfill(engine: AsyncEngine, batch: int, dry_run: bool):
+    for table_name, pk_name, columns in COMPRESSED_COLUMNS:
+        for column_name in columns:
+            # Сырые байты без CompressedText: нужно видеть формат хранения
+            raw = table(table_name, column(pk_name), column(column_name, LargeBinary))
+            pk, value_column = raw.c[pk_name], raw.c[column_name]
+            before = after = rewritten = 0
+            last_pk = None
+            while True:
+                stmt = select(pk, value_column).where(value_column.isnot(None)).order_by(pk).limit(batch)
+                if last_pk is not None:
+                    stmt = stmt.where(pk > last_pk)
+                async with engine.begin() as conn:
+                    rows = (await conn.execute(stmt)).all()
+                    if not rows:
+                        break
+                    last_pk = rows[-1][0]
+                    for row_pk, value in rows:
+                        value = bytes(value)
+                        before += len(value)
+                        if is_compressed(value) and compressed_dict_id(value) == registry.active_id:
+                            after += len(value)
+                            continue
+                        packed = compress_text(decompress_text(value))
+                        after += len(packed)
+                        if packed != value:
+                            rewritten += 1
+                            if not dry_run:
+                                await conn.execute(update(raw).where(pk == row_pk).values({column_name: packed}))
+            ratio = f"{after / before:.1%}" if before else "-"
+            print(f"{table_name}.{column_name}: {before} B -> {after} B ({ratio}), rows rewritten: {rewritten}")
+    if dry_run:
+        print("Dry run, nothing written")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Сжатие транскриптов")
+    commands = parser.add_subparsers(dest="command", required=True)
+    train_parser = commands.add_parser("train", help="Обучить словарь сжатия")
+    train_parser.add_argument("--samples", type=int, default=5000, help="Число последних реплик в выборке")
+    train_parser.add_argument("--size", type=int, default=32 * 1024, help="Размер словаря, байт (zlib использует до 32 КБ)")
+    backfill_parser = commands.add_parser("backfill", help="Пересжать существующие строки")
+    backfill_parser.add_argument("--batch", type=int, default=500)
+    backfill_parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    engine = create_db_engine()
+    try:
+        await load_dictionaries(engine)
+        if args.command == "train":
+            await train(engine, args.samples, args.size)
+        else:
+            await backfill(engine, args.batch, args.dry_run)
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
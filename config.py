@@ -10,15 +10,70 @@ load_dotenv()
 class Config:
     BOT_TOKEN = os.getenv("BOT_TOKEN")
     DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///bot_db.sqlite")
+    # Пул соединений БД, общий для бота, миграций и фоновых задач
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+    DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", 30))  # Сколько ждать свободное соединение, секунды
+    DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))  # Пересоздавать соединения старше N секунд
+    DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+    DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 100))  # Кэш prepared statements asyncpg
+    DB_POOL_METRICS_INTERVAL = int(os.getenv("DB_POOL_METRICS_INTERVAL", 300))  # 0 - не логировать метрики пула
+    DB_ECHO = os.getenv("DB_ECHO", "false").lower() in ("1", "true", "yes")
     AI_API_KEY = os.getenv("AI_API_KEY")
     DEFAULT_MODEL = os.getenv("DEFAULT_MODEL")
     SESSION_LENGTH_MINUTES = os.getenv("SESSION_LENGTH_MINUTES")
     WARNING_BEFORE_END_MINUTES = int(os.getenv("WARNING_BEFORE_END_MINUTES", 5))
+    # Пакетная запись сообщений сессии в session_messages
+    TRANSCRIPT_FLUSH_INTERVAL = float(os.getenv("TRANSCRIPT_FLUSH_INTERVAL", 2))  # Секунды между сбросами буфера
+    TRANSCRIPT_BATCH_SIZE = int(os.getenv("TRANSCRIPT_BATCH_SIZE", 50))  # Сброс раньше срока при таком размере буфера
+    TRANSCRIPT_MAX_RETRIES = int(os.getenv("TRANSCRIPT_MAX_RETRIES", 5))  # Неудачных сбросов подряд, после которых пакет отбрасывается
+    TRANSCRIPT_COMPRESSION = os.getenv("TRANSCRIPT_COMPRESSION", "true").lower() in ("1", "true", "yes")  # Сжимать переписку и отчеты
+    COMPRESSION_DICT_REFRESH_INTERVAL = int(os.getenv("COMPRESSION_DICT_REFRESH_INTERVAL", 60))  # Секунды между подгрузкой новых словарей
+    # Через сколько секунд после обучения словарь начинает использоваться для записи. Должно быть заметно больше
+    # COMPRESSION_DICT_REFRESH_INTERVAL: к этому времени словарь загрузят все процессы
+    COMPRESSION_DICT_ACTIVATION_DELAY = int(os.getenv("COMPRESSION_DICT_ACTIVATION_DELAY", 300))
+    # Проверка подписок: истечение и предупреждения
+    SUBSCRIPTION_CHECK_INTERVAL = int(os.getenv("SUBSCRIPTION_CHECK_INTERVAL", 60))  # Секунды между проверками
+    SUBSCRIPTION_BATCH_SIZE = int(os.getenv("SUBSCRIPTION_BATCH_SIZE", 500))  # Пользователей в одном UPDATE
     LOG_LEVEL = int(os.getenv("LOG_LEVEL", 20))  # 20 = INFO, 10 = DEBUG
+    # Получение апдейтов: polling или webhook (aiohttp сервер за reverse proxy), см. services/webhook.py.
+    # В обоих режимах бот запускается одним экземпляром; масштабирование - через BOT_WORKERS
+    BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+    UPDATES_CONCURRENCY = int(os.getenv("UPDATES_CONCURRENCY", 100))  # Апдейтов в обработке одновременно, 0 - без лимита
+    WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL")  # Публичный https адрес; пусто - вебхук не регистрируется при старте
+    WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+    WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")  # Пусто - выводится из BOT_TOKEN
+    WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", 40))  # Одновременных запросов от Telegram (1-100)
+    WEBAPP_HOST = os.getenv("WEBAPP_HOST", "0.0.0.0")
+    WEBAPP_PORT = int(os.getenv("WEBAPP_PORT", 55055))
+    # Шардирование по chat_id: >1 - апдейты обрабатывают BOT_WORKERS процессов, см. services/sharding.py
+    BOT_WORKERS = int(os.getenv("BOT_WORKERS", 1))
+    SHARD_QUEUE_PREFIX = os.getenv("SHARD_QUEUE_PREFIX", "updates:shard")
     
     REDDIS_PASSWORD = os.getenv("REDDIS_PASSWORD")
     REDDIS_HOST = os.getenv("REDDIS_HOST")
     REDDIS_PORT = int(os.getenv("REDDIS_PORT"))
+    # Шина доменных событий (Redis Streams), см. services/event_bus.py
+    EVENTS_STREAM = os.getenv("EVENTS_STREAM", "events:domain")
+    EVENTS_STREAM_MAXLEN = int(os.getenv("EVENTS_STREAM_MAXLEN", 100_000))  # Примерная длина хвоста потока
+    EVENTS_GROUP = os.getenv("EVENTS_GROUP", "achievements")
+    EVENTS_BATCH_SIZE = int(os.getenv("EVENTS_BATCH_SIZE", 50))
+    EVENTS_CLAIM_IDLE_MS = int(os.getenv("EVENTS_CLAIM_IDLE_MS", 60_000))  # Забирать чужие необработанные события через N мс
+    EVENTS_MAX_DELIVERIES = int(os.getenv("EVENTS_MAX_DELIVERIES", 5))  # После N неудачных попыток событие уходит в :dead
+    # Диспетчер исходящих сообщений (лимиты Telegram: ~30 сообщений/с на бота, ~1/с в чат)
+    NOTIFY_GLOBAL_RATE = float(os.getenv("NOTIFY_GLOBAL_RATE", 25))  # Сообщений в секунду на бота
+    NOTIFY_CHAT_RATE = float(os.getenv("NOTIFY_CHAT_RATE", 1))  # Сообщений в секунду в один чат
+    NOTIFY_CHAT_BURST = int(os.getenv("NOTIFY_CHAT_BURST", 3))  # Сколько сообщений в чат можно отправить подряд
+    NOTIFY_WORKERS = int(os.getenv("NOTIFY_WORKERS", 8))  # Параллельных отправок
+    NOTIFY_MAX_RETRIES = int(os.getenv("NOTIFY_MAX_RETRIES", 3))  # Повторов при сетевых ошибках и 5xx
+
+    WHISPER_MODEL = os.getenv("WHISPER_MODEL", "base")
+    WHISPER_COMPUTE_TYPE = os.getenv("WHISPER_COMPUTE_TYPE", "int8")
+    WHISPER_CPU_THREADS = int(os.getenv("WHISPER_CPU_THREADS", 0))  # 0 - значение по умолчанию CTranslate2
+    WHISPER_PRELOAD = os.getenv("WHISPER_PRELOAD", "true").lower() in ("1", "true", "yes")  # Загружать модель в фоне после старта
+    STT_CACHE_TTL = int(os.getenv("STT_CACHE_TTL", 7 * 24 * 3600))  # Время жизни кэша распознавания, секунды
+    TARIFF_CACHE_TTL = int(os.getenv("TARIFF_CACHE_TTL", 60))  # Как часто сверять кэш тарифов с БД, секунды
+    PERSONA_REFRESH_INTERVAL = int(os.getenv("PERSONA_REFRESH_INTERVAL", 30))  # Как часто проверять изменения персонажей, секунды
 
     # PAYMENT_SHOP_ID = int(os.getenv("PAYMENT_SHOP_ID"))
     # PAYMENT_SECRET_KEY = os.getenv("PAYMENT_SECRET_KEY")
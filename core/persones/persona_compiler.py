@@ -0,0 +1,136 @@
+import hashlib
+import json
+from typing import Dict, Optional
+from sqlalchemy import event
+from database.models import Persona
+from config import logger
+
+# Версия формата артефакта. Увеличивается при изменении compile_persona или render_sections:
+# входит в content_hash, поэтому migrate_personas пересоберет артефакты всех персонажей
+ARTEFACT_VERSION = 1
+
+# Колонки personas, из которых собирается артефакт
+SOURCE_FIELDS = (
+    "name", "age", "gender", "profession", "marital_status", "living_situation", "education",
+    "background", "trauma_history", "current_symptoms", "goal_session", "tone",
+    "behaviour_rules", "interaction_guide", "self_reports", "escalation", "triggers",
+)
+
+
+def _loads(value: Optional[str], default):
+    return json.loads(value) if value else default
+
+
+def to_legacy_format(persona: Persona) -> Dict:
+    """Разбирает строку personas в формат, с которым работают слои персонажа"""
+    return {
+        "persona": {
+            "name": persona.name,
+            "age": persona.age,
+            "gender": persona.gender,
+            "profession": persona.profession,
+            "marital_status": persona.marital_status,
+            "living_situation": persona.living_situation,
+            "education": persona.education,
+            "id": persona.id
+        },
+        "background": persona.background,
+        "trauma_history": _loads(persona.trauma_history, []),
+        "current_symptoms": _loads(persona.current_symptoms, {}),
+        "goal_session": persona.goal_session,
+        "tone": _loads(persona.tone, {}),
+        "behaviour_rules": _loads(persona.behaviour_rules, []),
+        "interaction_guide": _loads(persona.interaction_guide, {}),
+        "self_reports": _loads(persona.self_reports, []),
+        "escalation": _loads(persona.escalation, []),
+        "triggers": _loads(persona.triggers, []),
+    }
+
+
+def render_sections(persona_data: Dict) -> Dict:
+    """Части системного промпта, которые не зависят от настроек сессии (сопротивление, эмоция)"""
+    persona = persona_data['persona']
+
+    def format_list(items):
+        return "\n".join(f"- {item}" for item in items) if items else "—"
+
+    def format_dict(items: Dict, capitalize: bool = False):
+        return "\n".join(f"- {k.capitalize() if capitalize else k}: {v}" for k, v in items.items()) or "—"
+
+    basic_info = [
+        f"Имя: {persona['name']}",
+        f"Возраст: {persona['age']}",
+        f"Профессия: {persona.get('profession', '—')}",
+        f"Семейное положение: {persona.get('marital_status', '—')}",
+        f"Жилищные условия: {persona.get('living_situation', '—')}",
+        f"Образование: {persona.get('education', '—')}"
+    ]
+    symptoms = persona_data.get("current_symptoms", {})
+    profile: dict = persona_data.get("personality_profile", {})
+    interaction: dict = persona_data.get("interaction_guide", {})
+
+    return {
+        "basic_info": "\n".join(basic_info),
+        "background": persona_data.get("background", "—"),
+        "goal_session": persona_data.get("goal_session", "—"),
+        "trauma": format_list(persona_data.get("trauma_history", [])),
+        "symptoms": "\n".join(f"{k}: {v}" for k, v in symptoms.items()) or "—",
+        "attachment_style": profile.get('attachment_style', '—'),
+        "personality_organization": profile.get('personality_organization', '—'),
+        "big_five": format_dict(profile.get("big_five", {}), capitalize=True),
+        "schemas": format_list(profile.get("predominant_schemas", [])),
+        "defenses": format_dict(profile.get("defense_mechanisms", {})),
+        "coping": format_list(profile.get("coping_style", [])),
+        "interpersonal": format_dict(profile.get("interpersonal_style", {}), capitalize=True),
+        "values": format_list(profile.get("values", [])),
+        "strengths": format_list(profile.get("strengths_and_resources", [])),
+        "interests": format_list(profile.get("interests_hobbies", [])),
+        "triggers": format_list(persona_data.get("triggers", [])),
+        "forbidden": format_list(persona_data.get("forbidden_topics", [])),
+        "min_chars": interaction.get("message_length", {}).get("min_chars", 50),
+        "max_chars": interaction.get("message_length", {}).get("max_chars", 200),
+        "use_emojis": interaction.get("use_emojis", False),
+    }
+
+
+def content_hash(persona: Persona) -> str:
+    """Хэш исходных колонок персонажа и версии формата артефакта"""
+    source = {name: getattr(persona, name) for name in SOURCE_FIELDS}
+    payload = json.dumps([ARTEFACT_VERSION, source], ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def compile_persona(persona: Persona) -> bool:
+    """
+    Собирает артефакт персонажа в persona.compiled: разобранные данные и готовые части промпта.
+    Ничего не делает, если исходные данные не менялись. Возвращает True, если артефакт пересобран
+    """
+    new_hash = content_hash(persona)
+    if persona.compiled and persona.content_hash == new_hash:
+        return False
+    data = to_legacy_format(persona)
+    data["compiled_sections"] = render_sections(data)
+    persona.compiled = json.dumps(data, ensure_ascii=False)
+    persona.content_hash = new_hash
+    return True
+
+
+def load_compiled(compiled: str, persona_id: int) -> Dict:
+    """Данные персонажа из артефакта. id подставляется при загрузке: при первой компиляции его еще нет"""
+    data = json.loads(compiled)
+    data["persona"]["id"] = persona_id
+    return data
+
+
+@event.listens_for(Persona, "before_insert")
+@event.listens_for(Persona, "before_update")
+def _compile_on_change(mapper, connection, target: Persona):
+    # Правки персонажа через ORM (migrate_personas, админка) сразу пересобирают артефакт
+    try:
+        if compile_persona(target):
+            logger.debug(f"[PERSONAS] Compiled persona {target.name} | hash={target.content_hash[:12]}")
+    except (TypeError, ValueError) as e:
+        # Некорректный JSON в колонке: артефакт не собираем, загрузчик разберет строку сам
+        logger.error(f"[PERSONAS] Failed to compile persona {target.name}: {e!r}")
+        target.compiled = None
+        target.content_hash = None
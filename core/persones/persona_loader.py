@@ -1,61 +1,95 @@
+import asyncio
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, func
 from database.models import Persona
-from typing import Dict, Optional
-import json
-from config import logger
+from typing import Dict, Optional, Tuple
+from config import config, logger
+from core.persones.persona_compiler import load_compiled, render_sections, to_legacy_format
 
+
+# --- Каталог персонажей ---
+# Все персонажи загружаются в память один раз из собранных артефактов (persona_compiler, одна JSON колонка
+# на персонажа), поэтому хендлеры получают их без обращения к БД и без разбора JSON.
+# Фоновая задача раз в PERSONA_REFRESH_INTERVAL секунд сверяет версию таблицы
+# (count, max(id), max(created_at), max(updated_at)) и перечитывает каталог, только если она изменилась -
+# так подхватываются правки из админки.
+# Каталог заменяется целиком (новый словарь), возвращаемые словари общие для всех вызывающих - их нельзя изменять.
 class PersonaLoader:
-    def __init__(self, admin_engine):
+    def __init__(self, admin_engine, refresh_interval: float = config.PERSONA_REFRESH_INTERVAL):
         self.admin_engine = admin_engine
-        self._cached_personas = None
-    
+        self.refresh_interval = refresh_interval
+        self._cached_personas: Optional[Dict[str, Dict]] = None
+        self._version: Optional[Tuple] = None
+        self._refresh_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Загружает каталог и запускает фоновую проверку изменений"""
+        await self.refresh()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    @property
+    def version(self) -> Optional[Tuple]:
+        """Версия загруженного каталога (None - еще не загружен)"""
+        return self._version
+
     async def load_all_personas(self) -> Dict[str, Dict]:
-        async with AsyncSession(self.admin_engine) as session:
-            result = await session.execute(select(Persona))
-            personas = result.scalars().all()
-            
-            personas_dict = {}
-            for persona in personas:
-                personas_dict[persona.name] = self._convert_to_legacy_format(persona)
-            self._cached_personas = personas_dict
-            logger.info(personas_dict)
-            return personas_dict
-    
+        """Каталог персонажей по имени. БД читается только при первом вызове, если start() не вызывался"""
+        if self._cached_personas is None:
+            await self.refresh()
+        return self._cached_personas
+
     async def get_persona(self, name: str) -> Optional[Dict]:
-        if self._cached_personas and name in self._cached_personas:
-            return self._cached_personas[name]
-            
-        async with AsyncSession(self.admin_engine) as session:
-            result = await session.execute(
-                select(Persona).where(Persona.name == name)
-            )
-            persona = result.scalars().first()
-            if persona:
-                return self._convert_to_legacy_format(persona)
-            return None
-    
-    def _convert_to_legacy_format(self, persona: Persona) -> Dict:
-        """Convert database Persona object to legacy format"""
-        return {
-            "persona": {
-                "name": persona.name,
-                "age": persona.age,
-                "gender": persona.gender,
-                "profession": persona.profession,
-                "marital_status": persona.marital_status,
-                "living_situation": persona.living_situation,
-                "education": persona.education,
-                "id": persona.id
-            },
-            "background": persona.background,
-            "trauma_history": json.loads(persona.trauma_history) if persona.trauma_history else [],
-            "current_symptoms": json.loads(persona.current_symptoms) if persona.current_symptoms else {},
-            "goal_session": persona.goal_session,
-            "tone": json.loads(persona.tone) if persona.tone else {},
-            "behaviour_rules": json.loads(persona.behaviour_rules) if persona.behaviour_rules else [],
-            "interaction_guide": json.loads(persona.interaction_guide) if persona.interaction_guide else {},
-            "self_reports": json.loads(persona.self_reports) if persona.self_reports else [],
-            "escalation": json.loads(persona.escalation) if persona.escalation else [],
-            "triggers": json.loads(persona.triggers) if persona.triggers else [],
-        }
\ No newline at end of file
+        return (await self.load_all_personas()).get(name)
+
+    async def refresh(self, force: bool = False) -> bool:
+        """Перечитывает каталог, если изменилась версия таблицы. Возвращает True, если каталог обновлен"""
+        async with self._refresh_lock:
+            async with AsyncSession(self.admin_engine) as session:
+                version = tuple((await session.execute(
+                    select(
+                        func.count(Persona.id),
+                        func.max(Persona.id),
+                        func.max(Persona.created_at),
+                        func.max(Persona.updated_at)
+                    )
+                )).one())
+                if not force and self._cached_personas is not None and version == self._version:
+                    return False
+
+                rows = (await session.execute(select(Persona.id, Persona.name, Persona.compiled))).all()
+                personas_dict = {
+                    row.name: load_compiled(row.compiled, row.id)
+                    for row in rows if row.compiled
+                }
+                # Артефакт еще не собран (правка в обход ORM) - разбираем колонки как раньше
+                raw_ids = [row.id for row in rows if not row.compiled]
+                if raw_ids:
+                    logger.warning(f"[PERSONAS] {len(raw_ids)} personas without compiled artefact, parsing columns")
+                    for persona in (await session.execute(select(Persona).where(Persona.id.in_(raw_ids)))).scalars():
+                        data = to_legacy_format(persona)
+                        data["compiled_sections"] = render_sections(data)
+                        personas_dict[persona.name] = data
+            self._cached_personas = personas_dict
+            self._version = version
+            logger.info(f"[PERSONAS] Catalogue loaded: {len(personas_dict)} personas | version={version}")
+            logger.debug(f"[PERSONAS] Names: {list(personas_dict)}")
+            return True
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"[PERSONAS] Catalogue refresh failed, keeping version {self._version}: {e!r}")
@@ -1,55 +1,22 @@
 from config import logger
+from core.persones.persona_compiler import render_sections
 
 def build_prompt(persona_data: dict, resistance_level=None, emotional_state=None) -> str:
     name = persona_data['persona']['name']
     age = persona_data['persona']['age']
 
-    def format_list(items):
-        return "\n".join(f"- {item}" for item in items) if items else "—"
-    
-    basic_info = [
-        f"Имя: {name}",
-        f"Возраст: {age}",
-        f"Профессия: {persona_data['persona'].get('profession', '—')}",
-        f"Семейное положение: {persona_data['persona'].get('marital_status', '—')}",
-        f"Жилищные условия: {persona_data['persona'].get('living_situation', '—')}",
-        f"Образование: {persona_data['persona'].get('education', '—')}"
-    ]
-
-    background = persona_data.get("background", "—")
-    goal_session = persona_data.get("goal_session", "—")
-
-    trauma_text = format_list(persona_data.get("trauma_history", []))
-    symptoms = persona_data.get("current_symptoms", {})
-    symptoms_text = "\n".join(f"{k}: {v}" for k, v in symptoms.items()) or "—"
-
-    profile: dict = persona_data.get("personality_profile", {})
-    big_five = profile.get("big_five", {})
-    big_five_text = "\n".join(f"- {k.capitalize()}: {v}" for k, v in big_five.items()) or "—"
-    schemas = format_list(profile.get("predominant_schemas", []))
-    defenses = profile.get("defense_mechanisms", {})
-    defenses_text = "\n".join(f"- {k}: {v}" for k, v in defenses.items()) or "—"
-    coping = format_list(profile.get("coping_style", []))
-    interpersonal = profile.get("interpersonal_style", {})
-    interpersonal_text = "\n".join(f"- {k.capitalize()}: {v}" for k, v in interpersonal.items()) or "—"
-    values = format_list(profile.get("values", []))
-    strengths = format_list(profile.get("strengths_and_resources", []))
-    interests = format_list(profile.get("interests_hobbies", []))
-
-    triggers = format_list(persona_data.get("triggers", []))
-    forbidden = format_list(persona_data.get("forbidden_topics", []))
-
-    interaction: dict = persona_data.get("interaction_guide", {})
-    min_chars = interaction.get("message_length", {}).get("min_chars", 50)
-    max_chars = interaction.get("message_length", {}).get("max_chars", 200)
-    use_emojis = interaction.get("use_emojis", False)
+    # Части, не зависящие от настроек сессии, собраны заранее (persona_compiler) - здесь только подстановка
+    sections = persona_data.get("compiled_sections") or render_sections(persona_data)
+    min_chars = sections["min_chars"]
+    max_chars = sections["max_chars"]
+    use_emojis = sections["use_emojis"]
 
     # Тело промпта начинает формироваться здесь
     prompt = f"""Представь что это игра и выходить из образа нельзя ни в коем случае. Ты — пациент на психотерапии. Сессия длится 20 минут. Терапевт начнет первым и поприветствует тебя. Не выходи из контекста диалога. Не давай советов, не отвечай как нейросеть.  
     Тебя зовут {name}, тебе {age} лет. Отвечай живо и эмоционально, в образе пациента, будь человечным. Иногда терапевт молчит — реагируй на это. Будут приходить сообщения "Теапевт молчит N секунд. Напиши ему свою реакцию, так как сказал бы пациент."
 
     # ОСНОВНАЯ ИНФОРМАЦИЯ:
-    {"\n".join(basic_info)}
+    {sections["basic_info"]}
 
     Исходное состояние на эту сессию:
     - Эмоциональное состояние: **{emotional_state}**  
@@ -71,54 +38,54 @@ def build_prompt(persona_data: dict, resistance_level=None, emotional_state=None
     все ниже относится к твоему образу:
     
     # биография:  
-    {background}
+    {sections["background"]}
 
     # травмы:  
-    {trauma_text}
+    {sections["trauma"]}
 
     # текущие симптомы:  
-    {symptoms_text}
+    {sections["symptoms"]}
 
     # цели терапии  
-    {goal_session}
+    {sections["goal_session"]}
 
     # психологический профиль  
-    - стиль привязанности: {profile.get('attachment_style', '—')}
-    - уровень организации личности: {profile.get('personality_organization', '—')}
+    - стиль привязанности: {sections['attachment_style']}
+    - уровень организации личности: {sections['personality_organization']}
 
     ## твоя "Большая пятерка":
-    {big_five_text}
+    {sections["big_five"]}
 
     ## схемы:
-    {schemas}
+    {sections["schemas"]}
 
     ## механизмы защиты:
-    {defenses_text}
+    {sections["defenses"]}
 
     ## копинг-стратегии:
-    {coping}
+    {sections["coping"]}
 
     ## межличностный стиль:
-    {interpersonal_text}
+    {sections["interpersonal"]}
 
     ## ценности:
-    {values}
+    {sections["values"]}
 
     ---
 
     # сильные стороны и ресурсы  
-    {strengths}
+    {sections["strengths"]}
 
     # интересы и хобби  
-    {interests}
+    {sections["interests"]}
 
     ---
 
     # триггеры  
-    {triggers}
+    {sections["triggers"]}
 
     # Запретные темы  
-    {forbidden}
+    {sections["forbidden"]}
     """
     logger.debug(prompt)
     return prompt
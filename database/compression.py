@@ -0,0 +1,146 @@
+"""
+Прозрачное сжатие текстов переписки и отчетов.
+
+Значение хранится как bytes:
+    b"\\xffZ" + id словаря (4 байта, big-endian) + zlib поток  - сжатый текст
+    UTF-8 без заголовка                                       - короткий или несжимаемый текст
+Байт 0xff не встречается в UTF-8, поэтому заголовок не спутать с обычным текстом.
+
+Короткие реплики сжимаются плохо, поэтому используется предустановленный словарь zlib (zdict),
+собранный по нашим русскоязычным транскриптам (compress_transcripts.py train). Словари хранятся
+в таблице compression_dictionaries и загружаются в память при старте (load_dictionaries) и затем
+раз в COMPRESSION_DICT_REFRESH_INTERVAL секунд (refresh_dictionaries): id словаря записан в каждом значении,
+поэтому старые данные читаются и после обучения нового словаря.
+Новый словарь становится активным (им начинают сжимать) только через COMPRESSION_DICT_ACTIVATION_DELAY
+после обучения - к этому времени его уже загрузили все работающие процессы и могут прочитать такие строки.
+id 0 - сжатие без словаря.
+
+config импортируется внутри функций: database.models импортирует этот модуль, а импорт моделей
+не должен требовать окружения бота.
+"""
+import asyncio
+import datetime
+import zlib
+from typing import Dict, Optional
+from sqlalchemy import LargeBinary, select
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.types import TypeDecorator
+
+HEADER = b"\xffZ"
+HEADER_SIZE = len(HEADER) + 4
+MIN_COMPRESS_SIZE = 64  # Байт; короче - хранится как есть
+
+
+class DictionaryRegistry:
+    """
+    Словари сжатия в памяти процесса. Новые значения сжимаются активным словарем -
+    последним из тех, у которых наступило время активации
+    """
+    def __init__(self):
+        self.dictionaries: Dict[int, bytes] = {0: b""}
+        self.activates_at: Dict[int, Optional[datetime.datetime]] = {0: None}
+
+    def register(self, dict_id: int, data: bytes, activates_at: Optional[datetime.datetime] = None):
+        """activates_at=None - словарь активен сразу"""
+        self.dictionaries[dict_id] = data
+        self.activates_at[dict_id] = activates_at
+
+    @property
+    def active_id(self) -> int:
+        now = datetime.datetime.utcnow()
+        return max(dict_id for dict_id, at in self.activates_at.items() if at is None or at <= now)
+
+    def get(self, dict_id: int) -> bytes:
+        try:
+            return self.dictionaries[dict_id]
+        except KeyError:
+            raise ValueError(
+                f"Compression dictionary {dict_id} is not loaded (dictionaries are refreshed every "
+                f"COMPRESSION_DICT_REFRESH_INTERVAL seconds, check [COMPRESSION] errors in the log)"
+            ) from None
+
+
+registry = DictionaryRegistry()
+
+
+def compress_text(text: str, dict_id: Optional[int] = None) -> bytes:
+    from config import config
+
+    raw = text.encode("utf-8")
+    if not config.TRANSCRIPT_COMPRESSION or len(raw) < MIN_COMPRESS_SIZE:
+        return raw
+
+    dict_id = registry.active_id if dict_id is None else dict_id
+    zdict = registry.get(dict_id)
+    compressor = zlib.compressobj(level=9, zdict=zdict) if zdict else zlib.compressobj(level=9)
+    packed = HEADER + dict_id.to_bytes(4, "big") + compressor.compress(raw) + compressor.flush()
+    # Несжимаемые тексты храним как есть
+    return packed if len(packed) < len(raw) else raw
+
+
+def decompress_text(data: bytes) -> str:
+    data = bytes(data)
+    if not is_compressed(data):
+        return data.decode("utf-8")
+
+    dict_id = compressed_dict_id(data)
+    zdict = registry.get(dict_id)
+    decompressor = zlib.decompressobj(zdict=zdict) if zdict else zlib.decompressobj()
+    return (decompressor.decompress(data[HEADER_SIZE:]) + decompressor.flush()).decode("utf-8")
+
+
+def is_compressed(data: bytes) -> bool:
+    return data[:len(HEADER)] == HEADER
+
+
+def compressed_dict_id(data: bytes) -> int:
+    return int.from_bytes(data[len(HEADER):HEADER_SIZE], "big")
+
+
+class CompressedText(TypeDecorator):
+    """Текстовая колонка, которая хранится сжатой (bytes) и читается как str"""
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return compress_text(value)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return decompress_text(value)
+
+
+async def load_dictionaries(engine: AsyncEngine):
+    """Загружает из БД в память процесса словари сжатия, которых еще нет в реестре"""
+    from config import config, logger
+    from database.models import CompressionDictionary
+
+    async with engine.connect() as conn:
+        rows = (await conn.execute(
+            select(CompressionDictionary.id, CompressionDictionary.data, CompressionDictionary.created_at)
+            .where(CompressionDictionary.id.notin_(list(registry.dictionaries)))
+            .order_by(CompressionDictionary.id)
+        )).all()
+    delay = datetime.timedelta(seconds=config.COMPRESSION_DICT_ACTIVATION_DELAY)
+    for dict_id, data, created_at in rows:
+        # Словарь без даты (обучен до появления задержки) считаем давно активным
+        registry.register(dict_id, data, created_at + delay if created_at else None)
+    if rows:
+        logger.info(
+            f"[COMPRESSION] Loaded dictionaries {[row.id for row in rows]}, active dictionary: {registry.active_id}"
+        )
+
+
+async def refresh_dictionaries(engine: AsyncEngine, interval: int):
+    """Фоновая задача: подгружает словари, обученные после старта процесса"""
+    from config import logger
+
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await load_dictionaries(engine)
+        except Exception as e:
+            logger.error(f"[COMPRESSION] Error refreshing dictionaries: {e!r}")
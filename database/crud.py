@@ -1,9 +1,15 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, tuple_
 from sqlalchemy.orm import selectinload
 from .models import User, Referral
-from database.models import Session
+from database.models import Session, SessionMessage
 from sqlalchemy import func
+from sqlalchemy.engine import Row
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+SESSIONS_PAGE_SIZE = 5
+_CURSOR_EPOCH = datetime(1970, 1, 1)
 
 
 async def get_user(session: AsyncSession, telegram_id: int) -> User | None:
@@ -67,11 +73,78 @@ async def create_user(
     await session.commit()
     return user
 
-async def get_user_sessions(session: AsyncSession, user_id: int) -> list[Session]:
+async def get_user_sessions(session: AsyncSession, user_id: int) -> list[Row]:
+    """Сессии пользователя для списка: только колонки, нужные для кнопок"""
     stmt = (
-        select(Session)
+        select(Session.id, Session.persona_name, Session.started_at)
         .where(Session.user_id == user_id)
         .order_by(Session.started_at.desc())
     )
     result = await session.execute(stmt)
-    return result.scalars().all()
\ No newline at end of file
+    return result.all()
+
+
+def encode_session_cursor(started_at: datetime, session_id: int) -> str:
+    """Курсор страницы сессий для callback_data: микросекунды от эпохи и id (started_at хранится в UTC без таймзоны)"""
+    return f"{(started_at - _CURSOR_EPOCH) // timedelta(microseconds=1)}-{session_id}"
+
+
+def decode_session_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Обратное преобразование курсора. ValueError при некорректном значении"""
+    micros, session_id = cursor.split("-")
+    return _CURSOR_EPOCH + timedelta(microseconds=int(micros)), int(session_id)
+
+
+async def get_user_sessions_page(
+    session: AsyncSession,
+    user_id: int,
+    cursor: Optional[str] = None,
+    backward: bool = False,
+    limit: int = SESSIONS_PAGE_SIZE
+) -> Tuple[list[Row], bool, bool]:
+    """
+    Страница сессий пользователя (новые сверху) с keyset пагинацией по (started_at, id).
+
+    cursor - курсор крайней сессии соседней страницы: при backward=False берутся сессии старше него
+    (следующая страница), при backward=True - новее (предыдущая). Без курсора - первая страница.
+    Читается limit + 1 строка по индексу (user_id, started_at), стоимость не зависит от длины истории.
+    Возвращает (строки, есть_предыдущая, есть_следующая).
+    """
+    stmt = select(Session.id, Session.persona_name, Session.started_at).where(Session.user_id == user_id)
+
+    if cursor:
+        started_at, session_id = decode_session_cursor(cursor)
+        # Условие по одной started_at дает диапазон по индексу, сравнение кортежей разбирает равные started_at
+        if backward:
+            stmt = stmt.where(
+                Session.started_at >= started_at,
+                tuple_(Session.started_at, Session.id) > tuple_(started_at, session_id)
+            )
+        else:
+            stmt = stmt.where(
+                Session.started_at <= started_at,
+                tuple_(Session.started_at, Session.id) < tuple_(started_at, session_id)
+            )
+
+    if backward:
+        stmt = stmt.order_by(Session.started_at.asc(), Session.id.asc())
+    else:
+        stmt = stmt.order_by(Session.started_at.desc(), Session.id.desc())
+
+    rows = (await session.execute(stmt.limit(limit + 1))).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    if backward:
+        rows.reverse()
+        return rows, has_more, True
+    return rows, cursor is not None, has_more
+
+
+async def get_session_messages(session: AsyncSession, session_id: int, role: Optional[str] = None) -> list[str]:
+    """Реплики сессии по порядку из session_messages. role - "user" или "bot", None - все"""
+    stmt = select(SessionMessage.content).where(SessionMessage.session_id == session_id)
+    if role:
+        stmt = stmt.where(SessionMessage.role == role)
+    result = await session.execute(stmt.order_by(SessionMessage.seq))
+    return list(result.scalars().all())
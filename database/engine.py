@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional
+from sqlalchemy import exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from config import config, logger
+
+
+class PoolMetrics:
+    """Счетчики ожидания соединений из пула"""
+    def __init__(self):
+        self.acquisitions = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.timeouts = 0
+
+    def observe(self, wait: float):
+        self.acquisitions += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+
+    def reset(self):
+        self.__init__()
+
+
+class InstrumentedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """Пул соединений, который замеряет время получения соединения (ожидание в очереди + подключение)"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.timeouts += 1
+            raise
+        finally:
+            self.metrics.observe(time.perf_counter() - started)
+
+    def recreate(self):
+        # engine.dispose() пересоздает пул - счетчики переносим в новый
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+
+def create_db_engine(url: Optional[str] = None, connect_args: Optional[Dict[str, Any]] = None) -> AsyncEngine:
+    """
+    Единая фабрика движка БД для бота, миграций и фоновых задач.
+
+    Параметры пула берутся из конфига (DB_POOL_*), чтобы размер пула можно было
+    согласовать с лимитом соединений Postgres.
+    """
+    db_url = make_url(url or config.DATABASE_URL)
+    connect_args = dict(connect_args or {})
+    engine_kwargs: Dict[str, Any] = {
+        "echo": config.DB_ECHO,
+        "pool_pre_ping": config.DB_POOL_PRE_PING,
+    }
+
+    # Для sqlite в памяти SQLAlchemy использует StaticPool, настройки пула к нему неприменимы
+    if not (db_url.get_backend_name() == "sqlite" and db_url.database in (None, "", ":memory:")):
+        # Логгер пула называется по модулю класса (database.engine.InstrumentedAsyncQueuePool), вне sqlalchemy.*,
+        # и наследовал INFO от корневого логгера ("Pool disposed", "Pool recreating"). Как у штатного пула,
+        # INFO включается только через echo_pool
+        logging.getLogger(
+            f"{InstrumentedAsyncQueuePool.__module__}.{InstrumentedAsyncQueuePool.__name__}"
+        ).setLevel(logging.WARNING)
+        engine_kwargs.update(
+            poolclass=InstrumentedAsyncQueuePool,
+            pool_size=config.DB_POOL_SIZE,
+            max_overflow=config.DB_MAX_OVERFLOW,
+            pool_timeout=config.DB_POOL_TIMEOUT,
+            pool_recycle=config.DB_POOL_RECYCLE,
+        )
+
+    if db_url.get_driver_name() == "asyncpg":
+        # Кэш подготовленных выражений asyncpg и SQLAlchemy. 0 - выключить (нужно за pgbouncer в режиме transaction)
+        connect_args.setdefault("statement_cache_size", config.DB_STATEMENT_CACHE_SIZE)
+        db_url = db_url.update_query_dict(
+            {"prepared_statement_cache_size": str(config.DB_STATEMENT_CACHE_SIZE)}
+        )
+
+    logger.debug(f"Creating database engine for {db_url.render_as_string(hide_password=True)}")
+    return create_async_engine(db_url, connect_args=connect_args, **engine_kwargs)
+
+
+def pool_stats(engine: AsyncEngine) -> Dict[str, Any]:
+    """Текущее состояние пула: занятые/свободные соединения, переполнение и время ожидания"""
+    pool = engine.sync_engine.pool
+    stats: Dict[str, Any] = {}
+    if isinstance(pool, AsyncAdaptedQueuePool):
+        stats.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            checked_in=pool.checkedin(),
+            overflow=pool.overflow(),
+        )
+    metrics: Optional[PoolMetrics] = getattr(pool, "metrics", None)
+    if metrics:
+        stats.update(
+            acquisitions=metrics.acquisitions,
+            wait_avg_ms=round(metrics.wait_total / metrics.acquisitions * 1000, 2) if metrics.acquisitions else 0.0,
+            wait_max_ms=round(metrics.wait_max * 1000, 2),
+            timeouts=metrics.timeouts,
+        )
+    return stats
+
+
+async def log_pool_metrics(engine: AsyncEngine, interval: int):
+    """Фоновая задача: периодически пишет состояние пула в лог и сбрасывает счетчики ожидания"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            logger.info(f"[DB POOL] {pool_stats(engine)}")
+            metrics = getattr(engine.sync_engine.pool, "metrics", None)
+            if metrics:
+                metrics.reset()
+        except Exception as e:
+            logger.error(f"[DB POOL] Error collecting pool metrics: {e}")
@@ -0,0 +1,221 @@
+"""
+Версионированные миграции схемы.
+
+Base.metadata.create_all создает только отсутствующие таблицы и не трогает существующие,
+поэтому индексы, новые колонки и перенос данных для уже развернутых баз выполняются здесь.
+Каждая миграция применяется один раз (номер версии хранится в schema_migrations) и написана
+идемпотентно: на свежей базе create_all уже создал все объекты и миграция ничего не делает.
+"""
+import datetime
+import time
+from typing import Callable, List, Tuple
+from sqlalchemy import Column, DateTime, Integer, LargeBinary, MetaData, String, Table, select, insert, inspect
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncEngine
+from database.models import Base
+from config import logger
+
+migrations_metadata = MetaData()
+
+schema_migrations = Table(
+    "schema_migrations",
+    migrations_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime, default=datetime.datetime.utcnow),
+)
+
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = []
+
+
+def migration(version: int, name: str):
+    """Регистрирует синхронную функцию миграции (выполняется через conn.run_sync в транзакции)"""
+    def decorator(func: Callable[[Connection], None]):
+        MIGRATIONS.append((version, name, func))
+        return func
+    return decorator
+
+
+def _create_indexes(conn: Connection, table_name: str, *index_names: str):
+    """Создает объявленные в моделях индексы, если их еще нет"""
+    table = Base.metadata.tables[table_name]
+    for index in table.indexes:
+        if index.name in index_names:
+            index.create(conn, checkfirst=True)
+
+
+@migration(1, "sessions_orders_hot_query_indexes")
+def _sessions_orders_indexes(conn: Connection):
+    _create_indexes(
+        conn, "sessions",
+        "ix_sessions_user_started",
+        "ix_sessions_user_started_active",
+        "ix_sessions_user_free_started",
+    )
+    _create_indexes(conn, "orders", "ix_orders_user_tariff_created")
+    # Обновляем статистику планировщика, чтобы новые индексы сразу использовались
+    conn.exec_driver_sql("ANALYZE sessions")
+    conn.exec_driver_sql("ANALYZE orders")
+
+
+@migration(2, "move_transcripts_to_session_transcripts")
+def _move_transcripts(conn: Connection):
+    # Переписка и отчет переезжают из sessions в session_transcripts (таблицу уже создал create_all)
+    columns = {column["name"] for column in inspect(conn).get_columns("sessions")}
+    legacy = [name for name in ("user_messages", "bot_messages", "report_text") if name in columns]
+    if not legacy:
+        return
+
+    select_columns = ", ".join(legacy)
+    source_columns = select_columns
+    if conn.dialect.name == "postgresql":
+        # На свежей схеме колонки session_transcripts уже bytea (см. миграцию 3)
+        target_types = {c["name"]: c["type"] for c in inspect(conn).get_columns("session_transcripts")}
+        source_columns = ", ".join(
+            f"convert_to({name}, 'UTF8')" if isinstance(target_types[name], LargeBinary) else name
+            for name in legacy
+        )
+    conn.exec_driver_sql(
+        f"INSERT INTO session_transcripts (session_id, {select_columns}, created_at) "
+        f"SELECT id, {source_columns}, COALESCE(ended_at, started_at) FROM sessions "
+        f"WHERE ({' OR '.join(f'{name} IS NOT NULL' for name in legacy)}) "
+        f"AND id NOT IN (SELECT session_id FROM session_transcripts)"
+    )
+    for name in legacy:
+        conn.exec_driver_sql(f"ALTER TABLE sessions DROP COLUMN {name}")
+
+
+@migration(3, "compressed_transcript_columns")
+def _compressed_transcript_columns(conn: Connection):
+    # Колонки CompressedText хранят bytes. Существующий текст переводим в UTF-8 байты без сжатия,
+    # он читается как есть; сжать старые строки можно командой compress_transcripts.py backfill
+    columns = [
+        ("session_transcripts", "user_messages"),
+        ("session_transcripts", "bot_messages"),
+        ("session_transcripts", "report_text"),
+        ("session_messages", "content"),
+    ]
+    inspector = inspect(conn)
+    for table, name in columns:
+        if conn.dialect.name == "postgresql":
+            column_type = next(c["type"] for c in inspector.get_columns(table) if c["name"] == name)
+            if not isinstance(column_type, LargeBinary):
+                conn.exec_driver_sql(
+                    f"ALTER TABLE {table} ALTER COLUMN {name} TYPE BYTEA USING convert_to({name}, 'UTF8')"
+                )
+        elif conn.dialect.name == "sqlite":
+            # sqlite не меняет тип колонки, но хранит тип значения - переводим текстовые значения в BLOB
+            conn.exec_driver_sql(
+                f"UPDATE {table} SET {name} = CAST({name} AS BLOB) WHERE typeof({name}) = 'text'"
+            )
+
+
+@migration(4, "achievement_counter_indexes")
+def _achievement_counter_indexes(conn: Connection):
+    # Счетчики отзывов и приглашенных считаются подзапросами экрана "Мои достижения"
+    _create_indexes(conn, "feedback", "ix_feedback_user")
+    _create_indexes(conn, "referrals", "ix_referrals_inviter")
+
+
+@migration(5, "unique_achievement_tier")
+def _unique_achievement_tier(conn: Connection):
+    # Дубли уровней могли появиться из-за гонки проверок; оставляем самую раннюю выдачу
+    conn.exec_driver_sql(
+        "DELETE FROM achievements WHERE id NOT IN ("
+        "SELECT MIN(id) FROM achievements GROUP BY user_id, badge_code, tier)"
+    )
+    _create_indexes(conn, "achievements", "ux_achievements_user_badge_tier")
+
+
+@migration(6, "users_tariff_expires_index")
+def _users_tariff_expires_index(conn: Connection):
+    _create_indexes(conn, "users", "ix_users_tariff_expires_paid")
+    conn.exec_driver_sql("ANALYZE users")
+
+
+@migration(7, "users_quota_counter")
+def _users_quota_counter(conn: Connection):
+    # Счетчик заполняется лениво при первой проверке квоты (SessionManager.use_session_quota_or_bonus)
+    columns = {column["name"] for column in inspect(conn).get_columns("users")}
+    if "quota_period_start" not in columns:
+        conn.exec_driver_sql("ALTER TABLE users ADD COLUMN quota_period_start TIMESTAMP")
+    if "quota_sessions_used" not in columns:
+        conn.exec_driver_sql("ALTER TABLE users ADD COLUMN quota_sessions_used INTEGER NOT NULL DEFAULT 0")
+
+
+@migration(8, "persona_compiled_artefact")
+def _persona_compiled_artefact(conn: Connection):
+    # Артефакты собирает migrate_personas при старте бота
+    columns = {column["name"] for column in inspect(conn).get_columns("personas")}
+    if "compiled" not in columns:
+        conn.exec_driver_sql("ALTER TABLE personas ADD COLUMN compiled TEXT")
+    if "content_hash" not in columns:
+        conn.exec_driver_sql("ALTER TABLE personas ADD COLUMN content_hash VARCHAR(64)")
+
+
+@migration(9, "persona_source_hash")
+def _persona_source_hash(conn: Connection):
+    columns = {column["name"] for column in inspect(conn).get_columns("personas")}
+    if "source_hash" not in columns:
+        conn.exec_driver_sql("ALTER TABLE personas ADD COLUMN source_hash VARCHAR(64)")
+
+
+@migration(10, "default_tariffs")
+def _default_tariffs(conn: Connection):
+    # Раньше стандартные тарифы досоздавались при каждом старте бота; добавляются только отсутствующие
+    from default_tariffs_create import DEFAULT_TARIFFS
+    tariffs = Base.metadata.tables["tariffs"]
+    existing = set(conn.execute(select(tariffs.c.name)).scalars())
+    missing = [tariff for tariff in DEFAULT_TARIFFS if tariff["name"] not in existing]
+    if missing:
+        conn.execute(insert(tariffs), missing)
+
+
+@migration(11, "sessions_achievements_counted")
+def _sessions_achievements_counted(conn: Connection):
+    # Учет сессии в счетчиках ачивок - по флагу на сессии, а не по максимальному учтенному id:
+    # повторно доставленное событие старой сессии иначе отбрасывалось, если уже учтена более новая
+    columns = {column["name"] for column in inspect(conn).get_columns("sessions")}
+    if "achievements_counted" not in columns:
+        conn.exec_driver_sql("ALTER TABLE sessions ADD COLUMN achievements_counted BOOLEAN NOT NULL DEFAULT FALSE")
+    stats_columns = {column["name"] for column in inspect(conn).get_columns("user_achievement_stats")}
+    if "last_session_id" in stats_columns:
+        conn.exec_driver_sql(
+            "UPDATE sessions SET achievements_counted = TRUE WHERE id <= ("
+            "SELECT last_session_id FROM user_achievement_stats s WHERE s.user_id = sessions.user_id)"
+        )
+        conn.exec_driver_sql("ALTER TABLE user_achievement_stats DROP COLUMN last_session_id")
+
+
+def _schema_is_current(conn: Connection) -> bool:
+    tables = set(inspect(conn).get_table_names())
+    if schema_migrations.name not in tables or not tables.issuperset(Base.metadata.tables):
+        return False
+    applied = set(conn.execute(select(schema_migrations.c.version)).scalars())
+    return applied.issuperset(version for version, _, _ in MIGRATIONS)
+
+
+async def schema_is_current(engine: AsyncEngine) -> bool:
+    """
+    True, если все таблицы моделей созданы и все миграции применены - тогда create_all и
+    run_migrations при старте не нужны. Два запроса вместо проверки каждой таблицы
+    """
+    async with engine.connect() as conn:
+        return await conn.run_sync(_schema_is_current)
+
+
+async def run_migrations(engine: AsyncEngine):
+    """Применяет все еще не примененные миграции по порядку, каждую в своей транзакции"""
+    async with engine.begin() as conn:
+        await conn.run_sync(migrations_metadata.create_all)
+        applied = set((await conn.execute(select(schema_migrations.c.version))).scalars())
+
+    for version, name, step in sorted(MIGRATIONS, key=lambda m: m[0]):
+        if version in applied:
+            continue
+        logger.info(f"[MIGRATIONS] Applying {version} {name}...")
+        started = time.perf_counter()
+        async with engine.begin() as conn:
+            await conn.run_sync(step)
+            await conn.execute(insert(schema_migrations).values(version=version, name=name))
+        logger.info(f"[MIGRATIONS] Applied {version} {name} in {time.perf_counter() - started:.2f}s")
@@ -1,8 +1,9 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, Text, Enum
+from sqlalchemy import Column, Integer, String, DateTime, Date, Boolean, ForeignKey, Text, Enum, Index, LargeBinary, JSON
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 import datetime
 from enum import Enum as PyEnum
+from database.compression import CompressedText
 
 Base = declarative_base()
 
@@ -33,12 +34,25 @@ class User(Base):
     referral_code = Column(String, unique=True, index=True)               # Мой реф. код
     bonus_balance = Column(Integer, default=1)                            # Кол-во бонусов
 
+    # Счетчик квоты платного тарифа: начало текущего периода квоты и сколько сессий в нем уже списано
+    quota_period_start = Column(DateTime, nullable=True)
+    quota_sessions_used = Column(Integer, default=0, nullable=False, server_default="0")
+
     # Relationships
     orders = relationship("Order", back_populates="user")
     sessions = relationship("Session", back_populates="user")
     achievements = relationship("Achievement", back_populates="user")
     referrals = relationship("Referral", back_populates="inviter", foreign_keys='Referral.inviter_id')
     admin = relationship("Admin", back_populates="user", uselist=False)
+
+    __table_args__ = (
+        # Поиск истекающих и истёкших подписок (services/subscription_checker.py): только платные тарифы
+        Index(
+            "ix_users_tariff_expires_paid", "tariff_expires",
+            postgresql_where=active_tariff != TariffType.TRIAL,
+            sqlite_where=active_tariff != TariffType.TRIAL,
+        ),
+    )
     
 class Order(Base):
     __tablename__ = "orders"
@@ -55,6 +69,11 @@ class Order(Base):
     user = relationship("User", back_populates="orders")
     tariff = relationship("Tariff", back_populates="orders")
 
+    __table_args__ = (
+        # Последний заказ пользователя по тарифу - начало периода квоты
+        Index("ix_orders_user_tariff_created", "user_id", "tariff_id", "created_at"),
+    )
+
 
 class Session(Base):
     __tablename__ = "sessions"
@@ -67,10 +86,7 @@ class Session(Base):
     is_active = Column(Boolean, default=True)  # Флаг активности сессии
     
     is_free = Column(Boolean, default=False)
-    user_messages = Column(Text, nullable=True)  # Хранить всю переписку пользователя (списки строк)
-    bot_messages = Column(Text, nullable=True)   # Хранить все ответы бота
-
-    report_text = Column(Text, nullable=True)  # Итоговый отчёт по сессии (если есть)
+    # Переписка и отчет хранятся в session_transcripts: строка сессии остается узкой для списков и счетчиков
     tokens_spent = Column(Integer, nullable=True)  # Если считаешь расход токенов
     
     is_rnd = Column(Boolean, default=False) # Для отслеживания случайная сессия или нет, думаю для ачивок и статистики пригодиться
@@ -81,7 +97,63 @@ class Session(Base):
 
     user = relationship("User", back_populates="sessions")
     persona_id = Column(Integer, ForeignKey("personas.id"), nullable=True)
+    achievements_counted = Column(Boolean, default=False, nullable=False)  # Сессия учтена в user_achievement_stats
     persona = relationship("Persona", back_populates="sessions")
+    transcript = relationship("SessionTranscript", back_populates="session", uselist=False, lazy="noload")
+
+    # Индексы под горячие запросы (добавляются в существующие базы миграцией, см. database/migrations.py)
+    __table_args__ = (
+        # История сессий пользователя, счетчики для ачивок, сессии за месяц
+        Index("ix_sessions_user_started", "user_id", "started_at"),
+        # Активная сессия пользователя - проверяется на каждое сообщение, активных строк единицы
+        Index(
+            "ix_sessions_user_started_active", "user_id", "started_at",
+            postgresql_where=is_active == True,
+            sqlite_where=is_active == True,
+        ),
+        # Платные сессии в периоде квоты
+        Index("ix_sessions_user_free_started", "user_id", "is_free", "started_at"),
+    )
+
+
+class SessionTranscript(Base):
+    """Переписка и отчет по сессии. Читаются только при просмотре конкретной сессии"""
+    __tablename__ = "session_transcripts"
+    session_id = Column(Integer, ForeignKey("sessions.id", ondelete="CASCADE"), primary_key=True)
+    # Тексты хранятся сжатыми (database/compression.py), в коде читаются и пишутся как str
+    user_messages = Column(CompressedText, nullable=True)  # Переписка пользователя JSON массивом (сессии до session_messages)
+    bot_messages = Column(CompressedText, nullable=True)   # Ответы бота JSON массивом (сессии до session_messages)
+    report_text = Column(CompressedText, nullable=True)  # Итоговый отчёт по сессии (если есть)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+    session = relationship("Session", back_populates="transcript")
+
+
+class CompressionDictionary(Base):
+    """Словари zlib для сжатия транскриптов. Обучаются командой compress_transcripts.py train"""
+    __tablename__ = "compression_dictionaries"
+    id = Column(Integer, primary_key=True)
+    data = Column(LargeBinary, nullable=False)
+    sample_count = Column(Integer, default=0)  # Сколько текстов было в выборке для обучения
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+
+class SessionMessage(Base):
+    """Реплика сессии. Пишется по ходу сессии пакетами (services/transcript_writer.py)"""
+    __tablename__ = "session_messages"
+    id = Column(Integer, primary_key=True)
+    session_id = Column(Integer, ForeignKey("sessions.id", ondelete="CASCADE"), nullable=False)
+    seq = Column(Integer, nullable=False)  # Порядковый номер реплики в сессии
+    role = Column(String, nullable=False)  # "user" - пользователь (терапевт), "bot" - персонаж
+    content = Column(CompressedText, nullable=False)  # Хранится сжатым, см. database/compression.py
+    decision = Column(String, nullable=True)  # Решение слоя принятия решений для ответа персонажа (respond, silence, ...)
+    tokens_used = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+    __table_args__ = (
+        # Чтение переписки сессии по порядку
+        Index("ux_session_messages_session_seq", "session_id", "seq", unique=True),
+    )
 
 
 class AchievementType(PyEnum):
@@ -116,12 +188,38 @@ class Achievement(Base):
     
     user = relationship("User", back_populates="achievements")
 
+    __table_args__ = (
+        # Уровень выдается один раз: повторная обработка события не создаст дубль
+        Index("ux_achievements_user_badge_tier", "user_id", "badge_code", "tier", unique=True),
+    )
+
 class AchievementProgress(Base):
     __tablename__ = 'achievement_progress'
     user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
     achievement_type = Column(Enum(AchievementType), primary_key=True)
     progress = Column(Integer, default=0)
 
+class UserAchievementStats(Base):
+    """
+    Счетчики пользователя для ачивок по сессиям. Обновляются инкрементально при завершении сессии
+    (services/achievements.py), пересобираются из истории командой rebuild_achievement_stats.py
+    """
+    __tablename__ = "user_achievement_stats"
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    session_count = Column(Integer, default=0, nullable=False)
+    high_resistance_count = Column(Integer, default=0, nullable=False)
+    night_count = Column(Integer, default=0, nullable=False)  # Сессии с 00:00 до 05:00
+    weekend_count = Column(Integer, default=0, nullable=False)
+    personas = Column(JSON, default=list, nullable=False)  # id персон, с которыми были сессии
+    emotions = Column(JSON, default=list, nullable=False)
+    time_periods = Column(JSON, default=list, nullable=False)  # morning / afternoon / evening / night
+    month_key = Column(String, nullable=True)  # "YYYY-MM" месяца, к которому относится monthly_count
+    monthly_count = Column(Integer, default=0, nullable=False)
+    last_session_date = Column(Date, nullable=True)
+    current_streak = Column(Integer, default=0, nullable=False)  # Дней подряд до last_session_date
+    max_streak = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
 class Referral(Base):
     __tablename__ = "referrals"
     id = Column(Integer, primary_key=True)
@@ -134,6 +232,11 @@ class Referral(Base):
     inviter = relationship("User", back_populates="referrals", foreign_keys=[inviter_id])
     invited_user = relationship("User", foreign_keys=[invited_user_id])
 
+    __table_args__ = (
+        # Счетчик приглашенных для ачивки "Мастер приглашений"
+        Index("ix_referrals_inviter", "inviter_id"),
+    )
+
 class FeedbackType(PyEnum):
     FEEDBACK = "feedback"
     SUGGESTION = "suggestion"
@@ -168,6 +271,11 @@ class Feedback(Base):
     
     # Связи
     user = relationship("User")
+
+    __table_args__ = (
+        # Счетчик отзывов пользователя для ачивки "Контрибьютор обратной связи"
+        Index("ix_feedback_user", "user_id"),
+    )
     
     
 #### ADMIN DB
@@ -207,6 +315,11 @@ class Persona(Base):
     escalation = Column(Text)  
     triggers = Column(Text) 
     
+    # Собранный артефакт (core/persones/persona_compiler.py): разобранные данные и готовые части промпта одним JSON
+    compiled = Column(Text, nullable=True)
+    content_hash = Column(String(64), nullable=True)  # sha256 исходных колонок и версии формата артефакта
+    source_hash = Column(String(64), nullable=True)  # sha256 YAML файла, из которого персонаж загружен (migrate_personas)
+    
     # Additional metadata
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
     updated_at = Column(DateTime, onupdate=datetime.datetime.utcnow)
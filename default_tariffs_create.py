@@ -4,48 +4,51 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from database.models import TariffType
 
+# При старте бота тарифы досоздаются миграцией 10 (database/migrations.py) один раз.
+# Новый стандартный тариф требует новой миграции, которая добавит его в уже развернутые базы
+DEFAULT_TARIFFS = [
+    {
+        "name": TariffType.TRIAL,
+        "display_name": "Пробный",
+        "price": 0,
+        "duration_days": 999,
+        "session_quota": 0,
+        "quota_period_days": 30,
+        "description": "Бесплатный базовый тариф с ограниченным функционалом"
+    },
+    {
+        "name": TariffType.START,
+        "display_name": "Старт",
+        "price": 59000,
+        "duration_days": 7,
+        "session_quota": 3,
+        "quota_period_days": 7,
+        "description": "Базовый платный тариф на неделю"
+    },
+    {
+        "name": TariffType.PRO,
+        "display_name": "Профессиональный",
+        "price": 149000,
+        "duration_days": 30,
+        "session_quota": 10,
+        "quota_period_days": 30,
+        "description": "Расширенный тариф для профессионалов"
+    },
+    {
+        "name": TariffType.UNLIMITED,
+        "display_name": "Безлимитный",
+        "price": 249000,
+        "duration_days": 30,
+        "session_quota": 999,
+        "quota_period_days": 0,
+        "description": "Полный доступ без ограничений"
+    }
+]
+
+
 async def create_default_tariffs(session: AsyncSession):
     """Создаёт стандартные тарифы в БД при первом запуске"""
-    default_tariffs = [
-        {
-            "name": TariffType.TRIAL,
-            "display_name": "Пробный",
-            "price": 0,
-            "duration_days": 999,
-            "session_quota": 0,
-            "quota_period_days": 30,
-            "description": "Бесплатный базовый тариф с ограниченным функционалом"
-        },
-        {
-            "name": TariffType.START,
-            "display_name": "Старт",
-            "price": 59000,
-            "duration_days": 7,
-            "session_quota": 3,
-            "quota_period_days": 7,
-            "description": "Базовый платный тариф на неделю"
-        },
-        {
-            "name": TariffType.PRO,
-            "display_name": "Профессиональный",
-            "price": 149000,
-            "duration_days": 30,
-            "session_quota": 10,
-            "quota_period_days": 30,
-            "description": "Расширенный тариф для профессионалов"
-        },
-        {
-            "name": TariffType.UNLIMITED,
-            "display_name": "Безлимитный",
-            "price": 249000,
-            "duration_days": 30,
-            "session_quota": 999,
-            "quota_period_days": 0,
-            "description": "Полный доступ без ограничений"
-        }
-    ]
-
-    for tariff_data in default_tariffs:
+    for tariff_data in DEFAULT_TARIFFS:
         existing = await session.execute(
             select(Tariff).where(Tariff.name == tariff_data["name"])
         )
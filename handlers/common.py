@@ -16,7 +16,8 @@ from services.referral_manager import (
     create_new_user_with_referral,
     handle_referral_bonus
 )
-from services.achievements import AchievementSystem, AchievementType
+from services.event_bus import EventBus, EventType
+from services.notifier import NotificationDispatcher
 import datetime
 
 
@@ -24,7 +25,13 @@ router = Router(name="common")
 
 
 @router.message(Command("start"))
-async def cmd_start(message: types.Message, state: FSMContext, session: AsyncSession, achievement_system: AchievementSystem):
+async def cmd_start(
+    message: types.Message,
+    state: FSMContext,
+    session: AsyncSession,
+    event_bus: EventBus,
+    notifier: NotificationDispatcher
+):
     try:
         from_user = message.from_user
         logger.debug(f"Start command from: {from_user.id}")
@@ -36,10 +43,6 @@ async def cmd_start(message: types.Message, state: FSMContext, session: AsyncSes
         if len(text_parts) > 1 and text_parts[1].startswith("ref_"):
             referral_code = text_parts[1].split("_")[1]
             referrer = await process_referral_code(session, referral_code)
-            
-            # Если реферер найден, проверяем достижения для пригласившего
-            if referrer:
-                await achievement_system.check_referral_achievements(referrer.id)
 
         # Получаем или создаем пользователя
         db_user = await get_user(session, telegram_id=from_user.id)
@@ -50,13 +53,13 @@ async def cmd_start(message: types.Message, state: FSMContext, session: AsyncSes
             is_new_user = True
 
             if referrer:
-                await handle_referral_bonus(session, db_user, referrer, message.bot)
+                await handle_referral_bonus(session, db_user, referrer, notifier)
                 
-                # Проверяем достижение "Мастер приглашений" для реферера
-                await achievement_system.check_achievements(
-                    referrer.id, 
-                    AchievementType.REFERRAL_MASTER
-                )
+                # Достижение "Мастер приглашений" для реферера проверит воркер шины событий
+                await event_bus.publish(EventType.REFERRAL_JOINED, {
+                    'inviter_id': referrer.id,
+                    'invited_user_id': db_user.id
+                })
         else:
             logger.debug(f"User already exists: {db_user.id}")
             is_new_user = db_user.is_new
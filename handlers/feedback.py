@@ -2,7 +2,7 @@ import logging
 from aiogram import Router, types
 from aiogram.fsm.context import FSMContext
 from sqlalchemy.ext.asyncio import AsyncSession
-from services.achievements import AchievementSystem
+from services.event_bus import EventBus, EventType
 from database.models import AchievementType
 
 from states import MainMenu
@@ -83,7 +83,7 @@ async def acknowledge_user_feedback(message: types.Message, state: FSMContext, s
     await state.set_state(MainMenu.choosing)
 
 @router.message(MainMenu.feedback)
-async def handle_feedback(message: types.Message, state: FSMContext, session: AsyncSession, achievement_system: AchievementSystem):
+async def handle_feedback(message: types.Message, state: FSMContext, session: AsyncSession, event_bus: EventBus):
     db_user = await get_user(session, telegram_id=message.from_user.id)
     # Сохраняем отзыв в БД
     feedback = Feedback(
@@ -97,8 +97,8 @@ async def handle_feedback(message: types.Message, state: FSMContext, session: As
     session.add(feedback)
     await session.commit()
     
-    # Проверяем достижения
-    await achievement_system.check_feedback_achievements(db_user.id)
+    # Ачивки проверит воркер шины событий
+    await event_bus.publish(EventType.FEEDBACK_SUBMITTED, {'user_id': db_user.id})
     
     await acknowledge_user_feedback(
         message, state,
@@ -106,7 +106,7 @@ async def handle_feedback(message: types.Message, state: FSMContext, session: As
     )
 
 @router.message(MainMenu.suggestion)
-async def handle_suggestion(message: types.Message, state: FSMContext, session: AsyncSession, achievement_system: AchievementSystem):
+async def handle_suggestion(message: types.Message, state: FSMContext, session: AsyncSession, event_bus: EventBus):
     db_user = await get_user(session, telegram_id=message.from_user.id)
     # Сохраняем предложение в БД
     feedback = Feedback(
@@ -120,8 +120,8 @@ async def handle_suggestion(message: types.Message, state: FSMContext, session:
     session.add(feedback)
     await session.commit()
     
-    # Проверяем достижения
-    await achievement_system.check_feedback_achievements(db_user.id)
+    # Ачивки проверит воркер шины событий
+    await event_bus.publish(EventType.FEEDBACK_SUBMITTED, {'user_id': db_user.id})
     
     await acknowledge_user_feedback(
         message, state,
@@ -129,7 +129,7 @@ async def handle_suggestion(message: types.Message, state: FSMContext, session:
     )
 
 @router.message(MainMenu.error_report)
-async def handle_error(message: types.Message, state: FSMContext, session: AsyncSession, achievement_system: AchievementSystem):
+async def handle_error(message: types.Message, state: FSMContext, session: AsyncSession, event_bus: EventBus):
     db_user = await get_user(session, telegram_id=message.from_user.id)
     # Сохраняем баг-репорт в БД
     feedback = Feedback(
@@ -143,8 +143,8 @@ async def handle_error(message: types.Message, state: FSMContext, session: Async
     session.add(feedback)
     await session.commit()
     
-    # Проверяем достижения
-    await achievement_system.check_feedback_achievements(db_user.id)
+    # Ачивки проверит воркер шины событий
+    await event_bus.publish(EventType.FEEDBACK_SUBMITTED, {'user_id': db_user.id})
     
     await acknowledge_user_feedback(
         message, state,
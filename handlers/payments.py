@@ -11,6 +11,8 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from database.models import Tariff, Order, TariffType
 from database.crud import get_user
 from services.referral_manager import process_referral_bonus_after_payment
+from services.notifier import NotificationDispatcher
+from services.tariff_cache import tariff_cache
 from config import config, logger
 import json
 import datetime
@@ -50,14 +52,9 @@ async def buy_tariff_with_payment(
             await callback.answer("Неизвестный тариф", show_alert=True)
             return
 
-        tariff = await session.execute(
-            select(Tariff)
-            .where(Tariff.name == tariff_enum)
-            .where(Tariff.is_active == True)
-        )
-        tariff = tariff.scalar_one_or_none()
+        tariff = await tariff_cache.get(session, tariff_enum)
         
-        if not tariff:
+        if not tariff or not tariff.is_active:
             logger.warning(f"Tariff not found: {tariff_key}")
             await callback.answer("Тариф не найден", show_alert=True)
             return
@@ -130,7 +127,7 @@ async def process_successful_payment(
     message: Message, 
     state: FSMContext,
     session: AsyncSession,
-    bot: Bot
+    notifier: NotificationDispatcher
 ):
     """Обработка успешного платежа"""
     try:
@@ -158,6 +155,9 @@ async def process_successful_payment(
         user.active_tariff = TariffType(tariff.name)
         user.tariff_expires = datetime.datetime.utcnow() + datetime.timedelta(days=tariff.duration_days)
         user.subscription_warning_sent = False
+        # Новый тариф - новый период квоты
+        user.quota_period_start = datetime.datetime.utcnow()
+        user.quota_sessions_used = 0
         user.last_activity = datetime.datetime.utcnow()
 
         # Создаем запись о заказе
@@ -173,7 +173,7 @@ async def process_successful_payment(
         session.add(order)
 
         # Начисляем реферальные бонусы
-        await process_referral_bonus_after_payment(session, user.id, bot)
+        await process_referral_bonus_after_payment(session, user.id, notifier)
 
         await session.commit()
 
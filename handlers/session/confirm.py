@@ -107,15 +107,20 @@ async def session_confirm_handler(
                 )
                 return
             
-            # Делегируем менеджеру сессий начать сессию, и запрашиваем у него ее айди
-            session_id = await session_manager.start_session(
-                db_session=session,
-                user_id=db_user.id,
-                is_free=is_free,
-                persona_name=persona_name,
-                resistance=resistance,
-                emotion=emotion
-            )
+            # Делегируем менеджеру сессий начать сессию, и запрашиваем у него ее айди.
+            # Если сессия не создалась - возвращаем списанную квоту или бонус
+            try:
+                session_id = await session_manager.start_session(
+                    db_session=session,
+                    user_id=db_user.id,
+                    is_free=is_free,
+                    persona_name=persona_name,
+                    resistance=resistance,
+                    emotion=emotion
+                )
+            except Exception:
+                await session_manager.refund_session_quota(session, db_user.id, used_bonus=is_free)
+                raise
             # Обновляем данные в стейт
             await state.update_data(
                 session_start=datetime.utcnow().isoformat(),
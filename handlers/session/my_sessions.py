@@ -8,7 +8,6 @@ from texts.common import profile_text, referral_text, referral_stats_text
 from config import logger
 from keyboards.builder import main_menu
 from database.models import Session
-from database.crud import get_user_sessions
 from keyboards.builder import profile_keyboard, sessions_keyboard, session_details_keyboard
 from texts.common import SESSIONS_LIST_TITLE, SESSION_DETAILS, NO_SESSIONS_TEXT
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
@@ -21,8 +20,8 @@ from aiogram import Router, types, F
 from aiogram.fsm.context import FSMContext
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from database.models import Session
-from database.crud import get_user, get_user_sessions, count_user_sessions
+from database.models import Session, SessionTranscript
+from database.crud import get_user, get_user_sessions_page, count_user_sessions, get_session_messages
 from keyboards.builder import profile_keyboard, sessions_keyboard, session_details_keyboard
 from texts.common import SESSIONS_LIST_TITLE, SESSION_DETAILS, NO_SESSIONS_TEXT, profile_text
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
@@ -80,7 +79,7 @@ async def show_sessions_list(callback: types.CallbackQuery, session: AsyncSessio
         await callback.answer("Пользователь не найден")
         return
     
-    sessions = await get_user_sessions(session, db_user.id)
+    sessions, has_prev, has_next = await get_user_sessions_page(session, db_user.id)
     
     if not sessions:
         await callback.message.edit_text(
@@ -92,14 +91,16 @@ async def show_sessions_list(callback: types.CallbackQuery, session: AsyncSessio
         return
     
     await state.set_state(ProfileStates.viewing_sessions)
+    # Запоминаем запрос текущей страницы, чтобы вернуться на нее из деталей сессии
     await state.update_data({
-        "sessions_page": 0,
+        "sessions_cursor": None,
+        "sessions_backward": False,
         "user_id": db_user.id
     })
     
     await callback.message.edit_text(
         SESSIONS_LIST_TITLE,
-        reply_markup=sessions_keyboard(sessions, page=0)
+        reply_markup=sessions_keyboard(sessions, has_prev, has_next)
     )
 
 @router.callback_query(F.data.startswith("sessions_page_"), ProfileStates.viewing_sessions)
@@ -110,12 +111,18 @@ async def paginate_sessions(callback: types.CallbackQuery, session: AsyncSession
         await callback.answer("Ошибка: пользователь не найден")
         return
     
-    page = int(callback.data.split("_")[-1])
-    sessions = await get_user_sessions(session, user_id)
+    # sessions_page_n_<курсор> - следующая страница, sessions_page_p_<курсор> - предыдущая
+    _, _, direction, cursor = callback.data.split("_", 3)
+    backward = direction == "p"
+    try:
+        sessions, has_prev, has_next = await get_user_sessions_page(session, user_id, cursor, backward)
+    except ValueError:
+        await callback.answer("Ошибка: некорректная страница")
+        return
     
-    await state.update_data(sessions_page=page)
+    await state.update_data(sessions_cursor=cursor, sessions_backward=backward)
     await callback.message.edit_reply_markup(
-        reply_markup=sessions_keyboard(sessions, page=page)
+        reply_markup=sessions_keyboard(sessions, has_prev, has_next)
     )
 
 @router.callback_query(F.data.startswith("session_detail_"), ProfileStates.viewing_sessions)
@@ -149,9 +156,12 @@ async def show_session_details(callback: types.CallbackQuery, session: AsyncSess
 async def show_user_messages(callback: types.CallbackQuery, session: AsyncSession):
     try:
         session_id = int(callback.data.split("_")[-1])
-        stmt = select(Session.user_messages).where(Session.id == session_id)
-        result = await session.execute(stmt)
-        messages_data = result.scalar_one_or_none()
+        messages_data = await get_session_messages(session, session_id, role="user")
+        if not messages_data:
+            # Сессии до появления session_messages хранят переписку JSON массивом в session_transcripts
+            stmt = select(SessionTranscript.user_messages).where(SessionTranscript.session_id == session_id)
+            result = await session.execute(stmt)
+            messages_data = result.scalar_one_or_none()
         
         if not messages_data:
             await callback.answer("✉️ В этой сессии нет ваших сообщений", show_alert=True)
@@ -188,9 +198,12 @@ async def show_user_messages(callback: types.CallbackQuery, session: AsyncSessio
 async def show_bot_messages(callback: types.CallbackQuery, session: AsyncSession):
     try:
         session_id = int(callback.data.split("_")[-1])
-        stmt = select(Session.bot_messages).where(Session.id == session_id)
-        result = await session.execute(stmt)
-        messages_data = result.scalar_one_or_none()
+        messages_data = await get_session_messages(session, session_id, role="bot")
+        if not messages_data:
+            # Сессии до появления session_messages хранят переписку JSON массивом в session_transcripts
+            stmt = select(SessionTranscript.bot_messages).where(SessionTranscript.session_id == session_id)
+            result = await session.execute(stmt)
+            messages_data = result.scalar_one_or_none()
         
         if not messages_data:
             await callback.answer("🤖 В этой сессии нет ответов бота", show_alert=True)
@@ -227,7 +240,7 @@ async def show_bot_messages(callback: types.CallbackQuery, session: AsyncSession
 async def show_report(callback: types.CallbackQuery, session: AsyncSession):
     try:
         session_id = int(callback.data.split("_")[-1])
-        stmt = select(Session.report_text).where(Session.id == session_id)
+        stmt = select(SessionTranscript.report_text).where(SessionTranscript.session_id == session_id)
         result = await session.execute(stmt)
         report_data = result.scalar_one_or_none()
         
@@ -272,7 +285,6 @@ async def show_report(callback: types.CallbackQuery, session: AsyncSession):
 @router.callback_query(F.data == "back_to_sessions_list", ProfileStates.viewing_session_details)
 async def back_to_sessions_list(callback: types.CallbackQuery, session: AsyncSession, state: FSMContext):
     data = await state.get_data()
-    page = data.get("sessions_page", 0)
     user_id = data.get("user_id")
     
     if not user_id:
@@ -286,11 +298,13 @@ async def back_to_sessions_list(callback: types.CallbackQuery, session: AsyncSes
     except TelegramBadRequest as e:
         logger.error(f"Error deleting message: {e}")
     
-    sessions = await get_user_sessions(session, user_id)
+    sessions, has_prev, has_next = await get_user_sessions_page(
+        session, user_id, data.get("sessions_cursor"), data.get("sessions_backward", False)
+    )
     
     new_message = await callback.message.answer(
         SESSIONS_LIST_TITLE,
-        reply_markup=sessions_keyboard(sessions, page=page)
+        reply_markup=sessions_keyboard(sessions, has_prev, has_next)
     )
     
     await state.update_data(list_message_id=new_message.message_id)
@@ -37,6 +37,13 @@ async def random_session_handler(
         await callback.message.edit_text(NO_USER_TEXT)
         return
 
+    # Загрузка списка персонажей (до списания: без персонажей сессию не начать)
+    personas = await session_manager.get_all_personas()
+    persona_names = list(personas.keys())
+    if not persona_names:
+        await callback.message.edit_text(NO_PERSONES_TEXT)
+        return
+
     # Списание квоты или бонуса
     used, is_free = await session_manager.use_session_quota_or_bonus(session, db_user.id)
     if not used:
@@ -45,13 +52,6 @@ async def random_session_handler(
             reply_markup=await subscription_keyboard_when_sessions_left(session)
         )
         return
-    # Загрузка списка персонажей
-    
-    personas = await session_manager.get_all_personas()
-    persona_names = list(personas.keys())
-    if not persona_names:
-        await callback.message.edit_text(NO_PERSONES_TEXT)
-        return
     # Устанавливаем случайные параметры
     resistance = random.choice(resistance_options)
     emotion = random.choice(emotion_options)
@@ -69,16 +69,20 @@ async def random_session_handler(
     meta_history = []
     total_tokens = 0
 
-    # Создаем сессию
-    session_id = await session_manager.start_session(
-        db_session=session,
-        user_id=db_user.id,
-        is_free=is_free,
-        is_rnd=True,
-        persona_name=persona_name,
-        resistance=resistance,
-        emotion=emotion
-    )
+    # Создаем сессию; если не вышло - возвращаем списанную квоту или бонус
+    try:
+        session_id = await session_manager.start_session(
+            db_session=session,
+            user_id=db_user.id,
+            is_free=is_free,
+            is_rnd=True,
+            persona_name=persona_name,
+            resistance=resistance,
+            emotion=emotion
+        )
+    except Exception:
+        await session_manager.refund_session_quota(session, db_user.id, used_bonus=is_free)
+        raise
 
     await state.update_data(
         session_start=datetime.utcnow().isoformat(),
@@ -3,5 +3,6 @@ from .cleanup import end_session_cleanup
 from .process_messages import process_messages_after_delay, check_inactivity
 from .calculate_typing_delay import calculate_typing_delay
 from .constants import INACTIVITY_DELAY, PROCESSING_DELAY
+from .ingest import ingest_user_input
 
 __all__ = []
\ No newline at end of file
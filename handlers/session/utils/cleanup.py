@@ -1,7 +1,7 @@
 from handlers.session.utils.lock import session_lock
 from aiogram import types
 from aiogram.fsm.context import FSMContext
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.asyncio import async_sessionmaker
 import asyncio
 from collections import deque
 from database.crud import get_user
@@ -14,11 +14,14 @@ from services.timer_manager import TimerManager
 async def end_session_cleanup(
     message: types.Message,
     state: FSMContext,
-    session: AsyncSession,
+    sessionmaker: async_sessionmaker,
     session_manager: SessionManager,
     timer_manager: TimerManager
 ):
-    """Функция для корректного завершения сессии с гарантированным сбросом таймеров и состояния"""
+    """
+    Функция для корректного завершения сессии с гарантированным сбросом таймеров и состояния.
+    Вызывается и из таймеров, поэтому сессию БД открывает сама только на время завершения.
+    """
     data = await state.get_data()
     session_id = data.get("session_id")
     user_id = data.get("user_id")
@@ -44,18 +47,19 @@ async def end_session_cleanup(
             })
             
             # Завершаем сессию
-            db_user = await get_user(session, telegram_id=message.from_user.id)
-            if session_id and db_user:
-                logger.debug(f"[SESSION INTERATION] Ending session in manager | session_id={session_id} | user_id={user_id}")
-                try:
-                    await session_manager.end_session(
-                        user_id=db_user.id,
-                        db_session=session,
-                        session_id=session_id
-                    )
-                    logger.info(f"[SESSION INTERATION] Session ended successfully | session_id={session_id} | user_id={user_id}")
-                except Exception as e:
-                    logger.error(f"[SESSION INTERATION] Error ending session in manager: {e} | session_id={session_id} | user_id={user_id}")
+            async with sessionmaker() as session:
+                db_user = await get_user(session, telegram_id=message.from_user.id)
+                if session_id and db_user:
+                    logger.debug(f"[SESSION INTERATION] Ending session in manager | session_id={session_id} | user_id={user_id}")
+                    try:
+                        await session_manager.end_session(
+                            user_id=db_user.id,
+                            db_session=session,
+                            session_id=session_id
+                        )
+                        logger.info(f"[SESSION INTERATION] Session ended successfully | session_id={session_id} | user_id={user_id}")
+                    except Exception as e:
+                        logger.error(f"[SESSION INTERATION] Error ending session in manager: {e} | session_id={session_id} | user_id={user_id}")
             
             # Очищаем состояние
             logger.debug(f"[SESSION INTERATION] Clearing state | session_id={session_id} | user_id={user_id}")
@@ -0,0 +1,101 @@
+from aiogram import Bot, types
+from aiogram.fsm.context import FSMContext
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from datetime import datetime
+from collections import deque
+import asyncio
+from services.session_manager import SessionManager
+from services.timer_manager import TimerManager, SafeTimer
+from config import logger
+from .lock import session_lock
+from .cleanup import end_session_cleanup
+from .process_messages import process_messages_after_delay, check_inactivity
+from .constants import PROCESSING_DELAY, INACTIVITY_DELAY
+
+
+async def ingest_user_input(
+    text: str,
+    message: types.Message,
+    state: FSMContext,
+    sessionmaker: async_sessionmaker,
+    session_manager: SessionManager,
+    bot: Bot,
+    timer_manager: TimerManager
+) -> bool:
+    """
+    Принимает текст пользователя из любого источника (текст, голос, в будущем - медиа)
+    и ставит его в очередь сообщений сессии.
+
+    message - исходное сообщение пользователя, из него берутся только чат и отправитель для ответов.
+    Пользователь берется из состояния сессии, повторный запрос в БД не нужен.
+    sessionmaker передается в таймеры: они срабатывают после завершения хендлера и открывают свои сессии.
+    Возвращает True, если текст принят в очередь.
+    """
+    data = await state.get_data()
+    session_id = data.get("session_id")
+    user_id = data.get("user_id")
+
+    if not text or not text.strip():
+        logger.debug(f"[SESSION INPUT] Empty input ignored | session_id={session_id} | user_id={user_id}")
+        return False
+
+    async with session_lock(state):
+        data = await state.get_data()
+
+        # Если бот уже отвечает, добавляем сообщение в очередь
+        if data.get("is_bot_responding", False):
+            message_queue = data.get("message_queue", deque())
+            if len(message_queue) >= 5:  # Лимит очереди
+                logger.warning(f"[SESSION INPUT] Message queue limit exceeded | session_id={session_id} | user_id={user_id}")
+                await asyncio.sleep(1.2)
+                # TODO: генерация ЛЛМ
+                await message.answer("не так много сообщений пожалуйста!!")
+                return False
+
+            message_queue.append(text)
+
+            await state.update_data(
+                message_queue=list(message_queue), # реддис не переваривает очереди - нельзя сеарилизовать
+                last_activity=datetime.now().isoformat()  # Обновляем активность при получении сообщения (чтобы бот не отвечал на 1 одно сообщение потом, если его перебили), однако, он не ответит на него, если не придет новое сообщение
+            )
+            logger.debug(f"[SESSION INPUT] Message added to queue (queue size={len(message_queue)}) | session_id={session_id} | user_id={user_id}")
+            return True
+
+        # Отменяем предыдущие таймеры
+        for timer_name in ['inactivity_timer', 'processing_timer']:
+            if timer := data.get(timer_name):
+                logger.debug(f"[SESSION INPUT] Cancelling previous {timer_name} | session_id={session_id} | user_id={user_id}")
+                await timer.cancel()
+
+        # Проверяем, активна ли ещё сессия
+        async with sessionmaker() as session:
+            is_active = await session_manager.is_session_active(user_id, session)
+        if not is_active:
+            logger.warning(f"[SESSION INPUT] Session is no longer active | session_id={session_id} | user_id={user_id}")
+            await end_session_cleanup(message, state, sessionmaker, session_manager, timer_manager)
+            return False
+
+        # Добавляем сообщение в очередь
+        message_queue = deque(data.get("message_queue", []))
+        message_queue.append(text)
+
+        # Создаем новые таймеры
+        inactivity_timer = SafeTimer("inactivity", state)
+        processing_timer = SafeTimer("processing", state)
+
+        timer_manager.add_timer(session_id, 'inactivity_timer', inactivity_timer)
+        timer_manager.add_timer(session_id, 'processing_timer', processing_timer)
+
+        # Обновляем состояние
+        await state.update_data(
+            message_queue=list(message_queue),
+            is_bot_responding=True,
+            last_activity=datetime.now().isoformat()
+        )
+
+        # Запускаем таймеры
+        await processing_timer.start(PROCESSING_DELAY, process_messages_after_delay, state, message, sessionmaker, session_manager, PROCESSING_DELAY, bot, timer_manager)
+        await inactivity_timer.start(INACTIVITY_DELAY, check_inactivity, state, message, INACTIVITY_DELAY, sessionmaker, session_manager, bot, timer_manager)
+
+        logger.debug(f"[SESSION INPUT] Timers started | session_id={session_id} | user_id={user_id}")
+        return True
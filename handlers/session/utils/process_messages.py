@@ -1,14 +1,14 @@
 from aiogram import types, Bot
 from aiogram.enums import ChatAction
 from aiogram.fsm.context import FSMContext
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.asyncio import async_sessionmaker
 from services.session_manager import SessionManager
+from services.notifier import Priority
 from services.timer_manager import TimerManager
 from core.persones.persona_decision_layer import PersonaDecisionLayer
 from core.persones.persona_humanization_layer import PersonaHumanizationLayer
 from core.persones.persona_instruction_layer import PersonaSalterLayer
 from core.persones.persona_response_layer import PersonaResponseLayer
-from database.crud import get_user
 from config import logger
 from typing import List
 from collections import deque
@@ -24,13 +24,16 @@ from typing import List
 async def process_messages_after_delay(
     state: FSMContext,
     message: types.Message,
-    session: AsyncSession,
+    sessionmaker: async_sessionmaker,
     session_manager: SessionManager,
     delay: int,
     bot: Bot,
     timer_manager: TimerManager
 ):
-    """Обрабатывает все сообщения после задержки PROCESSING_DELAY секунд"""
+    """
+    Обрабатывает все сообщения после задержки PROCESSING_DELAY секунд.
+    Работает в таймере дольше хендлера, поэтому сессии БД открывает сама и только на время запросов.
+    """
     data = await state.get_data()
     session_id = data.get("session_id")
     user_id = data.get("user_id")
@@ -39,7 +42,9 @@ async def process_messages_after_delay(
     
     try:
         async with session_lock(state):
-            if not await session_manager.is_session_active(user_id, session):
+            async with sessionmaker() as session:
+                is_active = await session_manager.is_session_active(user_id, session)
+            if not is_active:
                 logger.debug(f"[PROCESS MESSAGES] Session ended before inactivity check | session_id={session_id} | user_id={user_id}")
                 return
             
@@ -71,12 +76,11 @@ async def process_messages_after_delay(
             humanizator = PersonaHumanizationLayer.from_dict(data['humanizator'])
             total_tokens = data.get("total_tokens")
             
-            # Логируем пользовательские сообщения
-            db_user = await get_user(session, telegram_id=message.from_user.id)
-            if db_user:
+            # Логируем пользовательские сообщения (user_id в состоянии - id пользователя в БД)
+            if user_id:
                 logger.debug(f"[PROCESS MESSAGES] Adding user message to history | session_id={session_id} | user_id={user_id}")
                 await session_manager.add_message_to_history(
-                    db_user.id,
+                    user_id,
                     combined_message,
                     is_user=True,
                     tokens_used=0
@@ -134,8 +138,8 @@ async def process_messages_after_delay(
                             )
                             delay = calculate_typing_delay(part)
                             await asyncio.sleep(delay)
-                            # Отправляем сообщение и ждем завершения
-                            await bot.send_message(chat_id=message.chat.id, text=part)
+                            # Отправляем сообщение через диспетчер (лимиты Telegram) и ждем завершения
+                            await session_manager.notifier.send(message.chat.id, part, priority=Priority.SESSION)
                             # Отменяем индикатор печатает
                             typing_task.cancel()
                             try:
@@ -155,25 +159,26 @@ async def process_messages_after_delay(
                     current_queue = deque(data.get("message_queue", []))
                     if current_queue:
                         logger.debug(f"[PROCESS MESSAGES] New messages arrived during response (count={len(current_queue)}), processing them | session_id={session_id} | user_id={user_id}")
-                        await process_messages_after_delay(state, message, session, session_manager, 0, bot, timer_manager)
+                        await process_messages_after_delay(state, message, sessionmaker, session_manager, 0, bot, timer_manager)
                     else:
                         await state.update_data(is_bot_responding=False)
                     
                     # Логирование ответа
-                    if db_user:
+                    if user_id:
                         logger.debug(f"[PROCESS MESSAGES] Adding bot response to history | session_id={session_id} | user_id={user_id}")
                         await session_manager.add_message_to_history(
-                            db_user.id,
+                            user_id,
                             " ".join(response_parts),
                             is_user=False,
-                            tokens_used=total_tokens
+                            tokens_used=total_tokens,
+                            decision=decision
                         )
                     
                     if decision == "disengage":
                         logger.debug(f"[PROCESS MESSAGES] Persona decided to disengage | session_id={session_id} | user_id={user_id}")
                         await asyncio.sleep(1)
-                        await bot.send_message(chat_id=message.chat.id, text="<i>Персонаж решил уйти...</i>")
-                        await end_session_cleanup(message, state, session, session_manager, timer_manager)
+                        await session_manager.notifier.send(message.chat.id, "<i>Персонаж решил уйти...</i>", priority=Priority.SESSION)
+                        await end_session_cleanup(message, state, sessionmaker, session_manager, timer_manager)
                 finally:
                     typing_task.cancel()
                     try:
@@ -188,24 +193,25 @@ async def process_messages_after_delay(
                     data = await state.get_data()
                     if deque(data.get("message_queue", [])):
                         logger.debug(f"[PROCESS MESSAGES] Processing remaining messages in queue | session_id={session_id} | user_id={user_id}")
-                        await process_messages_after_delay(state, message, session, session_manager, 0, bot, timer_manager)
+                        await process_messages_after_delay(state, message, sessionmaker, session_manager, 0, bot, timer_manager)
             else:
                 # Если персона решила помолчать
                 logger.debug(f"[PROCESS MESSAGES] Persona chose silence | session_id={session_id} | user_id={user_id}")
                 if combined_message == f"*молчание в течение {INACTIVITY_DELAY} секунд...*":
-                    await bot.send_message(chat_id=message.chat.id, text="<i>Персонаж молчит в ответ на ваше молчание.</i>")
+                    await session_manager.notifier.send(message.chat.id, "<i>Персонаж молчит в ответ на ваше молчание.</i>", priority=Priority.SESSION)
                 else:
-                    await bot.send_message(chat_id=message.chat.id, text="<i>Персонаж предпочел не отвечать на это.</i>")
+                    await session_manager.notifier.send(message.chat.id, "<i>Персонаж предпочел не отвечать на это.</i>", priority=Priority.SESSION)
                 responser.update_history("*молчание, ваш персонаж (пациент) предпочел не отвечать*", False)
                 meta_history.append({"role": "Вы (пациент)", "content": "*молчание, ваш персонаж (пациент) предпочел не отвечать*"})
-                if db_user:
+                if user_id:
                     async with session_lock(state):
                         logger.debug(f"Adding silence to history | session_id={session_id} | user_id={user_id}")
                         await session_manager.add_message_to_history(
-                            db_user.id,
+                            user_id,
                             "Персонаж предпочел не отвечать на это.",
                             is_user=False,
-                            tokens_used=total_tokens
+                            tokens_used=total_tokens,
+                            decision=decision
                         )
             # Обновляем состояние и перезапускаем таймеры
             async with session_lock(state):
@@ -226,15 +232,14 @@ async def process_messages_after_delay(
         # Проверяем, нужно ли завершить сессию после ответа
         data = await state.get_data()
         if data.get("should_end_session_after_response", False):
-            await end_session_cleanup(message, state, session, session_manager, timer_manager)
-        session.close()
+            await end_session_cleanup(message, state, sessionmaker, session_manager, timer_manager)
         
         
 async def check_inactivity(
     state: FSMContext,
     message: types.Message,
     delay: int,
-    session: AsyncSession,
+    sessionmaker: async_sessionmaker,
     session_manager: SessionManager,
     bot: Bot,
     timer_manager: TimerManager
@@ -249,7 +254,9 @@ async def check_inactivity(
     try:
         async with session_lock(state):
             # Проверяем, активна ли ещё сессия
-            if not await session_manager.is_session_active(user_id, session):
+            async with sessionmaker() as session:
+                is_active = await session_manager.is_session_active(user_id, session)
+            if not is_active:
                 logger.debug(f"[INACTIVITY CHECK] Session ended before inactivity check | session_id={session_id} | user_id={user_id}")
                 return
                 
@@ -284,11 +291,10 @@ async def check_inactivity(
                 )
                 
                  # Логируем пользовательские сообщения
-                db_user = await get_user(session, telegram_id=message.from_user.id)
-                if db_user:
+                if user_id:
                     logger.debug(f"[INACTIVITY CHECK] Adding user message to history | session_id={session_id} | user_id={user_id}")
                     await session_manager.add_message_to_history(
-                        db_user.id,
+                        user_id,
                         silence_message,
                         is_user=True,
                         tokens_used=0 # Логгированием сообщение пользователя о молчании
@@ -298,7 +304,7 @@ async def check_inactivity(
                 await process_messages_after_delay(
                     state, 
                     message, 
-                    session, 
+                    sessionmaker, 
                     session_manager, 
                     0,  # Немедленная обработка
                     bot, 
@@ -308,7 +314,4 @@ async def check_inactivity(
     except asyncio.CancelledError:
         logger.debug(f"[INACTIVITY CHECK] Inactivity check cancelled | session_id={session_id} | user_id={user_id}")
     except Exception as e:
-        logger.error(f"[INACTIVITY CHECK] Inactivity check error: {e} | session_id={session_id} | user_id={user_id}")
-        
-    finally:
-        session.close()
\ No newline at end of file
+        logger.error(f"[INACTIVITY CHECK] Inactivity check error: {e} | session_id={session_id} | user_id={user_id}")
\ No newline at end of file
@@ -1,17 +1,17 @@
-from aiogram import Router, types, F
+from aiogram import Bot, Router, types, F
 from aiogram.fsm.context import FSMContext
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 from states import MainMenu
 from services.session_manager import SessionManager
-from services.speech_to_text import transcribe_voice
+from services.timer_manager import TimerManager
+from services.speech_to_text import transcribe_voice, TranscriptionCache
 from database.crud import get_user
 from database.models import TariffType   
 import os
 from uuid import uuid4
-from aiogram.types import Message
 
 
-from handlers.session.interaction import session_interaction_handler
+from handlers.session.utils import ingest_user_input
 
 from config import logger
 
@@ -22,15 +22,19 @@ async def handle_voice_message(
     message: types.Message,
     state: FSMContext,
     session: AsyncSession,
+    sessionmaker: async_sessionmaker,
     session_manager: SessionManager,
-    bot
+    transcription_cache: TranscriptionCache,
+    bot: Bot,
+    timer_manager: TimerManager
 ):
     """
     Обрабатывает голосовые сообщения в активной сессии.
     
     Проверяет, есть ли у пользователя активный тариф, и распознает голосовое сообщение.
-    Если тариф PRO или UNLIMITED, то распознает голос и отправляет текст в обработчик сессии.
+    Если тариф PRO или UNLIMITED, то распознает голос и ставит текст в очередь сессии.
     Если тариф неактивен, отправляет сообщение об ошибке.
+    Расшифровки кэшируются по file_unique_id, повторное голосовое не скачивается и не распознается.
     """
     user_data = await get_user(session, telegram_id=message.from_user.id)
     
@@ -40,39 +44,40 @@ async def handle_voice_message(
 
     # Проверка тарифа
     if user_data.active_tariff in [TariffType.PRO, TariffType.UNLIMITED]:
+        # Возвращаем соединение в пул на время скачивания и распознавания
+        await session.close()
         try:
-            # Получаем файл с сервера Telegram
-            file_info = await bot.get_file(message.voice.file_id)
-            
-            # Создать папку если ее нет
-            if not os.path.exists("./tmp"):
-                os.makedirs("./tmp")
+            file_unique_id = message.voice.file_unique_id
+            text = await transcription_cache.get(file_unique_id)
 
-            # Уникальное имя временного файла
-            tmp_path = f"./tmp/{uuid4().hex}.ogg"
+            if text is None:
+                # Получаем файл с сервера Telegram
+                file_info = await bot.get_file(message.voice.file_id)
+                
+                # Создать папку если ее нет
+                if not os.path.exists("./tmp"):
+                    os.makedirs("./tmp")
 
-            # Скачиваем файл
-            await bot.download_file(file_info.file_path, tmp_path)
+                # Уникальное имя временного файла
+                tmp_path = f"./tmp/{uuid4().hex}.ogg"
 
-            # Распознаём голос
-            text = await transcribe_voice(tmp_path)
+                # Скачиваем файл
+                await bot.download_file(file_info.file_path, tmp_path)
 
-            os.remove(tmp_path)  # Удаляем временный файл
+                # Распознаём голос
+                text = await transcribe_voice(tmp_path)
+
+                os.remove(tmp_path)  # Удаляем временный файл
+
+                # Пустой результат не кэшируем, чтобы повторная попытка распознала заново
+                if text.strip():
+                    await transcription_cache.set(file_unique_id, text)
 
             if not text.strip():
                 await message.answer("Не удалось распознать голосовое сообщение.")
                 return
 
-            # Создаём фейковое текстовое сообщение
-            fake_text_message = Message(
-                message_id=message.message_id,
-                date=message.date,
-                chat=message.chat,
-                from_user=message.from_user,
-                message_thread_id=message.message_thread_id,
-                text=text)
-        
-            await session_interaction_handler(fake_text_message, state, session, session_manager, bot=message.bot)
+            await ingest_user_input(text, message, state, sessionmaker, session_manager, bot, timer_manager)
 
         except Exception as e:
             logger.error(f"Error during voice processing: {e}")
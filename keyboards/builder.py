@@ -1,8 +1,9 @@
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from database.models import Tariff, TariffType
+from database.models import TariffType
+from database.crud import encode_session_cursor
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from services.tariff_cache import tariff_cache, PAID_TARIFFS
 
 def main_menu():
     return InlineKeyboardMarkup(inline_keyboard=[
@@ -100,14 +101,8 @@ def back_to_main_keyboard():
     ])
     
 async def subscription_keyboard(session: AsyncSession) -> InlineKeyboardMarkup:
-    """Генерирует клавиатуру с тарифами из БД"""
-    result = await session.execute(
-        select(Tariff)
-        .where(Tariff.is_active == True)
-        .where(Tariff.name.in_([TariffType.START, TariffType.PRO, TariffType.UNLIMITED]))
-        .order_by(Tariff.price)
-    )
-    tariffs = result.scalars().all()
+    """Генерирует клавиатуру с тарифами (из кэша тарифов)"""
+    tariffs = await tariff_cache.get_active(session, PAID_TARIFFS)
     
     buttons = []
     for tariff in tariffs:
@@ -134,13 +129,7 @@ async def subscription_keyboard(session: AsyncSession) -> InlineKeyboardMarkup:
 
 async def subscription_keyboard_when_sessions_left(session: AsyncSession) -> InlineKeyboardMarkup:
     """Клавиатура при исчерпании сессий (без кнопки профиля)"""
-    result = await session.execute(
-        select(Tariff)
-        .where(Tariff.is_active == True)
-        .where(Tariff.name.in_([TariffType.START, TariffType.PRO, TariffType.UNLIMITED]))
-        .order_by(Tariff.price)
-    )
-    tariffs = result.scalars().all()
+    tariffs = await tariff_cache.get_active(session, PAID_TARIFFS)
     
     buttons = []
     for tariff in tariffs:
@@ -172,11 +161,12 @@ def persona_selection_menu(personas: list[str]) -> InlineKeyboardMarkup:
     buttons.append([InlineKeyboardButton(text="🔙 Назад", callback_data="back_to_emotion")])
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
-def sessions_keyboard(sessions: list, page: int = 0, per_page: int = 5):
+def sessions_keyboard(sessions: list, has_prev: bool = False, has_next: bool = False):
+    """Страница списка сессий. Кнопки пагинации несут курсор крайней сессии страницы"""
     builder = InlineKeyboardBuilder()
     
     # Добавляем кнопки для каждой сессии
-    for session in sessions[page*per_page:(page+1)*per_page]:
+    for session in sessions:
         builder.row(
             InlineKeyboardButton(
                 text=f"{session.persona_name or 'Без персонажа'} - {session.started_at.strftime('%d.%m %H:%M')}",
@@ -185,14 +175,22 @@ def sessions_keyboard(sessions: list, page: int = 0, per_page: int = 5):
         )
     
     # Добавляем пагинацию
-    if len(sessions) > per_page:
-        if page > 0:
+    if sessions:
+        if has_prev:
+            first = sessions[0]
             builder.row(
-                InlineKeyboardButton(text="⬅️ Назад", callback_data=f"sessions_page_{page-1}")
+                InlineKeyboardButton(
+                    text="⬅️ Назад",
+                    callback_data=f"sessions_page_p_{encode_session_cursor(first.started_at, first.id)}"
+                )
             )
-        if (page+1)*per_page < len(sessions):
+        if has_next:
+            last = sessions[-1]
             builder.row(
-                InlineKeyboardButton(text="Вперед ➡️", callback_data=f"sessions_page_{page+1}")
+                InlineKeyboardButton(
+                    text="Вперед ➡️",
+                    callback_data=f"sessions_page_n_{encode_session_cursor(last.started_at, last.id)}"
+                )
             )
     
     builder.row(
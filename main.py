@@ -1,19 +1,34 @@
 import asyncio
 from aiogram import Bot, Dispatcher
 from aiogram.fsm.storage.memory import MemoryStorage
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.ext.asyncio import async_sessionmaker
 from services.subscription_checker import check_subscriptions_expiry
 from config import config, DEFAULT_BOT_PROPERTIES, logger
 from database.models import Base
+from database.engine import create_db_engine, log_pool_metrics
+from database.migrations import run_migrations, schema_is_current
+from database.compression import load_dictionaries, refresh_dictionaries
 from handlers import routers
+import signal
 import ssl
+from typing import Optional
 from middlewares.db import DBSessionMiddleware
 from services.session_manager import SessionManager
 from services.achievements import AchievementSystem
 from services.timer_manager import TimerManager
+from services.speech_to_text import TranscriptionCache, get_model
+from services.transcript_writer import TranscriptWriter
+from services.event_bus import EventBus, EventConsumer
+from services.notifier import NotificationDispatcher
+from services.startup import StartupOrchestrator
+from services.webhook import run_webhook
+from services.sharding import ShardRouter, ShardWorker, WorkerPool
+from core.persones.persona_loader import PersonaLoader
+from migrate_personas import migrate_personas
 from pathlib import Path
 import aiohttp
 
+from aiogram.fsm.storage.base import BaseStorage
 from aiogram.fsm.storage.redis import RedisStorage, Redis
 from redis.asyncio import ConnectionPool
 
@@ -24,9 +39,6 @@ async def set_default_commands(bot: Bot):
         BotCommand(command="/start", description="Начать работу / перейти в главное меню"),
     ]
     await bot.set_my_commands(commands)
-    
-async def on_startup(bot: Bot):
-    await set_default_commands(bot)
 
 async def download_ssl_cert():
     cert_dir = Path.home() / ".cloud-certs"
@@ -38,7 +50,7 @@ async def download_ssl_cert():
     # Скачиваем сертификат, если его нет
     if not cert_path.exists():
         cert_url = "https://st.timeweb.com/cloud-static/ca.crt"
-        async with aiohttp.ClientSession() as session:
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10)) as session:
             async with session.get(cert_url) as response:
                 if response.status == 200:
                     with open(cert_path, 'wb') as f:
@@ -51,24 +63,45 @@ async def download_ssl_cert():
     
     return cert_path
 
-async def init_db():
-    logger.debug("database init")
-    cert_path = await download_ssl_cert()
+def create_ssl_context(cert_path: Path) -> ssl.SSLContext:
     # Создаем SSL контекст для подключения
     ssl_ctx = ssl.create_default_context(cafile=cert_path)
     ssl_ctx.verify_mode = ssl.CERT_REQUIRED  # Аналог verify-full
-    
-    engine = create_async_engine(
-        config.DATABASE_URL,
-        # connect_args={
-        #     "ssl": ssl_ctx,
-        # },
-        # pool_pre_ping=True,  # Проверка соединения перед использованием
-        # echo=False,          # Логирование SQL запросов (False для продакшена)
-    )
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-    return engine
+    return ssl_ctx
+
+
+async def init_db(engine):
+    logger.debug("database init")
+    # SSL к БД сейчас не используется (см. connect_args ниже), поэтому сертификат скачивается
+    # отдельным фоновым шагом старта. При включении SSL скачивание нужно вернуть сюда:
+    # engine = create_db_engine(connect_args={"ssl": create_ssl_context(await download_ssl_cert())})
+    if await schema_is_current(engine):
+        logger.info("[STARTUP] Schema is up to date, create_all and migrations skipped")
+    else:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        # Изменения схемы для уже существующих баз (индексы, новые колонки, перенос данных, стандартные тарифы)
+        await run_migrations(engine)
+    await load_dictionaries(engine)
+
+
+async def sync_personas(engine, persona_loader: PersonaLoader):
+    """Синхронизирует персонажей из YAML и загружает каталог (до этого каталог загрузится при первом обращении)"""
+    await migrate_personas(engine)
+    await persona_loader.start()
+
+
+def build_dispatcher(storage: BaseStorage, sessionmaker: async_sessionmaker, **dependencies) -> Dispatcher:
+    """Диспетчер с middleware, роутерами и зависимостями хендлеров (dp['name'])"""
+    dp = Dispatcher(storage=storage)
+    dp.message.middleware(DBSessionMiddleware(sessionmaker))
+    dp.callback_query.middleware(DBSessionMiddleware(sessionmaker))
+    for name, value in dependencies.items():
+        dp[name] = value
+    for router in routers:
+        logger.debug(f"router {router.name} init")
+        dp.include_router(router)
+    return dp
 
 # Установка сертификата
 # mkdir -p ~/.cloud-certs && \
@@ -77,15 +110,7 @@ async def init_db():
 # export PGSSLROOTCERT=$HOME/.cloud-certs/root.crt
 
 
-async def main():
-    engine = await init_db()
-    # Добавляем дефолные тарифы если их нет обновление 0.0.0p+
-    from default_tariffs_create import create_default_tariffs
-    async with async_sessionmaker(engine, expire_on_commit=False)() as session:
-        await create_default_tariffs(session)
-        
-    bot = Bot(token=config.BOT_TOKEN, default=DEFAULT_BOT_PROPERTIES)  
-    
+def create_redis() -> Redis:
     redis_pool = ConnectionPool.from_url(
     config.REDDIS_HOST,
     port=config.REDDIS_PORT,
@@ -93,44 +118,179 @@ async def main():
     password=config.REDDIS_PASSWORD,
     decode_responses=True
     )
-    redis = Redis(connection_pool=redis_pool)
-    storage = RedisStorage(redis=redis)
-    
-    
-    dp = Dispatcher(storage=storage)
-    
-    # Запускаем миграцию персонажей перед стартом бота # обновлние 0.0.0p
-    from migrate_personas import migrate_personas
-    logger.info("Starting personas migration...")
-    await migrate_personas()
-    logger.info("Personas migration completed successfully")
-    
+    return Redis(connection_pool=redis_pool)
+
+
+async def run_bot(shard: Optional[int] = None, shards: int = 1):
+    """
+    Процесс, который обрабатывает апдейты. shard=None - единственный процесс: сам получает апдейты
+    (polling или webhook). Иначе - воркер шарда: читает апдейты своих чатов из очереди в Redis (services/sharding.py)
+    """
+    engine = create_db_engine(
+        # connect_args={
+        #     "ssl": create_ssl_context(cert_path),
+        # },
+    )
     sessionmaker = async_sessionmaker(engine, expire_on_commit=False)
-    dp.message.middleware(DBSessionMiddleware(sessionmaker))
-    dp.callback_query.middleware(DBSessionMiddleware(sessionmaker))
-    dp.startup.register(on_startup)
-    
-    # Фоновая задача по проверке подписок
-    asyncio.create_task(check_subscriptions_expiry(bot, sessionmaker))
-    
-    achievement_system = AchievementSystem(bot, sessionmaker=sessionmaker)
-    session_manager = SessionManager(bot, engine=engine, achievement_system=achievement_system)
-    timer_manager = TimerManager()
-    dp['session_manager'] = session_manager
-    dp['achievement_system'] = achievement_system
-    dp['timer_manager'] = timer_manager
-    
-    for router in routers:
-        logger.debug(f"router {router.name} init")
-        dp.include_router(router)
+    bot = Bot(token=config.BOT_TOKEN, default=DEFAULT_BOT_PROPERTIES)  
+    redis = create_redis()
+    storage = RedisStorage(redis=redis)
+
+    # Все фоновые сообщения пользователям идут через диспетчер с лимитами Telegram.
+    # Лимит на бота общий для всех процессов - делим его между воркерами
+    notifier = NotificationDispatcher(bot, global_rate=config.NOTIFY_GLOBAL_RATE / shards)
+    achievement_system = AchievementSystem(notifier, sessionmaker=sessionmaker)
+    # Ачивки проверяются воркером шины событий, а не в обработчиках апдейтов
+    event_bus = EventBus(redis)
+    achievement_system.subscribe(event_bus)
+    event_consumer = EventConsumer(event_bus)
+    transcript_writer = TranscriptWriter(sessionmaker)
+    session_manager = SessionManager(
+        bot,
+        engine=engine,
+        event_bus=event_bus,
+        notifier=notifier,
+        sessionmaker=sessionmaker,
+        transcript_writer=transcript_writer
+    )
+
+    # Polling начинается, как только готовы БД и Redis. Остальное догружается в фоне:
+    # персонажи из YAML (каталог до этого читается из БД как есть), команды бота, сертификат, модель Whisper.
+    # Воркеры шардов запускаются после миграций и синхронизации персонажей во фронте - им нужен только каталог
+    startup = StartupOrchestrator()
+    startup.add("database", lambda: init_db(engine))
+    startup.add("redis", redis.ping)
+    if shard is None:
+        startup.add(
+            "personas",
+            lambda: sync_personas(engine, session_manager.persona_loader),
+            requires=("database",),
+            critical=False
+        )
+        startup.add("bot_commands", lambda: set_default_commands(bot), critical=False)
+        startup.add("ssl_cert", download_ssl_cert, critical=False)
+    else:
+        startup.add("personas", session_manager.persona_loader.start, requires=("database",), critical=False)
+    if config.WHISPER_PRELOAD:
+        startup.add("whisper", lambda: asyncio.to_thread(get_model), critical=False)
+    await startup.run()
+
+    notifier.start()
+    # Фоновая задача по проверке подписок (при шардировании - в одном воркере)
+    if not shard:
+        asyncio.create_task(check_subscriptions_expiry(notifier, sessionmaker))
+    # Метрики пула соединений БД
+    if config.DB_POOL_METRICS_INTERVAL > 0:
+        asyncio.create_task(log_pool_metrics(engine, config.DB_POOL_METRICS_INTERVAL))
+    # Словари сжатия, обученные после старта (compress_transcripts.py train) - без перезапуска процесса
+    asyncio.create_task(refresh_dictionaries(engine, config.COMPRESSION_DICT_REFRESH_INTERVAL))
+    event_consumer.start()
+    transcript_writer.start()
+
+    dp = build_dispatcher(
+        storage,
+        sessionmaker,
+        session_manager=session_manager,
+        achievement_system=achievement_system,
+        event_bus=event_bus,
+        notifier=notifier,
+        timer_manager=TimerManager(),
+        transcription_cache=TranscriptionCache(redis, ttl=config.STT_CACHE_TTL),
+    )
     
     try:
-        logger.info("Start polling")
-        await dp.start_polling(bot, skip_updates=False)
+        if shard is not None:
+            await run_shard_worker(dp, bot, redis, shard)
+        elif config.BOT_MODE == "webhook":
+            logger.info("Start webhook server")
+            await run_webhook(dp, bot)
+        else:
+            logger.info("Start polling")
+            await dp.start_polling(
+                bot,
+                skip_updates=False,
+                tasks_concurrency_limit=config.UPDATES_CONCURRENCY or None
+            )
     finally:
         logger.info("terminate database process")
+        await startup.cancel()
         await session_manager.cleanup()
+        await session_manager.persona_loader.stop()
+        await event_consumer.stop()
+        await transcript_writer.stop()
+        await notifier.stop()
         await engine.dispose()
 
+
+async def run_shard_worker(dp: Dispatcher, bot: Bot, redis: Redis, shard: int):
+    """Обрабатывает очередь шарда до SIGINT/SIGTERM (их присылает фронт при остановке)"""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass
+    await dp.emit_startup(bot=bot, **dp.workflow_data)
+    try:
+        await ShardWorker(redis, dp, bot, shard).run(stop)
+    finally:
+        await dp.emit_shutdown(bot=bot, **dp.workflow_data)
+        await bot.session.close()
+
+
+def run_worker(shard: int, shards: int):
+    """Точка входа процесса воркера (WorkerPool)"""
+    asyncio.run(run_bot(shard, shards))
+
+
+async def run_front(shards: int):
+    """
+    Фронт шардированного режима: миграции, получение апдейтов (polling или webhook) и раскладка
+    их по очередям шардов. Хендлеры выполняются только в воркерах
+    """
+    engine = create_db_engine()
+    bot = Bot(token=config.BOT_TOKEN, default=DEFAULT_BOT_PROPERTIES)
+    redis = create_redis()
+
+    startup = StartupOrchestrator()
+    startup.add("database", lambda: init_db(engine))
+    startup.add("redis", redis.ping)
+    startup.add("personas", lambda: migrate_personas(engine), requires=("database",), critical=False)
+    startup.add("bot_commands", lambda: set_default_commands(bot), critical=False)
+    startup.add("ssl_cert", download_ssl_cert, critical=False)
+    await startup.run()
+
+    workers = WorkerPool(run_worker, shards)
+    workers.start()
+    shard_router = ShardRouter(redis, shards)
+    shard_router.start()
+    dp = Dispatcher()
+    dp.update.outer_middleware(shard_router)
+    # Роутеры нужны только для списка типов апдейтов (allowed_updates): их хендлеры вызываются в воркерах
+    dp.include_routers(*routers)
+
+    try:
+        if config.BOT_MODE == "webhook":
+            logger.info(f"Start webhook server | {shards} shard workers")
+            await run_webhook(dp, bot)
+        else:
+            logger.info(f"Start polling | {shards} shard workers")
+            # Апдейты раскладываются по очереди, без задач на каждый - так порядок в шардах совпадает с порядком Telegram
+            await dp.start_polling(bot, skip_updates=False, handle_as_tasks=False)
+    finally:
+        logger.info("terminate front process")
+        await shard_router.stop()
+        await workers.stop()
+        await startup.cancel()
+        await engine.dispose()
+
+
+async def main():
+    if config.BOT_WORKERS > 1:
+        await run_front(config.BOT_WORKERS)
+    else:
+        await run_bot()
+
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -1,10 +1,10 @@
 from aiogram import BaseMiddleware
 from aiogram.types import TelegramObject
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.asyncio import async_sessionmaker
 from typing import Callable, Awaitable, Dict, Any
 
 class DBSessionMiddleware(BaseMiddleware):
-    def __init__(self, sessionmaker):
+    def __init__(self, sessionmaker: async_sessionmaker):
         self.sessionmaker = sessionmaker
 
     async def __call__(
@@ -13,6 +13,9 @@ class DBSessionMiddleware(BaseMiddleware):
         event: TelegramObject,
         data: Dict[str, Any]
     ) -> Any:
+        # AsyncSession берет соединение из пула только при первом запросе, отдельная ленивая обертка не нужна
         async with self.sessionmaker() as session:
             data["session"] = session
+            # Фоновые задачи (таймеры сессии) живут дольше хендлера и открывают свои короткие сессии
+            data["sessionmaker"] = self.sessionmaker
             return await handler(event, data)
@@ -1,93 +1,163 @@
+import asyncio
+import datetime
+import hashlib
 import os
 import yaml
 import json
-from typing import Dict, Any
-from sqlalchemy import select
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from typing import Dict, Any, List, Tuple
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
 from database.models import Base, Persona
-from config import config
+from database.engine import create_db_engine
+from core.persones.persona_compiler import compile_persona
 
 PERSONAS_DIR = "persones"
 
-async def migrate_personas():
-    # Initialize database engine
-    engine = create_async_engine(config.DATABASE_URL)
-    
-    # Create tables if they don't exist
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-    
+# libyaml (если установлен) разбирает файлы в разы быстрее чистого Python
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+async def migrate_personas(engine: AsyncEngine):
+    """
+    Синхронизирует персонажей из YAML файлов с БД. Использует движок вызывающего кода, таблицы должны уже существовать.
+
+    Для каждого персонажа в personas.source_hash хранится sha256 его YAML файла. Хэши всех персонажей
+    читаются одним запросом; файлы с известным хэшем пропускаются без разбора, измененные и новые
+    разбираются и записываются одним INSERT ... ON CONFLICT (name) DO UPDATE вместе с собранным артефактом.
+    Персонажи, которых нет в YAML (созданы в админке), не трогаются.
+    """
     async with AsyncSession(engine) as session:
-        # Load all existing personas from YAML files
-        personas_data = load_personas_from_yaml()
-        
-        for persona_name, data in personas_data.items():
-            # Check if persona already exists in DB
-            result = await session.execute(
-                select(Persona).where(Persona.name == persona_name)
-            )  # Fixed: Added missing closing parenthesis
-            existing_persona = result.scalars().first()
-            
-            if existing_persona:
-                print(f"Persona {persona_name} already exists, skipping...")
+        known = {
+            name: source_hash
+            for name, source_hash in (await session.execute(select(Persona.name, Persona.source_hash))).all()
+        }
+        known_hashes = set(known.values())
+
+        # Чтение, хэширование и разбор файлов - вне цикла событий
+        changed, skipped = await asyncio.to_thread(scan_personas_dir, known_hashes)
+
+        rows: Dict[str, Dict[str, Any]] = {}
+        adopted = []
+        for source_hash, data in changed:
+            persona_name = data["persona"]["name"]
+            if persona_name in known and known[persona_name] is None:
+                # Персонаж добавлен до появления source_hash и мог быть отредактирован в админке:
+                # не перезаписываем его, только запоминаем хэш файла. Следующие правки YAML применятся
+                adopted.append({"b_name": persona_name, "b_source_hash": source_hash})
                 continue
-            short_description_parts = []
-            if marital_status := data["persona"].get("marital_status"):
-                short_description_parts.append(f"Семейное положение: {marital_status}")
-            if living_situation := data["persona"].get("living_situation"):
-                short_description_parts.append(f"Проживает: {living_situation}")
-            if education := data["persona"].get("education"):
-                short_description_parts.append(f"Образование: {education}")
-
-            # Create new persona record with proper JSON serialization
+            if persona_name in rows:
+                print(f"Warning! Persona {persona_name} is defined in several files, using the last one")
             try:
-                persona = Persona(
-                    name=persona_name,
-                    age=data["persona"].get("age"),
-                    gender=data["persona"].get("gender"),
-                    profession=data["persona"].get("occupation"),
-                    marital_status=data["persona"].get("marital_status"),
-                    living_situation=data["persona"].get("living_situation"),
-                    education=data["persona"].get("education"),
-                    background=data["background"],
-                    trauma_history=json.dumps(data["trauma_history"], ensure_ascii=False),
-                    current_symptoms=json.dumps(data["current_symptoms"], ensure_ascii=False),
-                    goal_session=data["goal_session"],
-                    tone=json.dumps(data["tone"], ensure_ascii=False),
-                    behaviour_rules=json.dumps(data["behaviour_rules"], ensure_ascii=False),
-                    interaction_guide=json.dumps(data["interaction_guide"], ensure_ascii=False),
-                    self_reports=json.dumps(data["self_reports"], ensure_ascii=False),
-                    escalation=json.dumps(data["escalation"], ensure_ascii=False),
-                    triggers=json.dumps(data["triggers"], ensure_ascii=False),
-                )
-                
-                session.add(persona)
-                await session.commit()
-                print(f"Successfully added persona: {persona_name}")
-            except Exception as e:
-                await session.rollback()
-                print(f"Error adding persona {persona_name}: {str(e)}")
+                rows[persona_name] = persona_row(data, source_hash)
+            except (KeyError, TypeError, ValueError) as e:
+                print(f"Error preparing persona {persona_name}: {str(e)}")
+
+        if adopted:
+            personas = Persona.__table__
+            await session.execute(
+                update(personas)
+                .where(personas.c.name == bindparam("b_name"))
+                .values(source_hash=bindparam("b_source_hash")),
+                adopted
+            )
+        if rows:
+            await upsert_personas(session, list(rows.values()))
+        await session.commit()
+        print(
+            f"Personas sync: {len(rows)} upserted, {len(adopted)} adopted, {skipped} unchanged files skipped"
+        )
+
+        # Артефакты персонажей, отредактированных в обход ORM или собранных старой версией формата
+        recompiled = 0
+        for persona in (await session.execute(select(Persona))).scalars().all():
+            try:
+                if compile_persona(persona):
+                    recompiled += 1
+            except (TypeError, ValueError) as e:
+                print(f"Error compiling persona {persona.name}: {str(e)}")
+        if recompiled:
+            await session.commit()
+            print(f"Compiled {recompiled} persona artefacts")
+
+
+def scan_personas_dir(known_hashes: set) -> Tuple[List[Tuple[str, Dict]], int]:
+    """Возвращает ([(хэш файла, данные)] для новых и измененных файлов, число пропущенных без изменений)"""
+    changed = []
+    skipped = 0
+    if not os.path.exists(PERSONAS_DIR):
+        return changed, skipped
+
+    for filename in sorted(os.listdir(PERSONAS_DIR)):
+        if not filename.endswith((".yml", ".yaml")):
+            continue
+        path = os.path.join(PERSONAS_DIR, filename)
+        try:
+            with open(path, "rb") as f:
+                raw = f.read()
+            source_hash = hashlib.sha256(raw).hexdigest()
+            if source_hash in known_hashes:
+                skipped += 1
                 continue
+            data = yaml.load(raw, Loader=YamlLoader)
+            if validate_persona(data):
+                changed.append((source_hash, data))
+            else:
+                print(f"Warning! Invalid persona format in {filename}")
+        except Exception as e:
+            print(f"Error loading {filename}: {str(e)}")
+    return changed, skipped
+
+
+def persona_row(data: Dict[str, Any], source_hash: str) -> Dict[str, Any]:
+    """Строка personas из YAML с собранным артефактом"""
+    persona = Persona(
+        name=data["persona"]["name"],
+        age=data["persona"].get("age"),
+        gender=data["persona"].get("gender"),
+        profession=data["persona"].get("occupation"),
+        marital_status=data["persona"].get("marital_status"),
+        living_situation=data["persona"].get("living_situation"),
+        education=data["persona"].get("education"),
+        background=data["background"],
+        trauma_history=json.dumps(data["trauma_history"], ensure_ascii=False),
+        current_symptoms=json.dumps(data["current_symptoms"], ensure_ascii=False),
+        goal_session=data["goal_session"],
+        tone=json.dumps(data["tone"], ensure_ascii=False),
+        behaviour_rules=json.dumps(data["behaviour_rules"], ensure_ascii=False),
+        interaction_guide=json.dumps(data["interaction_guide"], ensure_ascii=False),
+        self_reports=json.dumps(data["self_reports"], ensure_ascii=False),
+        escalation=json.dumps(data["escalation"], ensure_ascii=False),
+        triggers=json.dumps(data["triggers"], ensure_ascii=False),
+        source_hash=source_hash,
+    )
+    # Массовая вставка идет мимо событий ORM, поэтому артефакт собираем здесь
+    compile_persona(persona)
+    return {
+        column.key: getattr(persona, column.key)
+        for column in Persona.__table__.columns
+        if column.key not in ("id", "is_active", "created_at", "updated_at")
+    }
+
+
+async def upsert_personas(session: AsyncSession, rows: List[Dict[str, Any]]):
+    """Вставляет новых персонажей и обновляет существующих (по имени) одним запросом"""
+    insert = pg_insert if session.get_bind().dialect.name == "postgresql" else sqlite_insert
+    now = datetime.datetime.utcnow()
+    stmt = insert(Persona).values([{**row, "created_at": now} for row in rows])
+    update_columns = {key: stmt.excluded[key] for key in rows[0] if key != "name"}
+    # onupdate колонки не применяется к ON CONFLICT DO UPDATE - выставляем updated_at явно,
+    # по нему PersonaLoader замечает изменение каталога
+    update_columns["updated_at"] = now
+    await session.execute(stmt.on_conflict_do_update(index_elements=["name"], set_=update_columns))
+
 
 def load_personas_from_yaml() -> Dict[str, Dict]:
-    personas = {}
-    if not os.path.exists(PERSONAS_DIR):
-        return personas
-    
-    for filename in os.listdir(PERSONAS_DIR):
-        if filename.endswith((".yml", ".yaml")):  # Combined file extensions check
-            path = os.path.join(PERSONAS_DIR, filename)
-            try:
-                with open(path, encoding="utf-8") as f:
-                    data = yaml.safe_load(f)
-                    if validate_persona(data):
-                        key = data["persona"]["name"]
-                        personas[key] = data
-                    else:
-                        print(f"Warning! Invalid persona format in {filename}")
-            except Exception as e:
-                print(f"Error loading {filename}: {str(e)}")
-    return personas
+    """Все персонажи из YAML файлов по имени (без учета хэшей)"""
+    changed, _ = scan_personas_dir(set())
+    return {data["persona"]["name"]: data for _, data in changed}
+
 
 def validate_persona(data: Dict[str, Any]) -> bool:
     required_top_keys = {
@@ -95,12 +165,21 @@ def validate_persona(data: Dict[str, Any]) -> bool:
         "goal_session", "tone", "behaviour_rules", "interaction_guide",
         "self_reports", "escalation", "triggers"
     }
-    if not all(k in data for k in required_top_keys):
+    if not isinstance(data, dict) or not all(k in data for k in required_top_keys):
         return False
     if "name" not in data["persona"]:
         return False
     return True
 
+async def _run_standalone():
+    engine = create_db_engine()
+    try:
+        # Create tables if they don't exist
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        await migrate_personas(engine)
+    finally:
+        await engine.dispose()
+
 if __name__ == "__main__":
-    import asyncio
-    asyncio.run(migrate_personas())
\ No newline at end of file
+    asyncio.run(_run_standalone())
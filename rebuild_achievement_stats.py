@@ -0,0 +1,61 @@
+"""
+Пересборка счетчиков ачивок (user_achievement_stats) из истории сессий.
+
+Счетчики обновляются инкрементально при завершении сессии; пользователю без строки счетчиков
+она собирается при первой проверке. Команда нужна, чтобы заполнить таблицу заранее
+или починить счетчики после ручных правок в sessions.
+
+    python rebuild_achievement_stats.py [--user-id 42] [--batch 200]
+"""
+import argparse
+import asyncio
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from database.engine import create_db_engine
+from database.models import Session
+from services.achievements import AchievementSystem
+
+
+async def rebuild(sessionmaker: async_sessionmaker, user_id: int = None, batch: int = 200):
+    achievement_system = AchievementSystem(notifier=None, sessionmaker=sessionmaker)
+    rebuilt = 0
+    last_user_id = 0
+    while True:
+        async with sessionmaker() as session:
+            if user_id is not None:
+                user_ids = [user_id] if last_user_id == 0 else []
+            else:
+                user_ids = (await session.execute(
+                    select(Session.user_id)
+                    .where(Session.user_id > last_user_id)
+                    .distinct()
+                    .order_by(Session.user_id)
+                    .limit(batch)
+                )).scalars().all()
+            if not user_ids:
+                break
+
+            for uid in user_ids:
+                await achievement_system.rebuild_user_stats(session, uid)
+            await session.commit()
+            rebuilt += len(user_ids)
+            last_user_id = user_ids[-1]
+            print(f"Rebuilt stats for {rebuilt} users (last user_id {last_user_id})")
+    print(f"Done, users: {rebuilt}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Пересборка счетчиков ачивок")
+    parser.add_argument("--user-id", type=int, help="Только один пользователь (id в users)")
+    parser.add_argument("--batch", type=int, default=200, help="Пользователей в одной транзакции")
+    args = parser.parse_args()
+
+    engine = create_db_engine()
+    try:
+        await rebuild(async_sessionmaker(engine, expire_on_commit=False), args.user_id, args.batch)
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
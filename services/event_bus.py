@@ -0,0 +1,176 @@
+import asyncio
+import datetime
+import json
+import os
+import socket
+from enum import Enum as PyEnum
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from redis.asyncio import Redis
+from redis.exceptions import RedisError, ResponseError
+from config import config, logger
+
+
+class EventType(PyEnum):
+    SESSION_ENDED = "session_ended"          # user_id, session_id, started_at, resistance_level, emotional, persona_id
+    FEEDBACK_SUBMITTED = "feedback_submitted"  # user_id
+    REFERRAL_JOINED = "referral_joined"      # inviter_id, invited_user_id
+
+
+EventHandler = Callable[[EventType, Dict], Awaitable[None]]
+
+
+def _encode(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+# --- Шина доменных событий ---
+# События пишутся в Redis Stream и обрабатываются воркером (EventConsumer) в группе потребителей,
+# поэтому проверки ачивок и уведомления не задерживают ответ пользователю.
+# Доставка "хотя бы один раз": событие подтверждается (XACK) только после успешной обработки,
+# необработанные события забираются повторно через EVENTS_CLAIM_IDLE_MS. Обработчики должны быть
+# идемпотентными (уникальный индекс на ачивки, sessions.achievements_counted для счетчиков).
+class EventBus:
+    def __init__(self, redis: Redis, stream: str = config.EVENTS_STREAM, maxlen: int = config.EVENTS_STREAM_MAXLEN):
+        self.redis = redis
+        self.stream = stream
+        self.maxlen = maxlen
+        self.handlers: Dict[EventType, List[EventHandler]] = {}
+        self.fallback_tasks = set()
+
+    def subscribe(self, event_type: EventType, handler: EventHandler):
+        self.handlers.setdefault(event_type, []).append(handler)
+
+    async def publish(self, event_type: EventType, payload: Dict) -> Optional[str]:
+        """Публикует событие. Возвращает id события в потоке"""
+        fields = {"type": event_type.value, "payload": json.dumps(payload, default=_encode)}
+        try:
+            event_id = await self.redis.xadd(self.stream, fields, maxlen=self.maxlen, approximate=True)
+            logger.debug(f"[EVENTS] Published {event_type.value} | id={event_id} | payload={fields['payload']}")
+            return event_id
+        except RedisError as e:
+            # Redis недоступен: не теряем событие, обрабатываем его в этом процессе в фоне
+            logger.error(f"[EVENTS] Publish {event_type.value} failed, handling in-process: {e!r}")
+            task = asyncio.create_task(self.dispatch(event_type, json.loads(fields["payload"])))
+            self.fallback_tasks.add(task)
+            task.add_done_callback(self.fallback_tasks.discard)
+            return None
+
+    async def dispatch(self, event_type: EventType, payload: Dict):
+        """Вызывает обработчики события. Исключение обработчика пробрасывается - событие не будет подтверждено"""
+        for handler in self.handlers.get(event_type, []):
+            await handler(event_type, payload)
+
+
+class EventConsumer:
+    """Воркер группы потребителей: читает события из потока, вызывает обработчики шины и подтверждает их"""
+    def __init__(
+        self,
+        bus: EventBus,
+        group: str = config.EVENTS_GROUP,
+        consumer: Optional[str] = None,
+        batch_size: int = config.EVENTS_BATCH_SIZE,
+        claim_idle_ms: int = config.EVENTS_CLAIM_IDLE_MS,
+        max_deliveries: int = config.EVENTS_MAX_DELIVERIES,
+        block_ms: int = 5000
+    ):
+        self.bus = bus
+        self.redis = bus.redis
+        self.stream = bus.stream
+        self.group = group
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+        self.batch_size = batch_size
+        self.claim_idle_ms = claim_idle_ms
+        self.max_deliveries = max_deliveries
+        self.block_ms = block_ms
+        self.task: Optional[asyncio.Task] = None
+        self.stopping = False
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.stopping = False
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Дожидается обработки текущего пакета. Неподтвержденные события заберет другой воркер или следующий запуск"""
+        self.stopping = True
+        if self.task:
+            try:
+                await asyncio.wait_for(self.task, timeout=self.block_ms / 1000 + 5)
+            except asyncio.TimeoutError:
+                self.task.cancel()
+            self.task = None
+
+    async def _ensure_group(self):
+        try:
+            await self.redis.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+            logger.info(f"[EVENTS] Created consumer group {self.group} on {self.stream}")
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def _run(self):
+        logger.info(f"[EVENTS] Consumer {self.consumer} started | group={self.group} | stream={self.stream}")
+        group_ready = False
+        while not self.stopping:
+            try:
+                if not group_ready:
+                    await self._ensure_group()
+                    group_ready = True
+                # Сначала события, которые давно взял и не подтвердил другой (упавший) воркер
+                _, claimed, *_ = await self.redis.xautoclaim(
+                    self.stream, self.group, self.consumer,
+                    min_idle_time=self.claim_idle_ms, start_id="0-0", count=self.batch_size
+                )
+                if claimed:
+                    await self._process(claimed, redelivered=True)
+
+                response = await self.redis.xreadgroup(
+                    self.group, self.consumer, {self.stream: ">"},
+                    count=self.batch_size, block=self.block_ms
+                )
+                for _, messages in response or []:
+                    await self._process(messages)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[EVENTS] Consumer loop error: {e!r}", exc_info=True)
+                group_ready = False
+                await asyncio.sleep(5)
+        logger.info(f"[EVENTS] Consumer {self.consumer} stopped")
+
+    async def _process(self, messages: List[Tuple[str, Dict]], redelivered: bool = False):
+        for event_id, fields in messages:
+            if not fields:
+                # Событие вытеснено из потока (MAXLEN) - снимаем его из списка ожидающих
+                await self.redis.xack(self.stream, self.group, event_id)
+                continue
+            try:
+                event_type = EventType(fields["type"])
+                payload = json.loads(fields["payload"])
+            except (KeyError, ValueError) as e:
+                logger.error(f"[EVENTS] Malformed event {event_id}: {e!r} | fields={fields}")
+                await self._dead_letter(event_id, fields, "malformed")
+                continue
+
+            if redelivered and await self._deliveries(event_id) > self.max_deliveries:
+                logger.error(f"[EVENTS] Event {event_id} {event_type.value} exceeded {self.max_deliveries} deliveries")
+                await self._dead_letter(event_id, fields, "max_deliveries")
+                continue
+
+            try:
+                await self.bus.dispatch(event_type, payload)
+                await self.redis.xack(self.stream, self.group, event_id)
+                logger.debug(f"[EVENTS] Handled {event_type.value} | id={event_id}")
+            except Exception as e:
+                # Не подтверждаем: событие будет повторно забрано через claim_idle_ms
+                logger.error(f"[EVENTS] Handler failed for {event_type.value} | id={event_id}: {e!r}", exc_info=True)
+
+    async def _deliveries(self, event_id: str) -> int:
+        pending = await self.redis.xpending_range(self.stream, self.group, min=event_id, max=event_id, count=1)
+        return pending[0]["times_delivered"] if pending else 0
+
+    async def _dead_letter(self, event_id: str, fields: Dict, reason: str):
+        await self.redis.xadd(f"{self.stream}:dead", {**fields, "event_id": event_id, "reason": reason})
+        await self.redis.xack(self.stream, self.group, event_id)
@@ -0,0 +1,235 @@
+import asyncio
+import itertools
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Any, Deque, Dict, List, Optional
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError
+)
+from aiogram.types import Message
+from config import config, logger
+
+
+class Priority(IntEnum):
+    """Полосы приоритета: меньше значение - раньше отправка"""
+    SESSION = 0   # Ответы персонажа и сообщения активной сессии
+    SERVICE = 1   # Уведомления по действиям пользователя: ачивки, рефералы, конец сессии
+    BULK = 2      # Массовые рассылки: истечение подписок, предупреждения
+
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не больше capacity подряд"""
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self) -> float:
+        """Сколько ждать до следующего токена (0 - токен есть)"""
+        self._refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self._refill()
+        self.tokens -= 1
+
+    def pause(self, seconds: float):
+        """Запрещает отправку на seconds секунд (ответ 429 от Telegram)"""
+        self._refill()
+        self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+    @property
+    def idle(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+
+@dataclass
+class _Job:
+    chat_id: int
+    text: str
+    kwargs: Dict[str, Any]
+    priority: Priority
+    future: Optional[asyncio.Future] = None
+    attempts: int = 0
+
+
+@dataclass
+class _Chat:
+    bucket: TokenBucket
+    jobs: Deque[_Job] = field(default_factory=deque)
+    busy: bool = False  # Чат уже стоит в очереди готовых или отправляется воркером
+
+
+# --- Диспетчер исходящих сообщений ---
+# Все фоновые отправки (ачивки, рефералы, подписки, конец сессии, ответы персонажа) идут через одну очередь.
+# Ограничения Telegram соблюдаются двумя ведрами токенов: общим на бота и своим на каждый чат.
+# В очереди готовых стоят чаты, а не сообщения: у каждого чата не больше одной отправки одновременно,
+# поэтому сообщения одного чата уходят строго в порядке постановки, а разные чаты отправляются параллельно.
+# Приоритет чата в очереди - приоритет его первого сообщения. Чат, у которого кончились свои токены, уходит из
+# очереди по таймеру и не занимает воркер; воркер ждет только общее ведро бота.
+class NotificationDispatcher:
+    def __init__(
+        self,
+        bot: Bot,
+        global_rate: float = config.NOTIFY_GLOBAL_RATE,
+        chat_rate: float = config.NOTIFY_CHAT_RATE,
+        chat_burst: int = config.NOTIFY_CHAT_BURST,
+        workers: int = config.NOTIFY_WORKERS,
+        max_retries: int = config.NOTIFY_MAX_RETRIES
+    ):
+        self.bot = bot
+        # Без накопления: в любом окне в секунду уходит не больше global_rate сообщений
+        self.global_bucket = TokenBucket(global_rate, 1)
+        self.global_lock = asyncio.Lock()
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.workers_count = workers
+        self.max_retries = max_retries
+        self.chats: Dict[int, _Chat] = {}
+        self.ready: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self.deferred: Dict[int, asyncio.TimerHandle] = {}  # Чаты, ждущие токен своего ведра вне очереди готовых
+        self.seq = itertools.count()
+        self.workers: List[asyncio.Task] = []
+
+    def start(self):
+        """Запускает воркеры отправки"""
+        if not self.workers:
+            self.workers = [asyncio.create_task(self._worker(i)) for i in range(self.workers_count)]
+
+    async def stop(self, timeout: float = 10):
+        """Дожидается отправки очереди (не дольше timeout секунд) и останавливает воркеры"""
+        try:
+            await asyncio.wait_for(self.ready.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pending = sum(len(chat.jobs) for chat in self.chats.values())
+            logger.warning(f"[NOTIFY] Stopping with {pending} unsent messages")
+        for handle in self.deferred.values():
+            handle.cancel()
+        self.deferred = {}
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+    def send_nowait(self, chat_id: int, text: str, priority: Priority = Priority.SERVICE, **kwargs):
+        """Ставит сообщение в очередь без ожидания отправки. kwargs передаются в bot.send_message"""
+        self._enqueue(_Job(chat_id, text, kwargs, priority))
+
+    async def send(
+        self,
+        chat_id: int,
+        text: str,
+        priority: Priority = Priority.SERVICE,
+        **kwargs
+    ) -> Optional[Message]:
+        """Ставит сообщение в очередь и ждет отправки. Возвращает сообщение или None, если отправить не удалось"""
+        job = _Job(chat_id, text, kwargs, priority, future=asyncio.get_running_loop().create_future())
+        self._enqueue(job)
+        return await job.future
+
+    def _enqueue(self, job: _Job):
+        chat = self.chats.get(job.chat_id)
+        if chat is None:
+            chat = self.chats[job.chat_id] = _Chat(TokenBucket(self.chat_rate, self.chat_burst))
+        chat.jobs.append(job)
+        if not chat.busy:
+            chat.busy = True
+            self.ready.put_nowait((job.priority, next(self.seq), job.chat_id))
+
+    async def _acquire_global(self):
+        """Ждет общий токен бота. Это единственное ожидание, которое занимает воркер"""
+        async with self.global_lock:
+            while (delay := self.global_bucket.delay()) > 0:
+                await asyncio.sleep(delay)
+            self.global_bucket.take()
+
+    async def _worker(self, number: int):
+        while True:
+            _, _, chat_id = await self.ready.get()
+            chat = self.chats[chat_id]
+            delay = chat.bucket.delay()
+            if delay > 0:
+                # Ведро чата пусто: чат вернется в очередь готовых по таймеру, воркер свободен для других чатов.
+                # task_done - в _resume после повторной постановки, иначе stop() решит, что очередь пуста
+                self.deferred[chat_id] = asyncio.get_running_loop().call_later(delay, self._resume, chat_id)
+                continue
+            try:
+                job = chat.jobs[0]
+                chat.bucket.take()
+                await self._acquire_global()
+                if await self._deliver(job):
+                    chat.jobs.popleft()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[NOTIFY] Worker {number} error | chat_id={chat_id}: {e!r}", exc_info=True)
+                self._finish(chat.jobs.popleft(), None)
+            finally:
+                # Чат возвращается в очередь до task_done, иначе stop() решит, что очередь пуста
+                if chat.jobs:
+                    self.ready.put_nowait((chat.jobs[0].priority, next(self.seq), chat_id))
+                else:
+                    chat.busy = False
+                    asyncio.get_running_loop().call_later(self.chat_burst / self.chat_rate, self._forget, chat_id)
+                self.ready.task_done()
+
+    def _resume(self, chat_id: int):
+        """Возвращает отложенный чат в очередь готовых (у него уже есть токен)"""
+        del self.deferred[chat_id]
+        chat = self.chats[chat_id]
+        self.ready.put_nowait((chat.jobs[0].priority, next(self.seq), chat_id))
+        self.ready.task_done()
+
+    def _forget(self, chat_id: int):
+        """Удаляет состояние чата, когда его ведро снова полное и сообщений нет"""
+        chat = self.chats.get(chat_id)
+        if chat is None or chat.busy:
+            return
+        if chat.bucket.idle:
+            del self.chats[chat_id]
+        else:
+            asyncio.get_running_loop().call_later(self.chat_burst / self.chat_rate, self._forget, chat_id)
+
+    async def _deliver(self, job: _Job) -> bool:
+        """Одна попытка отправки. False - сообщение остается первым в очереди чата для повтора"""
+        try:
+            message = await self.bot.send_message(job.chat_id, job.text, **job.kwargs)
+            self._finish(job, message)
+            return True
+        except TelegramRetryAfter as e:
+            # Telegram сам говорит, сколько ждать: придерживаем чат и весь бот
+            logger.warning(f"[NOTIFY] Flood control, retry after {e.retry_after}s | chat_id={job.chat_id}")
+            self.chats[job.chat_id].bucket.pause(e.retry_after)
+            self.global_bucket.pause(e.retry_after)
+            return False
+        except TelegramForbiddenError as e:
+            logger.info(f"[NOTIFY] Bot is blocked or chat unavailable | chat_id={job.chat_id}: {e.message}")
+        except (TelegramNetworkError, TelegramServerError) as e:
+            job.attempts += 1
+            if job.attempts <= self.max_retries:
+                logger.warning(f"[NOTIFY] Send failed, attempt {job.attempts}/{self.max_retries} | chat_id={job.chat_id}: {e!r}")
+                self.chats[job.chat_id].bucket.pause(2 ** job.attempts)
+                return False
+            logger.error(f"[NOTIFY] Giving up after {job.attempts} attempts | chat_id={job.chat_id}: {e!r}")
+        except Exception as e:
+            logger.error(f"[NOTIFY] Error sending message | chat_id={job.chat_id}: {e!r}")
+        self._finish(job, None)
+        return True
+
+    @staticmethod
+    def _finish(job: _Job, message: Optional[Message]):
+        if job.future is not None and not job.future.done():
+            job.future.set_result(message)
@@ -8,8 +8,8 @@ from database.crud import (
     get_user_by_id
 )
 from datetime import datetime
-from aiogram import Bot
 from config import logger
+from services.notifier import NotificationDispatcher
 
 
 async def process_referral_code(session: AsyncSession, code: str) -> User | None:
@@ -54,7 +54,7 @@ async def create_new_user_with_referral(
     return user
 
 
-async def handle_referral_bonus(session: AsyncSession, new_user: User, referrer: User, bot: Bot):
+async def handle_referral_bonus(session: AsyncSession, new_user: User, referrer: User, notifier: NotificationDispatcher):
     try:
         # Проверим, не существует ли уже запись
         existing_referral = await session.execute(
@@ -82,12 +82,12 @@ async def handle_referral_bonus(session: AsyncSession, new_user: User, referrer:
             f"По вашей ссылке зарегистрировался: {username_info}\n"
             f"Как только он оформит подписку — вы получите бесплатную сессию!"
         )
-        await bot.send_message(chat_id=referrer.telegram_id, text=text, parse_mode="HTML")
+        notifier.send_nowait(referrer.telegram_id, text, parse_mode="HTML")
     except Exception as e:
         await session.rollback()
         logger.error(f"Referral bonus error: {e}")
 
-async def process_referral_bonus_after_payment(session: AsyncSession, user_id: int, bot: Bot):
+async def process_referral_bonus_after_payment(session: AsyncSession, user_id: int, notifier: NotificationDispatcher):
     referral_stmt = select(Referral).where(Referral.invited_user_id == user_id)
     referral_result = await session.execute(referral_stmt)
     referral = referral_result.scalar_one_or_none()
@@ -116,6 +116,6 @@ async def process_referral_bonus_after_payment(session: AsyncSession, user_id: i
         f"Пользователь, которого вы пригласили: {username_info}\n приобрел подписку!"
         f"Вы получите бесплатную сессию в награду!"
     )
-    await bot.send_message(chat_id=referrer.telegram_id, text=text, parse_mode="HTML")
-
     await session.commit()
+    # Уведомляем только после фиксации бонуса
+    notifier.send_nowait(referrer.telegram_id, text, parse_mode="HTML")
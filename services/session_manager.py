@@ -2,34 +2,48 @@ from datetime import datetime, timedelta
 from typing import Optional, Dict, Tuple
 import asyncio
 from aiogram import Bot
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy import select, func, update
+from sqlalchemy.orm.attributes import set_committed_value
 from database.models import Session
-from database.models import Tariff, TariffType, Session, Order
+from database.models import TariffType, Session, Order, SessionTranscript, SessionMessage, User
 from database.crud import get_user_by_id, get_telegram_id_by_user_id
 from keyboards.builder import main_menu
 from texts.common import BACK_TO_MENU_TEXT
 from config import logger 
-import json
 from config import config
 from asyncio import Lock
 from core.persones.persona_loader import PersonaLoader
 from core.reports.supervision_report_builder import SupervisionReportBuilder
 from core.reports.supervision_report_builder_low_cost import SimpleSupervisionReportBuilder
-from services.achievements import AchievementSystem
+from services.event_bus import EventBus, EventType
+from services.notifier import NotificationDispatcher, Priority
+from services.transcript_writer import TranscriptWriter
+from services.tariff_cache import tariff_cache, TariffInfo
 
 
 # --- Менеджер сессий ---
 # Осуществляет управление сессиями: начало, окончание, нотификация юзера, хранение данных сессии и их запись в БД
 class SessionManager:
-    def __init__(self, bot: Bot, engine, achievement_system: AchievementSystem):
+    def __init__(
+        self,
+        bot: Bot,
+        engine,
+        event_bus: EventBus,
+        notifier: NotificationDispatcher,
+        sessionmaker: async_sessionmaker,
+        transcript_writer: TranscriptWriter
+    ):
         self.bot = bot            # Инстанс бот
+        self.sessionmaker = sessionmaker # Фабрика сессий БД для фоновых задач (таймер сессии живет дольше хендлера)
         self.active_checks = {}   # Список активных сессий для таймера
-        self.message_history = {} # История сообщений - юзера и персоны
+        self.message_history = {} # Данные активной сессии пользователя (id сессии, токены); сами реплики - в session_messages
         self.session_ended = {}   # Флаг окончания сессии для каждого пользователя
         self.lock = Lock()
         self.persona_loader = PersonaLoader(engine)
-        self.achievement_system = achievement_system
+        self.event_bus = event_bus # Доменные события (ачивки обрабатывает воркер шины)
+        self.notifier = notifier   # Исходящие сообщения с учетом лимитов Telegram
+        self.transcript_writer = transcript_writer # Пакетная запись реплик в session_messages
 
     async def start_session(
         self,
@@ -69,8 +83,6 @@ class SessionManager:
         
         # Инициализируем историю сообщений для пользователя
         self.message_history[user_id] = {
-            'user_messages': [],
-            'bot_messages': [],
             'session_id': db_sess.id,
             'persona_id': None,
             'tokens_spent': 0
@@ -81,7 +93,7 @@ class SessionManager:
         
         # Запускаем фоновую задачу для проверки времени
         self.active_checks[user_id] = asyncio.create_task(
-            self._check_session_timeout(user_id, db_sess.id, expires_at, db_session)
+            self._check_session_timeout(user_id, db_sess.id, expires_at)
         )
         
         logger.info(f"Session started for user {user_id}. Duration: {config.SESSION_LENGTH_MINUTES} minutes. "
@@ -95,14 +107,16 @@ class SessionManager:
     async def get_all_personas(self) -> Dict[str, Dict]:
         return await self.persona_loader.load_all_personas()
     
-    async def _send_warning(self, user_id: int, session_id: int, db_session: AsyncSession):
+    async def _send_warning(self, user_id: int, session_id: int):
         """Отправляет предупреждение за N минут до конца"""
         try:
             if user_id in self.message_history and not self.session_ended.get(user_id, False):
                 session_data = self.message_history[user_id]
-                stmt = select(Session).where(Session.id == session_data['session_id'])
-                result = await db_session.execute(stmt)
-                session = result.scalar_one_or_none()
+                async with self.sessionmaker() as db_session:
+                    stmt = select(Session).where(Session.id == session_data['session_id'])
+                    result = await db_session.execute(stmt)
+                    session = result.scalar_one_or_none()
+                    telegram_id = await get_telegram_id_by_user_id(db_session, user_id) if session else None
                 
                 if session:
                     time_left = session.expires_at - datetime.utcnow()
@@ -111,14 +125,13 @@ class SessionManager:
                     warning_msg = (
                         f"⏳ Осталось {minutes_left + 1} минут до окончания сессии.\n" # с учетом округления в меньшую сторону + 1
                     )
-                    telegram_id = await get_telegram_id_by_user_id(db_session, user_id)
-                    await self.bot.send_message(telegram_id, warning_msg)
+                    await self.notifier.send(telegram_id, warning_msg, priority=Priority.SESSION)
                     logger.info(f"Warning sent to user {user_id} ({minutes_left + 1} minutes left)")
         except Exception as e:
             logger.error(f"Error sending warning message: {e}")
 
-    async def _check_session_timeout(self, user_id: int, session_id: int, expires_at: datetime, db_session: AsyncSession):
-        """Фоновая задача для проверки времени сессии"""
+    async def _check_session_timeout(self, user_id: int, session_id: int, expires_at: datetime):
+        """Фоновая задача для проверки времени сессии. Сессию БД открывает только на время запросов"""
         try:
             # Логгируем время до конца сессии
             time_left = (expires_at - datetime.utcnow()).total_seconds()
@@ -138,7 +151,7 @@ class SessionManager:
                     logger.info(f"Skipping warning for user {user_id} because session was aborted.")
                     return
                 # Предупреждаем
-                await self._send_warning(user_id, session_id, db_session)
+                await self._send_warning(user_id, session_id)
                     
             # Ожидаем оставшееся время
             time_left = (expires_at - datetime.utcnow()).total_seconds()
@@ -146,7 +159,8 @@ class SessionManager:
                 logger.info(f"Waiting {time_left} seconds until session end for user {user_id}")
                 await asyncio.sleep(time_left)
             # Завершаем сессиию
-            await self.end_session(user_id, session_id, db_session, )
+            async with self.sessionmaker() as db_session:
+                await self.end_session(user_id, session_id, db_session)
             
         except asyncio.CancelledError:
             logger.info(f"Session check cancelled for user {user_id}")
@@ -162,6 +176,13 @@ class SessionManager:
                 if self.session_ended.get(user_id, False):
                     return False
 
+                # Дописываем в базу реплики, которые еще в буфере. До блокировки строки сессии:
+                # вставка в session_messages проверяет внешний ключ на sessions и ждала бы FOR UPDATE ниже
+                try:
+                    await self.transcript_writer.flush()
+                except Exception as e:
+                    logger.error(f"Error flushing transcript for session {session_id}: {e}")
+
                 # Получаем сессию с явным указанием на необходимости обновления
                 stmt = select(Session).where(
                     Session.id == session_id,
@@ -182,16 +203,16 @@ class SessionManager:
                         logger.warning(f"User {user_id} not found")
                         return False
                     
-                    # Подготовка данных для отчета
-                    history = self.message_history.get(user_id, {})
-                    user_messages = history.get('user_messages', [])
-                    bot_messages = history.get('bot_messages', [])
-                    
-                    # Собираем историю сессии для отчета
-                    session_history = []
-                    for user_msg, bot_msg in zip(user_messages, bot_messages):
-                        session_history.append({"role": "Терапевт", "content": user_msg})
-                        session_history.append({"role": "Пациент", "content": bot_msg})
+                    # Собираем историю сессии для отчета в порядке реплик (без попарной склейки)
+                    rows = await db_session.execute(
+                        select(SessionMessage.role, SessionMessage.content)
+                        .where(SessionMessage.session_id == session_id)
+                        .order_by(SessionMessage.seq)
+                    )
+                    session_history = [
+                        {"role": "Терапевт" if role == "user" else "Пациент", "content": content}
+                        for role, content in rows
+                    ]
                     
                     # Генерируем отчет, если есть имя персоны
                     report_text = None
@@ -273,7 +294,8 @@ class SessionManager:
                     history = self.message_history.get(user_id, {})
                     session.ended_at = datetime.utcnow()
                     session.is_active = False
-                    session.report_text = report_text
+                    # Отчет пишется в отдельную таблицу, строка сессии остается узкой
+                    transcript = SessionTranscript(session_id=session.id, report_text=report_text)
                     
                     # Отправляем отчет пользователю, если он сгенерирован
                     if report_text:
@@ -282,27 +304,20 @@ class SessionManager:
                             chunk_size = 4000
                             report_chunks = [report_text[i:i+chunk_size] for i in range(0, len(report_text), chunk_size)]
                             
+                            # Паузы между частями выдерживает диспетчер (лимит сообщений в чат)
                             for chunk in report_chunks:
-                                await self.bot.send_message(
+                                await self.notifier.send(
                                     telegram_id,
                                     chunk,
+                                    priority=Priority.SESSION,
                                     parse_mode="HTML"
                                 )
-                                # Небольшая пауза между сообщениями
-                                await asyncio.sleep(0.5)
                                 
                             logger.info(f"Report sent to user {user_id} in {len(report_chunks)} parts")
                         except Exception as e:
                             logger.error(f"Error sending report: {e}")
                     
-                    try:
-                        session.user_messages = json.dumps(history.get('user_messages', []), ensure_ascii=False)
-                        session.bot_messages = json.dumps(history.get('bot_messages', []), ensure_ascii=False)
-                    except Exception as e:
-                        logger.error(f"Error serializing messages: {e}")
-                        # Сохраняем хотя бы информацию об ошибке
-                        session.user_messages = "[]"
-                        session.bot_messages = "[]"
+                    await db_session.merge(transcript)
                     
                     session.tokens_spent = history.get('tokens_spent', 0) + report_tokens
                     
@@ -326,6 +341,7 @@ class SessionManager:
                     # Очищаем данные только после успешного коммита
                     if user_id in self.message_history:
                         del self.message_history[user_id]
+                    self.transcript_writer.forget(session_id)
                     
                     # Отменяем задачу проверки таймаута
                     if user_id in self.active_checks:
@@ -341,7 +357,7 @@ class SessionManager:
                     
                     # Отправляем уведомление
                     try:
-                        await self._check_session_achievements(user_id, db_session, session)
+                        await self._publish_session_ended(user_id, session)
                         await self.notify_session_end(user_id, db_session)
                         logger.info(f"Session {session_id} successfully ended for user {user_id}")
                         return True
@@ -358,16 +374,26 @@ class SessionManager:
             logger.error(f"Unexpected error in end_session: {e}")
             return False
 
-    async def add_message_to_history(self, user_id: int, message: str, is_user: bool, tokens_used: int):
-        """Добавляет сообщение и примерное количество токенов в историю сессии"""
+    async def add_message_to_history(
+        self,
+        user_id: int,
+        message: str,
+        is_user: bool,
+        tokens_used: int,
+        decision: Optional[str] = None
+    ):
+        """Добавляет реплику (с решением персонажа и примерным количеством токенов) в историю сессии"""
         async with self.lock:
             if user_id not in self.message_history or self.session_ended.get(user_id, False):
                 return
 
-            if is_user:
-                self.message_history[user_id]['user_messages'].append(message)
-            else:
-                self.message_history[user_id]['bot_messages'].append(message)
+            self.transcript_writer.append(
+                self.message_history[user_id]['session_id'],
+                "user" if is_user else "bot",
+                message,
+                decision=decision,
+                tokens_used=tokens_used
+            )
 
             self.message_history[user_id]['tokens_spent'] = (
                 self.message_history[user_id].get('tokens_spent', 0) + tokens_used
@@ -382,13 +408,14 @@ class SessionManager:
         if self.session_ended.get(user_id, False):
             return False
             
-        stmt = select(Session).where(
+        # Только нужные колонки - запрос выполняется на каждое сообщение и идет по частичному индексу активных сессий
+        stmt = select(Session.id, Session.expires_at).where(
             Session.user_id == user_id,
             Session.is_active == True
         ).order_by(Session.started_at.desc()).limit(1)
         
         result = await db_session.execute(stmt)
-        session = result.scalar_one_or_none()
+        session = result.one_or_none()
         
         if not session:
             return False
@@ -429,94 +456,175 @@ class SessionManager:
         Особенности:
         - Не учитывает бесплатные подписки (TRIAL) при проверке квоты
         - Обновляет квоту при смене тарифа
+        - Тариф берется из кэша, списанные сессии - из счетчика в users (quota_period_start, quota_sessions_used)
+        - Списание квоты и бонуса - один условный UPDATE ... RETURNING: условие проверяет база,
+          поэтому два параллельных старта сессии (двойное нажатие) не спишут больше, чем есть
         """
-        user = await get_user_by_id(db_session, user_id)
+        user = await db_session.get(User, user_id)
         if not user:
             return False, False
 
         # Если тариф TRIAL, сразу используем бонус (если есть)
         if user.active_tariff == TariffType.TRIAL:
-            if user.bonus_balance > 0:
-                user.bonus_balance -= 1
-                await db_session.commit()
-                return True, True
-            return False, False
+            return await self._use_bonus(db_session, user)
 
-        tariff = await db_session.execute(
-            select(Tariff).where(Tariff.name == user.active_tariff)
-        )
-        tariff = tariff.scalar_one_or_none()
-        
+        tariff = await tariff_cache.get(db_session, user.active_tariff)
         if not tariff:
             return False, False
 
-        # Получаем дату активации текущего тарифа
-        last_order = await db_session.execute(
-            select(Order)
+        if user.quota_period_start is None:
+            await self._init_quota_counter(db_session, user, tariff)
+
+        for _ in range(3):
+            period_start = self._current_quota_period(user.quota_period_start, tariff.quota_period_days, datetime.utcnow())
+            if period_start == user.quota_period_start:
+                # Списываем сессию, если в текущем периоде квота не исчерпана
+                stmt = (
+                    update(User)
+                    .where(User.id == user.id)
+                    .where(User.quota_period_start == period_start)
+                    .where(User.quota_sessions_used < tariff.session_quota)
+                    .values(quota_sessions_used=User.quota_sessions_used + 1)
+                )
+            else:
+                # Начался новый период: открываем его первой списанной сессией.
+                # Условие на старое начало периода - период открывает только один из параллельных запросов
+                stmt = (
+                    update(User)
+                    .where(User.id == user.id)
+                    .where(User.quota_period_start == user.quota_period_start)
+                    .values(quota_period_start=period_start, quota_sessions_used=1)
+                )
+            row = (await db_session.execute(
+                stmt.returning(User.quota_period_start, User.quota_sessions_used)
+                .execution_options(synchronize_session=False)
+            )).first()
+            if row:
+                await db_session.commit()
+                self._set_committed(user, quota_period_start=row.quota_period_start, quota_sessions_used=row.quota_sessions_used)
+                return True, False
+            # Квота исчерпана или период сменил параллельный запрос - перечитываем счетчик
+            await db_session.refresh(user, ["quota_period_start", "quota_sessions_used"])
+            if user.quota_period_start == period_start and user.quota_sessions_used >= tariff.session_quota:
+                break
+
+        # Проверяем бонусы
+        return await self._use_bonus(db_session, user)
+
+    async def _use_bonus(self, db_session: AsyncSession, user: User) -> Tuple[bool, bool]:
+        """Списывает бонус одним условным UPDATE. Возвращает (True, True) или (False, False), если бонусов нет"""
+        bonus_balance = (await db_session.execute(
+            update(User)
+            .where(User.id == user.id)
+            .where(User.bonus_balance > 0)
+            .values(bonus_balance=User.bonus_balance - 1)
+            .returning(User.bonus_balance)
+            .execution_options(synchronize_session=False)
+        )).scalar_one_or_none()
+        if bonus_balance is None:
+            return False, False
+        await db_session.commit()
+        self._set_committed(user, bonus_balance=bonus_balance)
+        return True, True
+
+    async def refund_session_quota(self, db_session: AsyncSession, user_id: int, used_bonus: bool):
+        """
+        Возвращает списанную use_session_quota_or_bonus сессию, если start_session не смог ее создать:
+        бонус - обратно на баланс, квоту - уменьшением счетчика текущего периода
+        """
+        await db_session.rollback()
+        if used_bonus:
+            stmt = update(User).where(User.id == user_id).values(bonus_balance=User.bonus_balance + 1)
+        else:
+            stmt = (
+                update(User)
+                .where(User.id == user_id)
+                .where(User.quota_sessions_used > 0)
+                .values(quota_sessions_used=User.quota_sessions_used - 1)
+            )
+        try:
+            await db_session.execute(stmt.execution_options(synchronize_session=False))
+            await db_session.commit()
+            logger.info(f"Session {'bonus' if used_bonus else 'quota'} refunded to user {user_id}")
+        except Exception as e:
+            await db_session.rollback()
+            logger.error(f"Error refunding session {'bonus' if used_bonus else 'quota'} to user {user_id}: {e}")
+
+    @staticmethod
+    def _set_committed(user: User, **values):
+        """Переносит значения из RETURNING в загруженный объект, не помечая его измененным"""
+        for key, value in values.items():
+            set_committed_value(user, key, value)
+
+    @staticmethod
+    def _current_quota_period(period_start: datetime, period_days: int, now: datetime) -> datetime:
+        """Начало текущего периода квоты: периоды по period_days дней подряд от period_start (0 - один период на весь тариф)"""
+        if not period_days or now < period_start:
+            return period_start
+        period = timedelta(days=period_days)
+        return period_start + period * ((now - period_start) // period)
+
+    async def _init_quota_counter(self, db_session: AsyncSession, user: User, tariff: TariffInfo):
+        """
+        Заполняет счетчик квоты пользователю, который купил тариф до появления счетчика:
+        начало периода - дата последнего заказа тарифа, списано - платные сессии с этой даты.
+        Выполняется один раз на пользователя
+        """
+        last_order_at = await db_session.scalar(
+            select(Order.created_at)
             .where(Order.user_id == user.id)
             .where(Order.tariff_id == tariff.id)
             .order_by(Order.created_at.desc())
             .limit(1)
         )
-        last_order = last_order.scalar_one_or_none()
-        
-        quota_start_date = last_order.created_at
-        quota_period_days = getattr(tariff, "quota_period_days", 30)
-
-        # Получаем количество сессий в текущем периоде квоты (исключая бесплатные)
-        sessions_in_period = await db_session.execute(
+        if last_order_at is None:
+            # Тариф выдан без заказа: отсчитываем от начала срока действия
+            last_order_at = (user.tariff_expires - timedelta(days=tariff.duration_days)) if user.tariff_expires else datetime.utcnow()
+        sessions_in_period = await db_session.scalar(
             select(func.count(Session.id))
             .where(Session.user_id == user.id)
-            .where(Session.started_at >= quota_start_date)
+            .where(Session.started_at >= last_order_at)
             .where(Session.is_free == False)  # Исключаем бесплатные сессии
         )
-        sessions_in_period = sessions_in_period.scalar() or 0
-
-        # Проверяем квоту
-        if sessions_in_period < tariff.session_quota:
-            return True, False
-
-        # Проверяем бонусы
-        if user.bonus_balance > 0:
-            user.bonus_balance -= 1
-            await db_session.commit()
-            return True, True
-
-        return False, False
+        user.quota_period_start = last_order_at
+        user.quota_sessions_used = sessions_in_period or 0
+        await db_session.commit()
+        logger.info(f"Quota counter initialized for user {user.id}: {user.quota_sessions_used} used since {last_order_at}")
         
     async def notify_session_end(self, user_id: int, db_session: AsyncSession):
         """Уведомляет пользователя об окончании сессии"""
         telegram_id = await get_telegram_id_by_user_id(db_session, user_id)
         try:
-            await self.bot.send_message(
+            await self.notifier.send(
                 telegram_id,
-                "⌛️ Время сессии истекло. Сессия сохранена."
+                "⌛️ Время сессии истекло. Сессия сохранена.",
+                priority=Priority.SESSION
             )
-            await self.bot.send_message(
+            await self.notifier.send(
                 telegram_id,
                 BACK_TO_MENU_TEXT,
+                priority=Priority.SESSION,
                 reply_markup=main_menu()
             )
             logger.info(f"Session end notification sent to user {user_id}")
         except Exception as e:
             logger.error(f"Error sending session end notification: {e}")
             
-    async def _check_session_achievements(self, user_id: int, db_session: AsyncSession, session: Session):
-        """Проверяет достижения после сессии"""
+    async def _publish_session_ended(self, user_id: int, session: Session):
+        """Публикует событие завершения сессии; ачивки проверяет воркер шины событий"""
         try:
-            if self.achievement_system:
-                session_data = {
-                    'started_at': session.started_at,
-                    'ended_at': session.ended_at,
-                    'resistance_level': session.resistance_level,
-                    'emotional': session.emotional,
-                    'persona_id': session.persona_id,
-                    'is_rnd': session.is_rnd,
-                    'tokens_spent': session.tokens_spent,
-                    'persona_name': session.persona_name
-                }
-                
-                await self.achievement_system.check_session_achievements(user_id, session_data)
-                logger.info(f"Achievements checked for user {user_id} after session {session.id}")
+            await self.event_bus.publish(EventType.SESSION_ENDED, {
+                'user_id': user_id,
+                'session_id': session.id,
+                'started_at': session.started_at,
+                'ended_at': session.ended_at,
+                'resistance_level': session.resistance_level,
+                'emotional': session.emotional,
+                'persona_id': session.persona_id,
+                'is_rnd': session.is_rnd,
+                'tokens_spent': session.tokens_spent,
+                'persona_name': session.persona_name
+            })
+            logger.info(f"[SESSION] Session ended event published | session_id={session.id} | user_id={user_id}")
         except Exception as e:
-            logger.error(f"Error checking achievements: {e}", exc_info=True)
\ No newline at end of file
+            logger.error(f"Error publishing session ended event: {e}", exc_info=True)
\ No newline at end of file
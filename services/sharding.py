@@ -0,0 +1,222 @@
+import asyncio
+import json
+import multiprocessing
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.methods import TelegramMethod
+from aiogram.types import Update
+from redis.asyncio import Redis
+from config import config, logger
+
+
+# --- Шардирование обработки апдейтов ---
+# Фронт (основной процесс) получает апдейты (polling или webhook) и раскладывает их по очередям Redis
+# updates:shard:{n}, где n = chat_id % shards. Каждый воркер - отдельный процесс со своим циклом событий,
+# БД, ботом и диспетчером - читает только свою очередь. Все апдейты одного чата попадают в один воркер,
+# поэтому состояние сессий в памяти процесса (SessionManager, таймеры) остается корректным; FSM - в Redis.
+# Внутри воркера апдейты одного чата обрабатываются строго по очереди, разных чатов - параллельно.
+def shard_of(key: int, shards: int) -> int:
+    return key % shards
+
+
+def shard_queue(shard: int) -> str:
+    return f"{config.SHARD_QUEUE_PREFIX}:{shard}"
+
+
+class ShardRouter(BaseMiddleware):
+    """
+    Outer middleware диспетчера фронта: вместо обработки апдейт ставится в очередь своего шарда.
+    Запись в Redis идет пачками из одной задачи на шард, поэтому порядок апдейтов в очереди
+    совпадает с порядком получения
+    """
+    def __init__(self, redis: Redis, shards: int):
+        self.redis = redis
+        self.shards = shards
+        self.buffers: List[asyncio.Queue] = [asyncio.Queue() for _ in range(shards)]
+        self.tasks: List[asyncio.Task] = []
+
+    def start(self):
+        if not self.tasks:
+            self.tasks = [asyncio.create_task(self._flush(shard)) for shard in range(self.shards)]
+
+    async def stop(self, timeout: float = 10):
+        """Дописывает в Redis все уже полученные апдейты"""
+        try:
+            await asyncio.wait_for(asyncio.gather(*(buffer.join() for buffer in self.buffers)), timeout)
+        except asyncio.TimeoutError:
+            lost = sum(buffer.qsize() for buffer in self.buffers)
+            logger.error(f"[SHARDS] Redis unavailable, {lost} updates were not routed")
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any]
+    ) -> Any:
+        # event_chat / event_from_user заполняет UserContextMiddleware диспетчера.
+        # Для платежей (pre_checkout_query) чата нет - в личке id пользователя совпадает с id чата
+        chat = data.get("event_chat")
+        user = data.get("event_from_user")
+        key = chat.id if chat else user.id if user else event.update_id
+        payload = json.dumps({"key": key, "update": event.model_dump(mode="json", exclude_unset=True)})
+        self.buffers[shard_of(key, self.shards)].put_nowait(payload)
+        # handler не вызывается: апдейт обработает воркер шарда
+
+    async def _flush(self, shard: int):
+        buffer = self.buffers[shard]
+        queue = shard_queue(shard)
+        while True:
+            batch = [await buffer.get()]
+            while not buffer.empty():
+                batch.append(buffer.get_nowait())
+            try:
+                while True:
+                    try:
+                        await self.redis.rpush(queue, *batch)
+                        break
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as e:
+                        logger.error(f"[SHARDS] Failed to route {len(batch)} updates to shard {shard}: {e!r}")
+                        await asyncio.sleep(1)
+            finally:
+                for _ in batch:
+                    buffer.task_done()
+
+
+class ShardWorker:
+    """
+    Читает очередь своего шарда и передает апдейты диспетчеру.
+    Апдейты одного чата обрабатываются последовательно; одновременно в обработке и ожидании
+    не больше concurrency апдейтов, остальные остаются в Redis
+    """
+    def __init__(
+        self,
+        redis: Redis,
+        dp: Dispatcher,
+        bot: Bot,
+        shard: int,
+        concurrency: int = config.UPDATES_CONCURRENCY
+    ):
+        self.redis = redis
+        self.dp = dp
+        self.bot = bot
+        self.shard = shard
+        self.queue = shard_queue(shard)
+        # 0 - без лимита на обработку; очередь в памяти все равно ограничиваем, остальное ждет в Redis
+        self.slots = asyncio.Semaphore(concurrency if concurrency > 0 else 1000)
+        self.chats: Dict[int, Deque[Dict]] = {}
+        self.tasks: Dict[int, asyncio.Task] = {}
+
+    async def run(self, stop: asyncio.Event):
+        logger.info(f"[SHARDS] Worker {self.shard} started | queue={self.queue}")
+        while not stop.is_set():
+            await self.slots.acquire()
+            try:
+                item = await self.redis.blpop(self.queue, timeout=1)
+            except asyncio.CancelledError:
+                self.slots.release()
+                raise
+            except Exception as e:
+                self.slots.release()
+                logger.error(f"[SHARDS] Worker {self.shard} failed to read queue: {e!r}")
+                await asyncio.sleep(1)
+                continue
+            if item is None:
+                self.slots.release()
+                continue
+            try:
+                envelope = json.loads(item[1])
+            except ValueError as e:
+                self.slots.release()
+                logger.error(f"[SHARDS] Worker {self.shard} dropped malformed update: {e!r}")
+                continue
+            self._enqueue(envelope["key"], envelope["update"])
+
+        # Дожидаемся уже взятых из очереди апдейтов
+        if self.tasks:
+            logger.info(f"[SHARDS] Worker {self.shard} waiting for {len(self.tasks)} chats in progress")
+            await asyncio.gather(*self.tasks.values(), return_exceptions=True)
+        logger.info(f"[SHARDS] Worker {self.shard} stopped")
+
+    def _enqueue(self, key: int, update: Dict):
+        self.chats.setdefault(key, deque()).append(update)
+        if key not in self.tasks:
+            self.tasks[key] = asyncio.create_task(self._drain(key))
+
+    async def _drain(self, key: int):
+        pending = self.chats[key]
+        try:
+            while pending:
+                update = pending.popleft()
+                try:
+                    result = await self.dp.feed_raw_update(self.bot, update)
+                    if isinstance(result, TelegramMethod):
+                        await self.dp.silent_call_request(self.bot, result)
+                except Exception as e:
+                    # Как в polling: ошибка хендлера не останавливает обработку следующих апдейтов чата
+                    logger.exception(f"[SHARDS] Worker {self.shard} failed to process update for {key}: {e!r}")
+                finally:
+                    self.slots.release()
+        finally:
+            del self.chats[key]
+            del self.tasks[key]
+
+
+class WorkerPool:
+    """
+    Запускает воркеры шардов отдельными процессами (spawn) и перезапускает упавшие.
+    target(shard, shards) - функция верхнего уровня модуля, выполняется в процессе воркера
+    """
+    def __init__(self, target: Callable[[int, int], None], shards: int, restart_delay: float = 5):
+        self.target = target
+        self.shards = shards
+        self.restart_delay = restart_delay
+        self.context = multiprocessing.get_context("spawn")
+        self.processes: Dict[int, multiprocessing.Process] = {}
+        self.task: Optional[asyncio.Task] = None
+
+    def _spawn(self, shard: int):
+        process = self.context.Process(
+            target=self.target, args=(shard, self.shards), name=f"bot-shard-{shard}", daemon=False
+        )
+        process.start()
+        self.processes[shard] = process
+        logger.info(f"[SHARDS] Started worker {shard} | pid={process.pid}")
+
+    def start(self):
+        for shard in range(self.shards):
+            self._spawn(shard)
+        self.task = asyncio.create_task(self._supervise())
+
+    async def _supervise(self):
+        while True:
+            await asyncio.sleep(self.restart_delay)
+            for shard, process in list(self.processes.items()):
+                if not process.is_alive():
+                    logger.error(f"[SHARDS] Worker {shard} exited with code {process.exitcode}, restarting")
+                    self._spawn(shard)
+
+    async def stop(self, timeout: float = 60):
+        """SIGTERM всем воркерам и ожидание их завершения; не успевшие за timeout завершаются принудительно"""
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        for process in self.processes.values():
+            if process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + timeout
+        for shard, process in self.processes.items():
+            await asyncio.to_thread(process.join, max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.warning(f"[SHARDS] Worker {shard} did not stop in {timeout}s, killing")
+                process.kill()
+                await asyncio.to_thread(process.join)
+        self.processes = {}
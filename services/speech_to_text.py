@@ -1,22 +1,61 @@
-from faster_whisper import WhisperModel
 import os
 import subprocess
+import threading
+from typing import TYPE_CHECKING, Optional, Tuple
 from uuid import uuid4
-from config import logger
+from redis.asyncio import Redis
+from config import config, logger
+
+if TYPE_CHECKING:
+    # faster_whisper (CTranslate2) импортируется секунды - только при загрузке модели, не при старте бота
+    from faster_whisper import WhisperModel
+
+# Версия модели входит в ключ кэша: смена размера модели или типа вычислений инвалидирует старые расшифровки
+WHISPER_MODEL_VERSION = f"{config.WHISPER_MODEL}-{config.WHISPER_COMPUTE_TYPE}"
+
+def load_model(size: str, compute_type: str, cpu_threads: int = 0) -> "WhisperModel":
+    """Загружает модель Whisper для CPU"""
+    from faster_whisper import WhisperModel
+    return WhisperModel(size, compute_type=compute_type, device="cpu", cpu_threads=cpu_threads)
+
+
+_model: Optional["WhisperModel"] = None
+_model_lock = threading.Lock()
+
+
+def get_model() -> "WhisperModel":
+    """Рабочая модель загружается при первом обращении, а не при импорте модуля"""
+    global _model
+    if _model is None:
+        # Предзагрузка при старте идет в потоке - голосовое, пришедшее в это время, ждет ее, а не грузит вторую копию
+        with _model_lock:
+            if _model is None:
+                _model = load_model(config.WHISPER_MODEL, config.WHISPER_COMPUTE_TYPE, config.WHISPER_CPU_THREADS)
+    return _model
+
+
+def convert_to_wav(file_path: str, tmp_dir: str = "./tmp") -> str:
+    """Конвертирует голосовое в WAV 16 кГц моно, возвращает путь к временному файлу"""
+    wav_path = os.path.join(tmp_dir, f"{uuid4().hex}.wav")
+    subprocess.run(
+        ["ffmpeg", "-i", file_path, "-ar", "16000", "-ac", "1", wav_path],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    return wav_path
+
+
+def transcribe_file(whisper_model, wav_path: str) -> Tuple[str, float]:
+    """Распознает WAV файл, возвращает текст и длительность аудио в секундах"""
+    segments, info = whisper_model.transcribe(wav_path, language="ru")
+    text = "".join([segment.text for segment in segments]).strip()
+    return text, info.duration
 
-model = WhisperModel("base", compute_type="int8", device="cpu")
 
 async def transcribe_voice(file_path: str) -> str:
     try:
-        wav_path = f"./tmp/{uuid4().hex}.wav"
-        subprocess.run(
-            ["ffmpeg", "-i", file_path, "-ar", "16000", "-ac", "1", wav_path],
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL
-        )
-
-        segments, _ = model.transcribe(wav_path, language="ru")
-        text = "".join([segment.text for segment in segments]).strip()
+        wav_path = convert_to_wav(file_path)
+        text, _ = transcribe_file(get_model(), wav_path)
 
         os.remove(wav_path)
         return text
@@ -24,3 +63,38 @@ async def transcribe_voice(file_path: str) -> str:
     except Exception as e:
         logger.exception(e)
         return ""
+
+
+class TranscriptionCache:
+    """
+    Кэш результатов распознавания голосовых сообщений в Redis.
+
+    Ключ - file_unique_id из Telegram (стабилен для пересланных и повторно отправленных голосовых)
+    плюс версия модели. При попадании в кэш не нужны ни скачивание файла, ни инференс.
+    """
+    def __init__(self, redis: Redis, ttl: int, model_version: str = WHISPER_MODEL_VERSION):
+        self.redis = redis
+        self.ttl = ttl
+        self.model_version = model_version
+
+    def _key(self, file_unique_id: str) -> str:
+        return f"stt:{self.model_version}:{file_unique_id}"
+
+    async def get(self, file_unique_id: str) -> Optional[str]:
+        """Возвращает сохраненную расшифровку или None, если ее нет"""
+        try:
+            text = await self.redis.get(self._key(file_unique_id))
+        except Exception as e:
+            # Кэш не должен ломать распознавание - при ошибке Redis просто считаем это промахом
+            logger.warning(f"[STT CACHE] Error reading cache for {file_unique_id}: {e}")
+            return None
+        if text is not None:
+            logger.debug(f"[STT CACHE] Hit for {file_unique_id}")
+        return text
+
+    async def set(self, file_unique_id: str, text: str):
+        """Сохраняет расшифровку с TTL"""
+        try:
+            await self.redis.set(self._key(file_unique_id), text, ex=self.ttl)
+        except Exception as e:
+            logger.warning(f"[STT CACHE] Error writing cache for {file_unique_id}: {e}")
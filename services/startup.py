@@ -0,0 +1,107 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from config import logger
+
+
+@dataclass
+class StartupStep:
+    name: str
+    func: Callable[[], Awaitable[Any]]
+    requires: Tuple[str, ...] = ()
+    critical: bool = True  # False - шаг выполняется в фоне, polling его не ждет
+
+
+# --- Запуск бота ---
+# Шаги старта выполняются параллельно, каждый ждет только шаги из requires.
+# run() возвращается, как только готовы критичные шаги (без них бот не может обрабатывать апдейты).
+# Некритичные запускаются после них, чтобы не отнимать у них время, и выполняются в фоне уже во время
+# polling; их ошибки пишутся в лог и не останавливают бота.
+# Время каждого шага и всего холодного старта пишется в лог с тегом [STARTUP].
+class StartupOrchestrator:
+    def __init__(self):
+        self.steps: Dict[str, StartupStep] = {}
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self.timings: Dict[str, float] = {}
+        self.started_at: Optional[float] = None
+
+    def add(
+        self,
+        name: str,
+        func: Callable[[], Awaitable[Any]],
+        requires: Tuple[str, ...] = (),
+        critical: bool = True
+    ):
+        if name in self.steps:
+            raise ValueError(f"Startup step {name} is already registered")
+        unknown = [dep for dep in requires if dep not in self.steps]
+        if unknown:
+            # Зависимости регистрируются раньше зависящих от них шагов - так циклы невозможны
+            raise ValueError(f"Startup step {name} requires unknown steps: {unknown}")
+        if critical and any(not self.steps[dep].critical for dep in requires):
+            raise ValueError(f"Critical startup step {name} can't wait for a deferred step")
+        self.steps[name] = StartupStep(name, func, tuple(requires), critical)
+
+    async def _run_step(self, step: StartupStep) -> Any:
+        for dep in step.requires:
+            try:
+                await self.tasks[dep]
+            except Exception:
+                logger.warning(f"[STARTUP] {step.name} skipped: {dep} failed")
+                raise RuntimeError(f"{step.name} skipped, {dep} failed")
+        started = time.perf_counter()
+        try:
+            result = await step.func()
+        except Exception as e:
+            log = logger.error if step.critical else logger.warning
+            log(f"[STARTUP] {step.name} failed after {time.perf_counter() - started:.2f}s: {e!r}")
+            raise
+        self.timings[step.name] = time.perf_counter() - started
+        logger.info(f"[STARTUP] {step.name} ready in {self.timings[step.name]:.2f}s")
+        return result
+
+    def _start(self, step: StartupStep) -> asyncio.Task:
+        self.tasks[step.name] = asyncio.create_task(self._run_step(step), name=f"startup:{step.name}")
+        return self.tasks[step.name]
+
+    def result(self, name: str) -> Any:
+        """Результат завершенного шага"""
+        return self.tasks[name].result()
+
+    async def run(self):
+        """Запускает все шаги и ждет критичные. Ошибка критичного шага пробрасывается"""
+        self.started_at = time.perf_counter()
+        critical = [self._start(step) for step in self.steps.values() if step.critical]
+        try:
+            await asyncio.gather(*critical)
+        except Exception:
+            await self.cancel()
+            raise
+        logger.info(
+            f"[STARTUP] Critical steps ready in {time.perf_counter() - self.started_at:.2f}s | "
+            f"{self._format_timings(step for step in self.steps.values() if step.critical)}"
+        )
+        deferred = [self._start(step) for step in self.steps.values() if not step.critical]
+        if deferred:
+            asyncio.create_task(self._report_deferred(deferred))
+
+    async def _report_deferred(self, deferred: List[asyncio.Task]):
+        await asyncio.gather(*deferred, return_exceptions=True)
+        logger.info(
+            f"[STARTUP] Deferred steps finished in {time.perf_counter() - self.started_at:.2f}s | "
+            f"{self._format_timings(step for step in self.steps.values() if not step.critical)}"
+        )
+
+    def _format_timings(self, steps) -> str:
+        return ", ".join(
+            f"{step.name}={self.timings[step.name]:.2f}s" if step.name in self.timings else f"{step.name}=failed"
+            for step in steps
+        )
+
+    async def cancel(self):
+        """Отменяет незавершенные шаги (остановка бота во время старта)"""
+        pending = [task for task in self.tasks.values() if not task.done()]
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
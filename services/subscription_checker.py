@@ -1,93 +1,135 @@
 import asyncio
 from datetime import datetime, timedelta
-from sqlalchemy import select, and_
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
-from aiogram import Bot
-from config import logger
-from database.models import User, Tariff, TariffType
+from typing import List, Tuple
+from sqlalchemy import literal, select, update
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from config import config, logger
+from database.models import User, TariffType
+from services.notifier import NotificationDispatcher, Priority
 from texts.subscription_texts import (
     SUBSCRIPTION_EXPIRED_TEXT,
     SUBSCRIPTION_WILL_EXPIRE_SOON_TEXT
 )
 
-async def check_subscriptions_expiry(bot: Bot, db_session_factory: async_sessionmaker):
+# Условие частичного индекса ix_users_tariff_expires_paid. TRIAL подставляется литералом, а не параметром:
+# иначе планировщик (в том числе для подготовленных запросов asyncpg) не сопоставит запрос с условием индекса
+PAID_TARIFF = User.active_tariff != literal(TariffType.TRIAL, User.active_tariff.type, literal_execute=True)
+
+async def check_subscriptions_expiry(notifier: NotificationDispatcher, db_session_factory: async_sessionmaker):
     """
-    Улучшенная фоновая задача для проверки подписок:
-    - Проверяет истёкшие подписки
+    Фоновая задача проверки подписок (раз в SUBSCRIPTION_CHECK_INTERVAL секунд):
+    - Переводит истёкшие подписки на бесплатный тариф
     - Отправляет предупреждения о скором истечении
-    - Обрабатывает переход на бесплатный тариф
+
+    Оба запроса идут по частичному индексу ix_users_tariff_expires_paid (только платные тарифы),
+    поэтому стоимость проверки зависит от числа пользователей со сроком в окне, а не от размера users.
+    Пользователи обновляются пакетами одним UPDATE ... RETURNING, сообщения ставятся в очередь диспетчера после коммита.
+    Пакет выбирается с FOR UPDATE SKIP LOCKED, а условия повторяются во внешнем UPDATE: при нескольких
+    параллельных проверках каждый пользователь попадает только в одну из них.
     """
     while True:
         try:
-            async with db_session_factory() as session:
-                # 1. Проверка истёкших подписок
-                expired_users = await session.execute(
-                    select(User)
-                    .where(User.active_tariff != TariffType.TRIAL)
-                    .where(User.tariff_expires < datetime.utcnow())
-                )
-                
-                for user in expired_users.scalars():
-                    await handle_expired_subscription(bot, session, user)
-                
-                # 2. Проверка подписок, которые скоро истекают (за 1-3 дня)
-                soon_expire_users = await session.execute(
-                    select(User)
-                    .where(User.active_tariff != TariffType.TRIAL)
-                    .where(
-                        and_(
-                            User.tariff_expires > datetime.utcnow(),
-                            User.tariff_expires <= datetime.utcnow() + timedelta(days=3),
-                            User.subscription_warning_sent == False  # Отправляем только одно уведомление
-                        )
-                    )
-                )
-                
-                for user in soon_expire_users.scalars():
-                    await handle_soon_expire_subscription(bot, session, user)
-                
-                await session.commit()
-                
+            expired = await expire_subscriptions(db_session_factory)
+            for telegram_id in expired:
+                notify_expired_subscription(notifier, telegram_id)
+
+            soon_expire = await mark_expiry_warnings(db_session_factory)
+            for telegram_id, tariff_expires in soon_expire:
+                notify_soon_expire_subscription(notifier, telegram_id, tariff_expires)
+
+            if expired or soon_expire:
+                logger.info(f"[SUBSCRIPTION] Expired: {len(expired)}, warned: {len(soon_expire)}")
         except Exception as e:
             logger.error(f"[SUBSCRIPTION] Error in subscription check: {e}")
-            await asyncio.sleep(60)  # Короткая пауза при ошибке
-        else:
-            await asyncio.sleep(3600)  # Обычная пауза - 1 час
+        await asyncio.sleep(config.SUBSCRIPTION_CHECK_INTERVAL)
 
-async def handle_expired_subscription(bot: Bot, session: AsyncSession, user: User):
-    """Обработка истёкшей подписки"""
-    logger.info(f"[SUBSCRIPTION] Subscription expired for user {user.telegram_id}")
-    
-    # Получаем бесплатный тариф
-    free_tariff = await session.execute(
-        select(Tariff).where(Tariff.name == TariffType.TRIAL)
-    )
-    free_tariff = free_tariff.scalar_one()
-    
-    # Обновляем пользователя
-    user.active_tariff = TariffType.TRIAL
-    user.tariff_expires = None
-    user.subscription_warning_sent = False  # Сбрасываем флаг предупреждения
-    
-    try:
-        await bot.send_message(
-            user.telegram_id,
-            SUBSCRIPTION_EXPIRED_TEXT
+async def expire_subscriptions(
+    db_session_factory: async_sessionmaker,
+    batch_size: int = config.SUBSCRIPTION_BATCH_SIZE
+) -> List[int]:
+    """Переводит истёкшие подписки на TRIAL пакетами. Возвращает telegram_id переведённых пользователей"""
+    telegram_ids = []
+    while True:
+        now = datetime.utcnow()
+        due = (
+            select(User.id)
+            .where(PAID_TARIFF)
+            .where(User.tariff_expires < now)
+            .order_by(User.tariff_expires)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
         )
-        logger.info(f"[SUBSCRIPTION] Notification sent to user {user.telegram_id}")
-    except Exception as e:
-        logger.error(f"[SUBSCRIPTION] Error sending expiry message to {user.telegram_id}: {e}")
+        async with db_session_factory() as session:
+            rows = (await session.execute(
+                update(User)
+                .where(User.id.in_(due.scalar_subquery()))
+                # Условия повторяются: после ожидания блокировки PostgreSQL перепроверяет только внешний WHERE
+                .where(PAID_TARIFF)
+                .where(User.tariff_expires < now)
+                .values(
+                    active_tariff=TariffType.TRIAL,
+                    tariff_expires=None,
+                    subscription_warning_sent=False,  # Сбрасываем флаг предупреждения
+                    quota_period_start=None,
+                    quota_sessions_used=0
+                )
+                .returning(User.telegram_id)
+                .execution_options(synchronize_session=False)
+            )).scalars().all()
+            await session.commit()
 
-async def handle_soon_expire_subscription(bot: Bot, session: AsyncSession, user: User):
-    """Обработка подписки, которая скоро истекает"""
-    days_left = (user.tariff_expires - datetime.utcnow()).days
-    
-    try:
-        await bot.send_message(
-            user.telegram_id,
-            SUBSCRIPTION_WILL_EXPIRE_SOON_TEXT.format(days_left=days_left)
+        telegram_ids.extend(rows)
+        if len(rows) < batch_size:
+            return telegram_ids
+
+async def mark_expiry_warnings(
+    db_session_factory: async_sessionmaker,
+    batch_size: int = config.SUBSCRIPTION_BATCH_SIZE
+) -> List[Tuple[int, datetime]]:
+    """
+    Помечает подписки, истекающие в ближайшие 3 дня, как предупреждённые.
+    Возвращает (telegram_id, tariff_expires) для отправки - предупреждение уходит не больше одного раза
+    """
+    result = []
+    while True:
+        now = datetime.utcnow()
+        due = (
+            select(User.id)
+            .where(PAID_TARIFF)
+            .where(User.tariff_expires > now)
+            .where(User.tariff_expires <= now + timedelta(days=3))
+            .where(User.subscription_warning_sent == False)
+            .order_by(User.tariff_expires)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
         )
-        user.subscription_warning_sent = True  # Помечаем, что уведомление отправлено
-        logger.info(f"[SUBSCRIPTION] Warning sent to user {user.telegram_id} ({days_left} days left)")
-    except Exception as e:
-        logger.error(f"[SUBSCRIPTION] Error sending warning to {user.telegram_id}: {e}")
\ No newline at end of file
+        async with db_session_factory() as session:
+            rows = (await session.execute(
+                update(User)
+                .where(User.id.in_(due.scalar_subquery()))
+                # Повторная проверка флага: параллельная проверка могла пометить ту же строку раньше
+                .where(User.subscription_warning_sent == False)
+                .values(subscription_warning_sent=True)
+                .returning(User.telegram_id, User.tariff_expires)
+                .execution_options(synchronize_session=False)
+            )).all()
+            await session.commit()
+
+        result.extend((row.telegram_id, row.tariff_expires) for row in rows)
+        if len(rows) < batch_size:
+            return result
+
+def notify_expired_subscription(notifier: NotificationDispatcher, telegram_id: int):
+    """Уведомление об истёкшей подписке (массовая рассылка, низкий приоритет)"""
+    logger.info(f"[SUBSCRIPTION] Subscription expired for user {telegram_id}")
+    notifier.send_nowait(telegram_id, SUBSCRIPTION_EXPIRED_TEXT, priority=Priority.BULK)
+
+def notify_soon_expire_subscription(notifier: NotificationDispatcher, telegram_id: int, tariff_expires: datetime):
+    """Предупреждение о подписке, которая скоро истекает"""
+    days_left = (tariff_expires - datetime.utcnow()).days
+    logger.info(f"[SUBSCRIPTION] Warning queued for user {telegram_id} ({days_left} days left)")
+    notifier.send_nowait(
+        telegram_id,
+        SUBSCRIPTION_WILL_EXPIRE_SOON_TEXT.format(days_left=days_left),
+        priority=Priority.BULK
+    )
@@ -0,0 +1,106 @@
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import event, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database.models import Tariff, TariffType
+from config import config, logger
+
+
+# Тарифы, которые продаются в меню
+PAID_TARIFFS = [TariffType.START, TariffType.PRO, TariffType.UNLIMITED]
+
+
+@dataclass(frozen=True)
+class TariffInfo:
+    """Снимок строки tariffs: не привязан к сессии БД, безопасно хранить между запросами"""
+    id: int
+    name: TariffType
+    display_name: str
+    price: int
+    duration_days: int
+    session_quota: int
+    quota_period_days: int
+    description: Optional[str]
+    is_active: bool
+
+    @classmethod
+    def from_model(cls, tariff: Tariff) -> "TariffInfo":
+        return cls(
+            id=tariff.id,
+            name=tariff.name,
+            display_name=tariff.display_name,
+            price=tariff.price,
+            duration_days=tariff.duration_days,
+            session_quota=tariff.session_quota,
+            quota_period_days=tariff.quota_period_days or 0,
+            description=tariff.description,
+            is_active=bool(tariff.is_active),
+        )
+
+
+# --- Кэш тарифов ---
+# Тарифов единицы и меняются они редко, а читаются на каждом старте сессии и в каждом меню тарифов.
+# Кэш сбрасывается сразу при изменении Tariff через ORM в этом процессе (события маппера).
+# Изменения из других процессов (админка, ручные правки) подхватываются после TARIFF_CACHE_TTL секунд:
+# тогда сверяется версия таблицы (count + max(created_at/updated_at)) и тарифы перечитываются, только если она изменилась.
+class TariffCache:
+    def __init__(self, ttl: float = config.TARIFF_CACHE_TTL):
+        self.ttl = ttl
+        self.by_name: Dict[TariffType, TariffInfo] = {}
+        self.version: Optional[Tuple] = None
+        self.checked_at = 0.0
+        self.loaded = False
+
+    def invalidate(self):
+        self.loaded = False
+
+    @staticmethod
+    async def _version(db_session: AsyncSession) -> Tuple:
+        row = (await db_session.execute(
+            select(
+                func.count(Tariff.id),
+                func.max(Tariff.created_at),
+                func.max(Tariff.updated_at)
+            )
+        )).one()
+        return tuple(row)
+
+    async def _ensure(self, db_session: AsyncSession):
+        now = time.monotonic()
+        if self.loaded and now - self.checked_at < self.ttl:
+            return
+        version = await self._version(db_session)
+        if not self.loaded or version != self.version:
+            tariffs = (await db_session.execute(select(Tariff))).scalars().all()
+            self.by_name = {tariff.name: TariffInfo.from_model(tariff) for tariff in tariffs}
+            self.version = version
+            self.loaded = True
+            logger.debug(f"[TARIFFS] Loaded {len(self.by_name)} tariffs into cache")
+        self.checked_at = now
+
+    async def get(self, db_session: AsyncSession, name: TariffType) -> Optional[TariffInfo]:
+        """Тариф по имени (в том числе неактивный)"""
+        await self._ensure(db_session)
+        return self.by_name.get(name)
+
+    async def get_active(self, db_session: AsyncSession, names: Optional[List[TariffType]] = None) -> List[TariffInfo]:
+        """Активные тарифы по возрастанию цены, при names - только перечисленные"""
+        await self._ensure(db_session)
+        return sorted(
+            (
+                tariff for tariff in self.by_name.values()
+                if tariff.is_active and (names is None or tariff.name in names)
+            ),
+            key=lambda tariff: tariff.price
+        )
+
+
+tariff_cache = TariffCache()
+
+
+@event.listens_for(Tariff, "after_insert")
+@event.listens_for(Tariff, "after_update")
+@event.listens_for(Tariff, "after_delete")
+def _invalidate_tariff_cache(mapper, connection, target):
+    tariff_cache.invalidate()
@@ -0,0 +1,153 @@
+import asyncio
+import datetime
+from collections import defaultdict
+from typing import Dict, List, Optional
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from database.models import SessionMessage
+from config import config, logger
+
+
+# --- Запись переписки сессий ---
+# Реплики копятся в памяти и пишутся в session_messages одной вставкой раз в flush_interval секунд
+# (или сразу, когда буфер достиг batch_size). Порядковый номер присваивается при добавлении,
+# поэтому порядок реплик не зависит от того, в каком пакете они попали в базу.
+# Пакет, отвергнутый из-за отдельных строк (сессия удалена, дубль seq), пишется по одной строке без них;
+# при других ошибках пакет возвращается в буфер, но не больше max_retries раз подряд.
+class TranscriptWriter:
+    def __init__(
+        self,
+        sessionmaker: async_sessionmaker,
+        flush_interval: float = config.TRANSCRIPT_FLUSH_INTERVAL,
+        batch_size: int = config.TRANSCRIPT_BATCH_SIZE,
+        max_retries: int = config.TRANSCRIPT_MAX_RETRIES
+    ):
+        self.sessionmaker = sessionmaker
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.failures = 0  # Неудачных сбросов подряд
+        self.buffer: List[Dict] = []
+        self.seq: Dict[int, int] = defaultdict(int)  # Следующий номер реплики для каждой сессии
+        self.flush_lock = asyncio.Lock()
+        self.full = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.stopping = False
+
+    def start(self):
+        """Запускает фоновый сброс буфера"""
+        if self.task is None or self.task.done():
+            self.stopping = False
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Останавливает фоновую задачу и записывает остаток буфера"""
+        # Не отменяем задачу: отмена посреди вставки оборвала бы запись пакета
+        self.stopping = True
+        self.full.set()
+        if self.task:
+            await self.task
+            self.task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"[TRANSCRIPT] Final flush failed, {len(self.buffer)} messages not written: {e!r}")
+
+    def append(
+        self,
+        session_id: int,
+        role: str,
+        content: str,
+        decision: Optional[str] = None,
+        tokens_used: int = 0
+    ):
+        """Ставит реплику в очередь на запись. Не обращается к базе"""
+        self.buffer.append({
+            "session_id": session_id,
+            "seq": self.seq[session_id],
+            "role": role,
+            "content": content,
+            "decision": decision,
+            "tokens_used": tokens_used,
+            "created_at": datetime.datetime.utcnow(),
+        })
+        self.seq[session_id] += 1
+        if len(self.buffer) >= self.batch_size:
+            self.full.set()
+
+    def forget(self, session_id: int):
+        """Сбрасывает счетчик реплик завершенной сессии"""
+        self.seq.pop(session_id, None)
+
+    async def flush(self):
+        """Записывает все накопленные реплики одной вставкой"""
+        async with self.flush_lock:
+            if not self.buffer:
+                return
+            batch, self.buffer = self.buffer, []
+            self.full.clear()
+            # _insert_rows удаляет строки из batch, поэтому размер запоминаем заранее
+            total, dropped = len(batch), 0
+            try:
+                try:
+                    async with self.sessionmaker() as db_session:
+                        await db_session.execute(insert(SessionMessage), batch)
+                        await db_session.commit()
+                except IntegrityError as e:
+                    logger.warning(f"[TRANSCRIPT] Batch of {total} messages rejected, writing row by row: {e.orig!r}")
+                    dropped = await self._insert_rows(batch)
+                self.failures = 0
+                if dropped:
+                    logger.warning(f"[TRANSCRIPT] Flushed {total - dropped} messages, dropped {dropped}")
+                else:
+                    logger.debug(f"[TRANSCRIPT] Flushed {total} messages")
+            except asyncio.CancelledError:
+                self.buffer = batch + self.buffer
+                raise
+            except Exception as e:
+                self.failures += 1
+                if self.failures >= self.max_retries:
+                    logger.error(
+                        f"[TRANSCRIPT] Dropped {len(batch)} messages after {self.failures} failed flushes: {e!r}"
+                    )
+                    self.failures = 0
+                else:
+                    # Возвращаем пакет в начало буфера, запишем при следующем сбросе
+                    logger.error(f"[TRANSCRIPT] Error flushing {len(batch)} messages: {e!r}")
+                    self.buffer = batch + self.buffer
+                raise
+
+    async def _insert_rows(self, batch: List[Dict]) -> int:
+        """
+        Пишет строки по одной и отбрасывает нарушающие ограничения. Обработанные строки удаляются из batch.
+        Возвращает число отброшенных строк
+        """
+        dropped = 0
+        async with self.sessionmaker() as db_session:
+            while batch:
+                row = batch[0]
+                try:
+                    await db_session.execute(insert(SessionMessage), [row])
+                    await db_session.commit()
+                except IntegrityError as e:
+                    await db_session.rollback()
+                    logger.error(
+                        f"[TRANSCRIPT] Dropped message session_id={row['session_id']} seq={row['seq']}: {e.orig!r}"
+                    )
+                    dropped += 1
+                del batch[0]
+        return dropped
+
+    async def _run(self):
+        while not self.stopping:
+            try:
+                await asyncio.wait_for(self.full.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            if self.stopping:
+                return
+            try:
+                await self.flush()
+            except Exception:
+                await asyncio.sleep(self.flush_interval)
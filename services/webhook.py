@@ -0,0 +1,115 @@
+import asyncio
+import hashlib
+import signal
+from typing import Any, Dict, Optional
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from config import config, logger
+
+
+def webhook_secret() -> str:
+    """
+    Секрет заголовка X-Telegram-Bot-Api-Secret-Token. Если WEBHOOK_SECRET не задан,
+    выводится из токена бота: секрет не меняется между перезапусками без отдельной настройки
+    """
+    if config.WEBHOOK_SECRET:
+        return config.WEBHOOK_SECRET
+    return hashlib.sha256(f"webhook:{config.BOT_TOKEN}".encode()).hexdigest()
+
+
+class LimitedRequestHandler(SimpleRequestHandler):
+    """
+    Обработчик вебхука: проверяет секрет, сразу отвечает Telegram 200 и обрабатывает апдейт в фоне.
+    Одновременно обрабатывается не больше concurrency апдейтов (как tasks_concurrency_limit у polling),
+    остальные ждут своей очереди в памяти. При остановке сервера дожидается апдейтов в обработке
+    """
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, secret_token: str, concurrency: int):
+        super().__init__(dispatcher=dispatcher, bot=bot, handle_in_background=True, secret_token=secret_token)
+        self.semaphore = asyncio.Semaphore(concurrency) if concurrency > 0 else None
+
+    async def _background_feed_update(self, bot: Bot, update: Dict[str, Any]) -> None:
+        if self.semaphore is None:
+            return await super()._background_feed_update(bot, update)
+        async with self.semaphore:
+            await super()._background_feed_update(bot, update)
+
+    async def close(self, timeout: float = 30):
+        pending = list(self._background_feed_update_tasks)
+        if pending:
+            logger.info(f"[WEBHOOK] Waiting for {len(pending)} updates in progress")
+            _, not_done = await asyncio.wait(pending, timeout=timeout)
+            for task in not_done:
+                task.cancel()
+        await super().close()
+
+
+async def _health(request: web.Request) -> web.Response:
+    return web.Response(text="ok")
+
+
+def build_app(dp: Dispatcher, bot: Bot) -> web.Application:
+    """aiohttp приложение: POST WEBHOOK_PATH - апдейты, GET /health - проверка для прокси и оркестратора"""
+    app = web.Application()
+    LimitedRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=webhook_secret(),
+        concurrency=config.UPDATES_CONCURRENCY
+    ).register(app, path=config.WEBHOOK_PATH)
+    app.router.add_get("/health", _health)
+    # dp.startup / dp.shutdown вызываются при старте и остановке приложения, как в start_polling
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot, stop: Optional[asyncio.Event] = None):
+    """
+    Запускает сервер на WEBAPP_HOST:WEBAPP_PORT и, если задан WEBHOOK_BASE_URL, регистрирует вебхук.
+    Работает до SIGINT/SIGTERM (или stop); зарегистрированный при старте вебхук при остановке удаляется,
+    апдейты без удаления (drop_pending_updates=False) ждут в Telegram следующего запуска.
+
+    Вебхук обслуживает ровно один экземпляр бота: состояние сессий (SessionManager: история, таймеры)
+    хранится в памяти процесса, а Telegram не закрепляет чат за одним адресом. Для масштабирования -
+    BOT_WORKERS > 1: этот процесс становится фронтом и раскладывает апдейты по шардам (services/sharding.py)
+    """
+    stop = stop or asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows / не главный поток: остановка через KeyboardInterrupt
+
+    runner = web.AppRunner(build_app(dp, bot), access_log=None)
+    await runner.setup()
+    try:
+        site = web.TCPSite(runner, config.WEBAPP_HOST, config.WEBAPP_PORT)
+        await site.start()
+        logger.info(f"[WEBHOOK] Listening on {config.WEBAPP_HOST}:{config.WEBAPP_PORT}{config.WEBHOOK_PATH}")
+        # Регистрируем вебхук только когда сервер уже принимает запросы
+        if config.WEBHOOK_BASE_URL:
+            url = config.WEBHOOK_BASE_URL.rstrip("/") + config.WEBHOOK_PATH
+            await bot.set_webhook(
+                url,
+                secret_token=webhook_secret(),
+                max_connections=config.WEBHOOK_MAX_CONNECTIONS,
+                allowed_updates=dp.resolve_used_update_types(),
+                drop_pending_updates=False
+            )
+            logger.info(f"[WEBHOOK] Webhook set to {url}")
+        await stop.wait()
+        if config.WEBHOOK_BASE_URL:
+            try:
+                await bot.delete_webhook(drop_pending_updates=False)
+                logger.info("[WEBHOOK] Webhook deleted")
+            except Exception as e:
+                logger.error(f"[WEBHOOK] Failed to delete webhook: {e!r}")
+    finally:
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.remove_signal_handler(sig)
+            except (NotImplementedError, RuntimeError):
+                pass
+        logger.info("[WEBHOOK] Stopping server")
+        await runner.cleanup()
@@ -1,8 +1,7 @@
 from typing import Dict
 from config import config
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from database.models import Tariff
+from services.tariff_cache import tariff_cache, TariffInfo
 
 SUBSCRIPTION_EXPIRED_TEXT = (
     "🔔 Ваша подписка истекла.\n\n"
@@ -16,11 +15,8 @@ SUBSCRIPTION_WILL_EXPIRE_SOON_TEXT = (
 
 async def get_tariff_menu_text(db_session: AsyncSession) -> str:
     """Генерирует текст меню тарифов на основе данных из БД"""
-    # Получаем все активные тарифы из БД
-    result = await db_session.execute(
-        select(Tariff).where(Tariff.is_active == True).order_by(Tariff.price)
-    )
-    tariffs = result.scalars().all()
+    # Активные тарифы из кэша (БД читается только при его устаревании)
+    tariffs = await tariff_cache.get_active(db_session)
     
     if not tariffs:
         return "❌ На данный момент нет доступных тарифов"
@@ -75,7 +71,7 @@ ________________________________________
 # Общие текстовые шаблоны
 UNKNOWN_TARIFF = "❌ Неизвестный тариф"
 
-async def get_tariff_success_text(tariff: Tariff) -> str:
+async def get_tariff_success_text(tariff: TariffInfo) -> str:
     """Генерирует текст об успешной активации тарифа"""
     return (
         f"✅ Подписка «{tariff.display_name}» успешно активирована на {tariff.duration_days} дней.\n"
@@ -91,10 +87,9 @@ SUBSCRIPTION_EXPIRED_TEXT = (
     "Чтобы продолжить пользоваться сервисом — выберите тариф в меню."
 )
 
-async def get_tariff_map(db_session: AsyncSession) -> Dict[str, Tariff]:
+async def get_tariff_map(db_session: AsyncSession) -> Dict[str, TariffInfo]:
     """Возвращает словарь тарифов для обработки callback-ов"""
-    result = await db_session.execute(select(Tariff).where(Tariff.is_active == True))
-    tariffs = result.scalars().all()
+    tariffs = await tariff_cache.get_active(db_session)
     
     return {
         f"activate_{tariff.name}": tariff